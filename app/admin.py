@@ -1,20 +1,27 @@
 import os
-import json
+import html
+import asyncio
 import base64
+import marshal
 from pathlib import Path
 from datetime import datetime
 from aiohttp import web
-from pypdf import PdfReader
+
+from .ingest import IngestManager
+from .profiling import PROFILE_MAX_SECONDS, PROFILE_SORT_KEYS, cpu_profile, profile_report, task_dump
+from .store import STORE
 
 # Paths
 ROOT = Path(__file__).resolve().parent.parent
 DATA_DIR = ROOT / "data"
 UPLOADS_DIR = ROOT / "product_data" / "uploads"
-STORE_PATH = DATA_DIR / "admin_store.json"
 
 DATA_DIR.mkdir(exist_ok=True, parents=True)
 UPLOADS_DIR.mkdir(exist_ok=True, parents=True)
 
+# Uploads are written to disk in chunks of this size instead of being buffered whole.
+UPLOAD_CHUNK_BYTES = 256 * 1024
+
 # --- Auth (HTTP Basic) ---
 ADMIN_USER = os.getenv("ADMIN_USERNAME", "admin")
 ADMIN_PASS = os.getenv("ADMIN_PASSWORD", "")  # must be set
@@ -43,28 +50,6 @@ def require_basic_auth(handler):
         return await handler(request)
     return wrapper
 
-# --- Store helpers ---
-DEFAULT_STORE = {
-    "bot_name": "Jatri Bookseller Bot",
-    "ai_persona": "You are a helpful, friendly sales assistant for our bookstore campaign. Speak concisely and persuasively.",
-    "catalog_file": "product_data/jatri_books_info.md",
-    "TELEGRAM_TOKEN": "",
-    "GEMINI_API_KEY": "",
-    "PUBLIC_BASE_URL": "",
-    "MODE": "webhook",  # or "polling"
-}
-
-def load_store():
-    if STORE_PATH.exists():
-        try:
-            return json.loads(STORE_PATH.read_text(encoding="utf-8"))
-        except Exception:
-            pass
-    return DEFAULT_STORE.copy()
-
-def save_store(d: dict):
-    STORE_PATH.write_text(json.dumps(d, indent=2), encoding="utf-8")
-
 # --- HTML ---
 def _html_page(body: str) -> str:
     return f"""<!doctype html>
@@ -91,7 +76,25 @@ a {{ color:#93c5fd; }}
 {body}
 </body></html>"""
 
-def admin_home_form(store: dict, allow_secrets: bool) -> str:
+def _jobs_card(jobs: list) -> str:
+    if not jobs:
+        return ""
+    rows = "".join(
+        f"<li><a href=\"/admin/jobs/{j.id}\">{html.escape(j.filename)}</a> — {j.status}"
+        f" ({j.pages_done}/{j.pages_total or '?'} pages)"
+        + (f" <small>{html.escape(j.error)}</small>" if j.error else "")
+        + "</li>"
+        for j in jobs
+    )
+    return f"""
+    <div class="card">
+      <h2>Knowledge Base Jobs</h2>
+      <ul>{rows}</ul>
+      <p><small>PDFs are converted in the background; the new catalog goes live when its job is done.</small></p>
+    </div>
+    """
+
+def admin_home_form(store: dict, allow_secrets: bool, jobs: list = ()) -> str:
     current_catalog = store.get("catalog_file") or "product_data/jatri_books_info.md"
 
     secrets_block = ""
@@ -128,7 +131,7 @@ def admin_home_form(store: dict, allow_secrets: bool) -> str:
       <h2>Upload Knowledge Base</h2>
       <label>Upload .md or .pdf</label>
       <input type="file" name="file" accept=".md,.pdf" />
-      <p style="margin-top:.5rem"><small>Uploads are stored in <code>product_data/uploads/</code>. PDFs are converted to Markdown text and activated.</small></p>
+      <p style="margin-top:.5rem"><small>Uploads are stored in <code>product_data/uploads/</code>. PDFs are converted to Markdown text in the background and activated when done.</small></p>
     </div>
     <div class="sticky-footer">
       <button type="submit">Save All</button>
@@ -141,7 +144,11 @@ def admin_home_form(store: dict, allow_secrets: bool) -> str:
       <p><small>Your webhook URL is <code>{PUBLIC_BASE_URL}</code> (or Render’s <code>RENDER_EXTERNAL_URL</code>) + <code>/{TELEGRAM_TOKEN}</code>.</small></p>
       <p><a href="/">Health Check</a></p>
     </div>
-    """
+    <div class="card">
+      <h2>Diagnostics</h2>
+      <p><a href="/admin/profile">Event-loop stalls</a> · <a href="/admin/profile/tasks">Task &amp; thread dump</a> · <a href="/admin/profile/cpu?seconds=10">CPU profile (10 s)</a></p>
+    </div>
+    """ + _jobs_card(list(jobs))
 
     # ONE BIG FORM
     return _html_page(f"""
@@ -154,66 +161,131 @@ def admin_home_form(store: dict, allow_secrets: bool) -> str:
     """)
 
 # --- Routes ---
+async def _activate_catalog(catalog_file: str):
+    await STORE.update(lambda store: store.__setitem__("catalog_file", catalog_file))
+
 @require_basic_auth
 async def admin_home(request: web.Request):
-    store = load_store()
+    store = STORE.get()
     allow_secrets = os.getenv("ADMIN_ALLOW_SET_SECRETS", "false").lower() == "true"
-    return web.Response(text=admin_home_form(store, allow_secrets), content_type="text/html")
+    jobs = request.app["ingest"].recent()
+    return web.Response(text=admin_home_form(store, allow_secrets, jobs), content_type="text/html")
+
+async def _save_upload(part, save_path: Path):
+    # Disk writes (and open/close) run in a thread so a slow disk doesn't stall the event loop
+    f = await asyncio.to_thread(open, save_path, "wb")
+    try:
+        while True:
+            chunk = await part.read_chunk(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
 
 @require_basic_auth
 async def admin_save(request: web.Request):
-    store = load_store()
     allow_secrets = os.getenv("ADMIN_ALLOW_SET_SECRETS", "false").lower() == "true"
 
-    # ONE POST handles fields + optional file upload
-    data = await request.post()
+    # ONE POST handles fields + optional file upload; the file is streamed to disk as it arrives
+    data = {}
+    upload = None
+    reader = await request.multipart()
+    async for part in reader:
+        if part.filename:
+            filename = Path(part.filename).name
+            lower = filename.lower()
+            if not (lower.endswith(".md") or lower.endswith(".pdf")):
+                return web.Response(text="Only .md or .pdf supported", status=400)
+            ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+            save_path = UPLOADS_DIR / f"{ts}-{filename}"
+            await _save_upload(part, save_path)
+            upload = (filename, save_path)
+        elif part.name and part.name != "file":
+            data[part.name] = await part.text()
+
+    def apply(store: dict):
+        # General settings
+        store["bot_name"] = (data.get("bot_name") or store.get("bot_name","")).strip()
+        store["ai_persona"] = (data.get("ai_persona") or store.get("ai_persona","")).strip()
+        store["MODE"] = (data.get("MODE") or store.get("MODE","webhook")).strip() or "webhook"
 
-    # General settings
-    store["bot_name"] = (data.get("bot_name") or store.get("bot_name","")).strip()
-    store["ai_persona"] = (data.get("ai_persona") or store.get("ai_persona","")).strip()
-    store["MODE"] = (data.get("MODE") or store.get("MODE","webhook")).strip() or "webhook"
+        # Secrets (optional)
+        if allow_secrets:
+            for key in ["TELEGRAM_TOKEN", "GEMINI_API_KEY", "PUBLIC_BASE_URL"]:
+                if key in data:
+                    store[key] = (data.get(key) or "").strip()
+
+        if upload is not None and upload[0].lower().endswith(".md"):
+            store["catalog_file"] = str(upload[1].relative_to(ROOT))
+
+    # Read-modify-write under the store lock so a finishing ingest job can't be overwritten
+    await STORE.update(apply)
+
+    if upload is not None and upload[0].lower().endswith(".pdf"):
+        # PDF: convert in the background; the job activates the catalog when it finishes
+        request.app["ingest"].submit_pdf(upload[1], upload[0])
 
-    # Secrets (optional)
-    if allow_secrets:
-        for key in ["TELEGRAM_TOKEN", "GEMINI_API_KEY", "PUBLIC_BASE_URL"]:
-            if key in data:
-                store[key] = (data.get(key) or "").strip()
-
-    # Optional file upload (FileField or empty)
-    file_field = data.get("file")
-    if getattr(file_field, "filename", None):
-        filename = file_field.filename
-        raw = file_field.file.read()
-        ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
-        lower = filename.lower()
-        if lower.endswith(".md") or lower.endswith(".pdf"):
-            save_path = UPLOADS_DIR / f"{ts}-{filename}"
-            save_path.write_bytes(raw)
-            final_catalog = str(save_path.relative_to(ROOT))
-            if lower.endswith(".pdf"):
-                try:
-                    text_chunks = []
-                    with open(save_path, "rb") as f:
-                        reader = PdfReader(f)
-                        for page in reader.pages:
-                            text_chunks.append(page.extract_text() or "")
-                    md_text = "\n\n".join(text_chunks).strip()
-                    md_path = save_path.with_suffix(".md")
-                    md_path.write_text(md_text, encoding="utf-8")
-                    final_catalog = str(md_path.relative_to(ROOT))
-                except Exception:
-                    final_catalog = str(save_path.relative_to(ROOT))
-            store["catalog_file"] = final_catalog
-        else:
-            return web.Response(text="Only .md or .pdf supported", status=400)
-
-    save_store(store)
     # Redirect back (prevents duplicate form resubmission on refresh)
     raise web.HTTPFound(location="/admin")
 
+@require_basic_auth
+async def admin_job_status(request: web.Request):
+    job = request.app["ingest"].get(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"error": "unknown job"}, status=404)
+    return web.json_response(job.to_dict())
+
+def _download(body, filename: str, content_type: str = "text/plain"):
+    return web.Response(body=body, content_type=content_type,
+                        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@require_basic_auth
+async def admin_profile(request: web.Request):
+    monitor = request.app.get("loop_monitor")
+    if monitor is None:
+        return web.json_response({"error": "loop monitor disabled (LOOP_LAG_MONITOR=false)"}, status=404)
+    return web.json_response({"loop": monitor.stats(), "stalls": list(reversed(monitor.reports))})
+
+@require_basic_auth
+async def admin_profile_cpu(request: web.Request):
+    try:
+        seconds = float(request.query.get("seconds", "10"))
+    except ValueError:
+        return web.Response(text="seconds must be a number", status=400)
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        return web.Response(text=f"seconds must be in (0, {PROFILE_MAX_SECONDS:.0f}]", status=400)
+    sort = request.query.get("sort", "cumulative")
+    if sort not in PROFILE_SORT_KEYS:
+        return web.Response(text=f"sort must be one of: {', '.join(sorted(PROFILE_SORT_KEYS))}", status=400)
+    profile = await cpu_profile(seconds)
+    if profile is None:
+        return web.Response(text="A profile is already running", status=409)
+    ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    if request.query.get("format") == "pstats":
+        # for snakeviz / `python -m pstats`
+        profile.create_stats()
+        return _download(marshal.dumps(profile.stats), f"profile-{ts}.prof", "application/octet-stream")
+    return _download(profile_report(profile, sort), f"profile-{ts}.txt")
+
+@require_basic_auth
+async def admin_profile_tasks(request: web.Request):
+    ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    return _download(task_dump(), f"tasks-{ts}.txt")
+
 def mount_admin_routes(app: web.Application):
+    app["ingest"] = IngestManager(activate=_activate_catalog)
+
+    async def _close_ingest(app):
+        await app["ingest"].close()
+
+    app.on_cleanup.append(_close_ingest)
     app.add_routes([
         web.get("/admin", admin_home),
         web.post("/admin/save", admin_save),
+        web.get("/admin/jobs/{job_id}", admin_job_status),
+        web.get("/admin/profile", admin_profile),
+        web.get("/admin/profile/cpu", admin_profile_cpu),
+        web.get("/admin/profile/tasks", admin_profile_tasks),
     ])
     return app
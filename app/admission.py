@@ -0,0 +1,171 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Sustained Gemini-backed requests per second allowed for one user, and the burst above that.
+ADMIT_USER_RATE = float(os.getenv("ADMIT_USER_RATE", "0.5"))
+ADMIT_USER_BURST = float(os.getenv("ADMIT_USER_BURST", "5"))
+# Sustained requests per second for the whole bot (keep under the Gemini quota), and its burst.
+ADMIT_GLOBAL_RATE = float(os.getenv("ADMIT_GLOBAL_RATE", "10"))
+ADMIT_GLOBAL_BURST = float(os.getenv("ADMIT_GLOBAL_BURST", "20"))
+# Requests allowed to wait for a global token at once, and the longest wait before shedding.
+ADMIT_QUEUE_MAX = int(os.getenv("ADMIT_QUEUE_MAX", "100"))
+ADMIT_MAX_WAIT = float(os.getenv("ADMIT_MAX_WAIT", "10"))
+# Per-user buckets kept; the least recently seen user's is dropped beyond this.
+ADMIT_TRACKED_USERS = int(os.getenv("ADMIT_TRACKED_USERS", "10000"))
+
+REJECT_USER = "user"
+REJECT_BUSY = "busy"
+
+BUSY_MESSAGES = {
+    REJECT_USER: {
+        "en": "You're sending messages a bit fast. Please wait a few seconds and try again. ⏳",
+        "bn": "আপনি একটু দ্রুত বার্তা পাঠাচ্ছেন। কয়েক সেকেন্ড অপেক্ষা করে আবার চেষ্টা করুন। ⏳",
+        "hi": "आप बहुत जल्दी-जल्दी संदेश भेज रहे हैं। कृपया कुछ सेकंड रुककर फिर से कोशिश करें। ⏳",
+        "ar": "أنت ترسل الرسائل بسرعة كبيرة. يرجى الانتظار بضع ثوانٍ ثم المحاولة مرة أخرى. ⏳",
+    },
+    REJECT_BUSY: {
+        "en": "I'm getting a lot of messages right now. Please try again in a minute. 🙏",
+        "bn": "এই মুহূর্তে অনেক বার্তা আসছে। অনুগ্রহ করে এক মিনিট পরে আবার চেষ্টা করুন। 🙏",
+        "hi": "अभी बहुत सारे संदेश आ रहे हैं। कृपया एक मिनट बाद फिर से कोशिश करें। 🙏",
+        "ar": "أتلقى الكثير من الرسائل الآن. يرجى المحاولة مرة أخرى بعد دقيقة. 🙏",
+    },
+}
+
+
+def busy_message(reason: str, lang_code: str) -> str:
+    messages = BUSY_MESSAGES.get(reason, BUSY_MESSAGES[REJECT_BUSY])
+    return messages.get(lang_code, messages["en"])
+
+
+class TokenBucket:
+    """Classic token bucket. `reserve` may drive the balance negative: the debt is
+    the queue of callers already promised a token, so waits are handed out FIFO."""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n: float = 1.0) -> bool:
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    def wait_time(self, n: float = 1.0) -> float:
+        """Seconds until `n` tokens are available (0 if they are now); takes nothing."""
+        self._refill()
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def give_back(self, n: float = 1.0):
+        self._refill()
+        self.tokens = min(self.burst, self.tokens + n)
+
+    def reserve(self, n: float = 1.0, max_wait: float = 0.0) -> Optional[float]:
+        """Take `n` tokens now, returning how long to wait until they are really
+        available, or None (nothing taken) if that would exceed `max_wait`."""
+        self._refill()
+        wait = max(0.0, (n - self.tokens) / self.rate) if self.rate > 0 else 0.0
+        if wait > max_wait:
+            return None
+        self.tokens -= n
+        return wait
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.burst
+
+
+class AdmissionController:
+    """Gate in front of Gemini calls: a per-user bucket (rejects immediately, so one
+    user can't occupy the queue) and a global bucket with a bounded FIFO wait."""
+
+    def __init__(self, user_rate: float = ADMIT_USER_RATE, user_burst: float = ADMIT_USER_BURST,
+                 global_rate: float = ADMIT_GLOBAL_RATE, global_burst: float = ADMIT_GLOBAL_BURST,
+                 max_queue: int = ADMIT_QUEUE_MAX, max_wait: float = ADMIT_MAX_WAIT,
+                 clock: Callable[[], float] = time.monotonic):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_burst, clock) if global_rate > 0 else None
+        self._users: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._waiting = 0
+        self._admitted = 0
+        self._rejected = {REJECT_USER: 0, REJECT_BUSY: 0}
+        self._waited = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _user_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._users.get(user_id)
+        if bucket is not None:
+            self._users.move_to_end(user_id)
+            return bucket
+        bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst, self.clock)
+        if len(self._users) > ADMIT_TRACKED_USERS:
+            self._users.popitem(last=False)  # least recently seen user; long since refilled
+        return bucket
+
+    def _reject(self, user_id: int, reason: str) -> str:
+        self._rejected[reason] += 1
+        logger.info("Admission rejected user %s (%s)", user_id, reason)
+        return reason
+
+    async def admit(self, user_id: int, cost: float = 1.0) -> Optional[str]:
+        """Wait for admission. Returns None when admitted, else the rejection reason
+        (REJECT_USER or REJECT_BUSY) to pass to `busy_message`."""
+        user = self._user_bucket(user_id) if self.user_rate > 0 else None
+        if user is not None and not user.try_take(cost):
+            return self._reject(user_id, REJECT_USER)
+
+        wait = 0.0
+        if self._global is not None:
+            wait = None
+            if self._waiting < self.max_queue:
+                wait = self._global.reserve(cost, self.max_wait)
+            if wait is None:
+                if user is not None:
+                    user.give_back(cost)
+                return self._reject(user_id, REJECT_BUSY)
+
+        if wait > 0:
+            self._waiting += 1
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._waiting -= 1
+            self._waited += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        self._admitted += 1
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self._admitted,
+            "rejected_user": self._rejected[REJECT_USER],
+            "rejected_busy": self._rejected[REJECT_BUSY],
+            "waiting": self._waiting,
+            "waited": self._waited,
+            "avg_wait_ms": round(1000 * self._wait_total / self._waited, 1) if self._waited else 0.0,
+            "max_wait_ms": round(1000 * self._wait_max, 1),
+            "tracked_users": len(self._users),
+        }
@@ -1,29 +1,30 @@
 
-from pathlib import Path
-import json
-
-def _load_admin_overrides():
-    try:
-        root = Path(__file__).resolve().parent.parent
-        store = json.loads((root / "data" / "admin_store.json").read_text(encoding="utf-8"))
-        return store
-    except Exception:
-        return {}
-
-ADMIN_OVERRIDES = _load_admin_overrides()
-BOT_NAME_OVERRIDE = ADMIN_OVERRIDES.get("bot_name")
-AI_PERSONA_OVERRIDE = ADMIN_OVERRIDES.get("ai_persona")
-
+import os
 import re
+import time
+import asyncio
+import hashlib
 import logging
+import weakref
+import functools
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
 
 import google.generativeai as genai
 from telegram import Update
 from telegram.constants import ParseMode, ChatAction
 from telegram.ext import ContextTypes
 
+from .sessions import SessionStore
+from .history import HistoryBackend, open_history_backend
+from .catalog import CatalogIndex, render_sections
+from .context_cache import GEMINI_CONTEXT_CACHE, ContextCache
+from .resilience import GeminiGuard
+from .store import DEFAULT_STORE
+
 logger = logging.getLogger(__name__)
 
 # ------------------------ Prompt & Data ------------------------
@@ -45,16 +46,80 @@ You are "Leo," a passionate and friendly bookseller at Jatri Bookstore.
 - **Expert, Not Pushy**: You are a knowledgeable bookseller, not a high-pressure salesperson. Your goal is to help the customer find a book they will love.
 """
 
-def load_product_info() -> str:
-    p = Path(__file__).resolve().parent.parent / "product_data" / "jatri_books_info.md"
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CATALOG_FILE = "product_data/jatri_books_info.md"
+
+def load_product_info(catalog_file: str = DEFAULT_CATALOG_FILE) -> str:
+    p = ROOT / catalog_file
     try:
         return p.read_text(encoding="utf-8")
     except Exception as e:
         logger.error("Failed to load product info at %s: %s", p, e)
         return "No product information available."
 
-PRODUCT_INFO = load_product_info()
-SYSTEM_INSTRUCTION = f"{AGENT_PERSONA_PROMPT}\n\n*** MANDATORY PRODUCT AND CAMPAIGN INFORMATION ***\n{PRODUCT_INFO}\n*** END OF INFORMATION ***"
+# Retrieval: attach only the catalog entries relevant to each message instead of the whole file.
+CATALOG_RETRIEVAL = os.getenv("CATALOG_RETRIEVAL", "true").lower() == "true"
+CATALOG_TOP_K = int(os.getenv("CATALOG_TOP_K", "3"))
+
+def build_system_instruction(persona: str, product_info: str, index: Optional[CatalogIndex] = None) -> str:
+    """Full catalog dump, or (with an index) just the offer block and title list."""
+    if index is None:
+        return f"{persona}\n\n*** MANDATORY PRODUCT AND CAMPAIGN INFORMATION ***\n{product_info}\n*** END OF INFORMATION ***"
+    return (
+        f"{persona}\n\n*** MANDATORY PRODUCT AND CAMPAIGN INFORMATION ***\n{index.offer_block()}\n*** END OF INFORMATION ***\n\n"
+        "Full details of the catalog entries most relevant to the customer's message are attached to it "
+        "under \"Catalog entries\". Only recommend books from the catalog."
+    )
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    """Immutable persona + catalog state. A turn uses one snapshot from start to finish."""
+    version: int
+    bot_name: str
+    persona: str
+    catalog_file: str
+    catalog_text: str
+    index: CatalogIndex
+    retrieval: bool
+    system_instruction: str
+    content_hash: str
+    built_at: float
+
+def make_snapshot(persona: str, catalog_text: str, catalog_file: str = DEFAULT_CATALOG_FILE, bot_name: str = "",
+                  version: int = 1, retrieval: bool = CATALOG_RETRIEVAL) -> KnowledgeSnapshot:
+    index = CatalogIndex.from_markdown(catalog_text)
+    system_instruction = build_system_instruction(persona, catalog_text, index if retrieval else None)
+    return KnowledgeSnapshot(
+        version=version,
+        bot_name=bot_name,
+        persona=persona,
+        catalog_file=catalog_file,
+        catalog_text=catalog_text,
+        index=index,
+        retrieval=retrieval,
+        system_instruction=system_instruction,
+        content_hash=hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(),
+        built_at=time.time(),
+    )
+
+def store_persona(store: dict) -> str:
+    """The admin's persona, or AGENT_PERSONA_PROMPT while it is empty or still the shipped placeholder."""
+    persona = (store.get("ai_persona") or "").strip()
+    if not persona or persona == DEFAULT_STORE["ai_persona"]:
+        return AGENT_PERSONA_PROMPT
+    return persona
+
+def build_snapshot(store: dict, version: int = 1, retrieval: bool = CATALOG_RETRIEVAL) -> KnowledgeSnapshot:
+    """Read the catalog named in the admin store and derive everything a turn needs."""
+    catalog_file = (store.get("catalog_file") or "").strip() or DEFAULT_CATALOG_FILE
+    return make_snapshot(
+        persona=store_persona(store),
+        catalog_text=load_product_info(catalog_file),
+        catalog_file=catalog_file,
+        bot_name=(store.get("bot_name") or "").strip(),
+        version=version,
+        retrieval=retrieval,
+    )
 
 # ------------------------ Language Helpers ------------------------
 
@@ -68,28 +133,163 @@ LANG_MAP = {'en': 'English', 'ar': 'Arabic', 'hi': 'Hindi', 'bn': 'Bengali'}
 
 # ------------------------ Gemini Model Wrapper ------------------------
 
-class GeminiChat:
-    def __init__(self, api_key: str):
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+FALLBACK_REPLY = "Sorry, I couldn't generate a response right now."
+# Max Gemini round trips in flight at once; extra turns queue for a free slot.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+# Alternative Gemini API host (a proxy, or the offline fake used by the load test); implies the REST transport.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "").strip()
+
+def configure_gemini(api_key: str):
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    else:
         genai.configure(api_key=api_key)
-        self._model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash",
-            system_instruction=SYSTEM_INSTRUCTION
-        )
-        # simple memory per user id
-        self._conversations: Dict[int, any] = {}
+
+def _response_text(resp) -> str:
+    """`resp.text`, or "" when the response (or stream chunk) carries no text part."""
+    try:
+        return resp.text or ""
+    except ValueError:
+        return ""
+
+class GeminiChat:
+    def __init__(self, api_key: str, knowledge, model=None, max_concurrency: Optional[int] = None,
+                 history: Optional[HistoryBackend] = None, context_cache: Optional[ContextCache] = None,
+                 guard: Optional[GeminiGuard] = None):
+        # anything with .current() -> KnowledgeSnapshot (normally a SnapshotManager)
+        self.knowledge = knowledge
+        # a fixed model (benchmarks) is used for every snapshot; otherwise one model per snapshot
+        self._fixed_model = model
+        if model is None:
+            configure_gemini(api_key)
+        self._models: Dict[str, any] = {}
+        self._models_lock = threading.Lock()
+        # persona + catalog registered once as Gemini cached content; None sends it inline every turn
+        if context_cache is None and model is None and GEMINI_CONTEXT_CACHE:
+            context_cache = ContextCache(GEMINI_MODEL_NAME)
+        self.context_cache = context_cache
+        # bounded memory per user id (LRU + idle TTL + turn cap)
+        self.sessions = SessionStore()
+        # durable turns, used to rebuild sessions after a restart or eviction
+        self.history = history if history is not None else open_history_backend()
+        # The SDK call is blocking, so it runs on a bounded thread pool instead of the event loop.
+        self.max_concurrency = max(1, max_concurrency or GEMINI_MAX_CONCURRENCY)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gemini")
+        # per-attempt deadline, retries of transient errors, optional hedging, shared circuit breaker
+        self.guard = guard or GeminiGuard("chat")
+        # One turn at a time per user so a ChatSession is never mutated from two threads.
+        self._user_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
 
     def clear(self, user_id: int):
-        if user_id in self._conversations:
-            del self._conversations[user_id]
+        self.sessions.pop(user_id)
+        self.history.clear(user_id)
+
+    def _model_for(self, snapshot: KnowledgeSnapshot):
+        if self._fixed_model is not None:
+            return self._fixed_model
+        if self.context_cache is not None:
+            cached = self.context_cache.model_for(snapshot)
+            if cached is not None:
+                return cached
+        with self._models_lock:
+            model = self._models.get(snapshot.content_hash)
+            if model is None:
+                model = genai.GenerativeModel(
+                    model_name=GEMINI_MODEL_NAME,
+                    system_instruction=snapshot.system_instruction
+                )
+                # the previous model is kept for turns still in flight on the old snapshot
+                for stale in list(self._models)[:-1]:
+                    del self._models[stale]
+                self._models[snapshot.content_hash] = model
+            return model
+
+    def _restore_session(self, user_id: int, model):
+        """Start a chat seeded with the user's stored turns (empty for new users)."""
+        turns = self.history.load(user_id, limit=2 * self.sessions.max_turns)
+        while turns and turns[0][0] != "user":
+            turns = turns[1:]
+        return model.start_chat(history=[{"role": role, "parts": [text]} for role, text in turns])
+
+    def _session_for(self, user_id: int, snapshot: KnowledgeSnapshot):
+        model = self._model_for(snapshot)
+        convo = self.sessions.get(user_id)
+        if convo is None:
+            convo = self._restore_session(user_id, model)
+            self.sessions.put(user_id, convo)
+        elif convo.model is not model:
+            # catalog/persona changed since this session started: carry the history over
+            convo = model.start_chat(history=convo.history)
+            self.sessions.put(user_id, convo)
+        return convo
 
-    def reply(self, user_id: int, message: str, lang_code: str) -> str:
-        if user_id not in self._conversations:
-            self._conversations[user_id] = self._model.start_chat(history=[])
-        convo = self._conversations[user_id]
+    def _prepare_turn(self, user_id: int, message: str, lang_code: str) -> Tuple[any, str, str]:
+        """Returns (session, prompt to send, prompt to keep in history)."""
+        snapshot = self.knowledge.current()
+        convo = self._session_for(user_id, snapshot)
         language_name = LANG_MAP.get(lang_code, "English")
         final_instruction = f"FINAL OVERRIDE: The user's language is {language_name}. Your entire response MUST be in {language_name}."
         prompt = f"{message}\n\n---\n{final_instruction}"
-        resp = convo.send_message(prompt)
-        return resp.text or "Sorry, I couldn't generate a response right now."
+        entries = snapshot.index.search(message, k=CATALOG_TOP_K) if snapshot.retrieval else []
+        if entries:
+            return convo, f"{message}\n\n---\nCatalog entries:\n{render_sections(entries)}\n\n---\n{final_instruction}", prompt
+        return convo, prompt, prompt
+
+    def _generate(self, convo, sent: str, emit: Optional[Callable[[str], None]] = None) -> Tuple[str, any]:
+        """One attempt at a turn, made on a copy of the session so that a retried, hedged or
+        abandoned attempt never touches the real one. Returns (text, the copy)."""
+        attempt = convo.model.start_chat(history=convo.history)
+        options = self.guard.request_options
+        if emit is None:
+            return _response_text(attempt.send_message(sent, request_options=options)), attempt
+        parts = []
+        for chunk in attempt.send_message(sent, stream=True, request_options=options):
+            text = _response_text(chunk)
+            if text:
+                parts.append(text)
+                emit(text)
+        return "".join(parts), attempt
+
+    def _finish_turn(self, user_id: int, convo, attempt, message: str, sent: str, kept: str, text: str):
+        history = list(attempt.history)
+        if sent != kept and len(history) >= 2:
+            # keep the retrieved entries out of the history so it doesn't grow by them every turn
+            history[-2] = {"role": "user", "parts": [kept]}
+        convo.history = history
+        self.sessions.record_turn(user_id)
+        if text:
+            self.history.append(user_id, "user", message)
+            self.history.append(user_id, "model", text)
+
+    def _user_lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._user_locks[user_id] = lock
+        return lock
+
+    async def reply_async(self, user_id: int, message: str, lang_code: str) -> str:
+        """One turn, serialized per user; Gemini attempts run on the bounded executor, under `self.guard`."""
+        async with self._user_lock(user_id):
+            convo, sent, kept = await asyncio.to_thread(self._prepare_turn, user_id, message, lang_code)
+            text, attempt = await self.guard.call(functools.partial(self._generate, convo, sent), self._executor)
+            self._finish_turn(user_id, convo, attempt, message, sent, kept, text)
+            return text or FALLBACK_REPLY
+
+    async def reply_stream(self, user_id: int, message: str, lang_code: str) -> AsyncIterator[str]:
+        """Yield reply text chunks as Gemini produces them (empty output yields nothing)."""
+        async with self._user_lock(user_id):
+            convo, sent, kept = await asyncio.to_thread(self._prepare_turn, user_id, message, lang_code)
+            call = self.guard.stream(functools.partial(self._generate, convo, sent), self._executor)
+            async for text in call:
+                yield text
+            full, attempt = call.result
+            self._finish_turn(user_id, convo, attempt, message, sent, kept, full)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.context_cache is not None:
+            self.context_cache.close()
+        self.history.close()
 
-# GeminiChat should reference AI_PERSONA_OVERRIDE if set.
@@ -0,0 +1,174 @@
+import re
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+# "**3. The Last Rickshaw**" starts a catalog entry
+_ENTRY_RE = re.compile(r"^\*\*\s*\d+\s*[.)]\s*(.+?)\s*\*\*\s*$")
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+_PRICE_RE = re.compile(r"price\**\s*:?\s*\**\s*(.+)$", re.IGNORECASE)
+_TOKEN_RE = re.compile(r"\w+")
+
+# Catalogs without "**N. Title**" entries (e.g. converted PDFs) are chunked by paragraphs up to this size.
+PLAIN_CHUNK_CHARS = 1200
+# The always-included title list is skipped for catalogs with more entries than this.
+TITLE_INDEX_MAX = 60
+
+_STOPWORDS = frozenset(
+    "a an and any are as at be book books by can do for from have i in is it me my of on or "
+    "please some that the this to want what which with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+@dataclass(frozen=True)
+class Section:
+    title: str
+    category: str
+    text: str
+    price: str = ""
+
+    def summary_line(self) -> str:
+        line = f"- {self.title}"
+        if self.category:
+            line += f" ({self.category})"
+        if self.price:
+            line += f" — {self.price}"
+        return line
+
+
+def split_sections(markdown: str) -> Tuple[str, List[Section]]:
+    """Split catalog markdown into (general text, entry sections).
+
+    Entries are the `**N. Title**` blocks, tagged with the nearest heading as
+    their category. Everything else (campaign goal, offer, guidance) is general
+    text that every prompt keeps. Markdown without entries is chunked by
+    paragraphs instead, keeping the first chunk as the general text.
+    """
+    general: List[str] = []
+    sections: List[Section] = []
+    category = ""
+    entry_title = None
+    entry_lines: List[str] = []
+    pending_heading = None
+
+    def close_entry():
+        nonlocal entry_title, entry_lines
+        if entry_title is not None:
+            body = "\n".join(entry_lines).strip()
+            price = ""
+            for line in entry_lines:
+                m = _PRICE_RE.search(line)
+                if m:
+                    price = m.group(1).strip()
+            sections.append(Section(title=entry_title, category=category, text=body, price=price))
+        entry_title, entry_lines = None, []
+
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        heading = _HEADING_RE.match(stripped)
+        if heading or stripped == "---":
+            close_entry()
+            if heading:
+                # headings only reach the general text if something other than entries follows
+                pending_heading = line
+                category = heading.group(2).strip()
+            continue
+        m = _ENTRY_RE.match(stripped)
+        if m:
+            close_entry()
+            pending_heading = None
+            entry_title = m.group(1).strip()
+            entry_lines = [line]
+            continue
+        if entry_title is not None:
+            entry_lines.append(line)
+        elif stripped:
+            if pending_heading is not None:
+                general.append("")
+                general.append(pending_heading)
+                pending_heading = None
+            general.append(line)
+    close_entry()
+
+    if sections:
+        return "\n".join(general).strip(), sections
+
+    chunks: List[str] = []
+    current = ""
+    for para in re.split(r"\n\s*\n", markdown):
+        para = para.strip()
+        if not para:
+            continue
+        if current and len(current) + len(para) > PLAIN_CHUNK_CHARS:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        chunks.append(current)
+    if not chunks:
+        return "", []
+    return chunks[0], [Section(title=f"Part {i}", category="", text=c) for i, c in enumerate(chunks[1:], 1)]
+
+
+@dataclass
+class CatalogIndex:
+    """In-memory BM25 index over catalog sections."""
+
+    general: str
+    sections: List[Section]
+    k1: float = 1.5
+    b: float = 0.75
+    _postings: Dict[str, List[Tuple[int, int]]] = field(default_factory=dict, repr=False)
+    _doc_len: List[int] = field(default_factory=list, repr=False)
+    _avg_len: float = 0.0
+
+    def __post_init__(self):
+        for i, s in enumerate(self.sections):
+            # titles and categories count twice: they are what customers name
+            tokens = tokenize(f"{s.title} {s.title} {s.category} {s.category} {s.text}")
+            self._doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self._postings.setdefault(term, []).append((i, tf))
+        self._avg_len = (sum(self._doc_len) / len(self._doc_len)) if self._doc_len else 0.0
+
+    @classmethod
+    def from_markdown(cls, markdown: str) -> "CatalogIndex":
+        general, sections = split_sections(markdown)
+        return cls(general=general, sections=sections)
+
+    def search(self, query: str, k: int = 3) -> List[Section]:
+        """Top-k sections by BM25 score; empty when nothing in the query matches."""
+        n = len(self.sections)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc] / self._avg_len)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / norm
+        best = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:k]
+        return [self.sections[i] for i, _ in best]
+
+    def title_index(self) -> str:
+        if not self.sections or len(self.sections) > TITLE_INDEX_MAX:
+            return ""
+        return "\n".join(s.summary_line() for s in self.sections)
+
+    def offer_block(self) -> str:
+        """Text every prompt carries: campaign/offer copy plus the compact title list."""
+        parts = [self.general]
+        titles = self.title_index()
+        if titles:
+            parts.append(f"Catalog titles:\n{titles}")
+        return "\n\n".join(p for p in parts if p)
+
+
+def render_sections(sections: List[Section]) -> str:
+    return "\n\n".join(s.text for s in sections)
@@ -0,0 +1,133 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from .metrics import REGISTRY, Counter, ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Seconds of quiet after a user's last text message before the collected messages are answered
+# as one turn; 0 answers every message on its own.
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", "1.0"))
+# Seconds a burst's first message waits for a second one; lower it to answer lone messages sooner
+# at the cost of splitting slowly typed bursts. Defaults to COALESCE_WINDOW.
+COALESCE_FIRST_WINDOW = float(os.getenv("COALESCE_FIRST_WINDOW", str(COALESCE_WINDOW)))
+# Longest a burst is held after its first message, however fast the user keeps typing.
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", "4"))
+
+COALESCED = REGISTRY.register(Counter(
+    "bot_coalesced_messages_total", "Text messages merged into another message's LLM turn (LLM calls saved)."))
+
+
+class _Burst:
+    __slots__ = ("items", "first_at", "timer", "due")
+
+    def __init__(self, item: Any, first_at: float):
+        self.items = [item]
+        self.first_at = first_at
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.due = False
+
+
+class MessageCoalescer:
+    """Per-chat debounce: messages that arrive close together become one turn.
+
+    `add` returns at once, so the dispatcher worker is free to deliver the
+    chat's next message. The first message arms a `first_window`-second timer
+    and each later one re-arms a `window`-second timer (capped at `max_wait`
+    after the first); when it fires, `flush` is called with all
+    collected items in a background task. A chat has at most one flush
+    running: a burst that comes due meanwhile keeps collecting and is flushed
+    when the running one finishes, so messages typed while a reply is being
+    generated are answered together, in order, in the next turn.
+    """
+
+    def __init__(self, flush: Callable[[List[Any]], Awaitable[None]], window: float = COALESCE_WINDOW,
+                 max_wait: float = COALESCE_MAX_WAIT, clock: Callable[[], float] = time.monotonic,
+                 first_window: float = COALESCE_FIRST_WINDOW):
+        self.flush = flush
+        self.window = window
+        self.first_window = min(window, first_window)
+        self.max_wait = max(window, max_wait)
+        self.clock = clock
+        self._bursts: Dict[Hashable, _Burst] = {}
+        self._running: Dict[Hashable, asyncio.Task] = {}
+        self.messages = 0
+        self.turns = 0
+        self.largest = 0
+
+    def add(self, key: Hashable, item: Any):
+        """Queue `item` for chat `key`; it is flushed with the chat's other recent items."""
+        self.messages += 1
+        now = self.clock()
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst(item, now)
+        else:
+            burst.items.append(item)
+            if burst.due:
+                return  # waiting for the chat's running flush
+            burst.timer.cancel()
+        window = self.first_window if len(burst.items) == 1 else self.window
+        delay = min(window, burst.first_at + self.max_wait - now)
+        burst.timer = asyncio.get_running_loop().call_later(max(0.0, delay), self._on_timer, key)
+
+    def flush_now(self, key: Hashable):
+        """Answer `key`'s pending burst without waiting out the window (e.g. a voice note follows it)."""
+        burst = self._bursts.get(key)
+        if burst is not None and not burst.due:
+            burst.timer.cancel()
+            self._on_timer(key)
+
+    def _on_timer(self, key: Hashable):
+        burst = self._bursts[key]
+        burst.due = True
+        if key not in self._running:
+            self._start(key)
+
+    def _start(self, key: Hashable):
+        items = self._bursts.pop(key).items
+        self.turns += 1
+        self.largest = max(self.largest, len(items))
+        if len(items) > 1:
+            COALESCED.inc(amount=len(items) - 1)
+        self._running[key] = asyncio.create_task(self._run(key, items), name="coalesce-flush")
+
+    async def _run(self, key: Hashable, items: List[Any]):
+        try:
+            await self.flush(items)
+        except Exception:
+            ERRORS.inc("coalesce_flush")
+            logger.exception("Failed answering %s coalesced message(s)", len(items))
+        finally:
+            del self._running[key]
+            burst = self._bursts.get(key)
+            if burst is not None and burst.due:
+                self._start(key)
+
+    async def close(self, timeout: float = 10.0):
+        """Answer every pending burst now and wait up to `timeout` seconds for the replies."""
+        for key in list(self._bursts):
+            self.flush_now(key)
+        deadline = time.monotonic() + timeout
+        while self._running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning("Dropping %s coalesced replies on shutdown", len(self._running))
+                for task in list(self._running.values()):
+                    task.cancel()
+                break
+            await asyncio.wait(list(self._running.values()), timeout=remaining)
+
+    def stats(self) -> dict:
+        return {
+            "window_s": self.window,
+            "first_window_s": self.first_window,
+            "messages": self.messages,
+            "turns": self.turns,
+            "saved_llm_calls": self.messages - self.turns - sum(len(b.items) for b in self._bursts.values()),
+            "largest_burst": self.largest,
+            "pending_chats": len(self._bursts),
+        }
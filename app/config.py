@@ -1,7 +1,8 @@
 import os
-import json
 from dataclasses import dataclass
-from pathlib import Path
+from typing import Optional
+
+from .store import STORE
 
 @dataclass(frozen=True)
 class Settings:
@@ -10,17 +11,12 @@ class Settings:
     public_base_url: str
     port: int
     mode: str  # 'webhook' (Render) or 'polling' (local)
+    worker_index: Optional[int] = None  # set when running as one of the supervisor's workers
+    set_webhook: bool = True
 
 def load_settings() -> Settings:
     # Overlay store if present
-    root = Path(__file__).resolve().parent.parent
-    store_path = root / 'data' / 'admin_store.json'
-    store = {}
-    if store_path.exists():
-        try:
-            store = json.loads(store_path.read_text(encoding='utf-8'))
-        except Exception:
-            store = {}
+    store = STORE.saved()
 
     telegram_token = (store.get('TELEGRAM_TOKEN') or os.getenv('TELEGRAM_TOKEN', '')).strip()
     gemini_api_key = (store.get('GEMINI_API_KEY') or os.getenv('GEMINI_API_KEY', '')).strip()
@@ -28,6 +24,8 @@ def load_settings() -> Settings:
 
     port = int(os.getenv('PORT', '10000'))
     mode = (store.get('MODE') or os.getenv('MODE', 'webhook')).strip() or 'webhook'
+    worker_index = int(os.environ['WORKER_INDEX']) if os.getenv('WORKER_INDEX') else None
+    set_webhook = os.getenv('SET_WEBHOOK', 'true').lower() == 'true'
 
     if not telegram_token:
         raise RuntimeError('TELEGRAM_TOKEN env var is required')
@@ -42,4 +40,6 @@ def load_settings() -> Settings:
         public_base_url=public_base_url,
         port=port,
         mode=mode,
+        worker_index=worker_index,
+        set_webhook=set_webhook,
     )
@@ -0,0 +1,218 @@
+import os
+import re
+import time
+import logging
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from google.generativeai import caching
+
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Register the system instruction (persona + catalog) with Gemini once, as cached content keyed by
+# its hash, instead of re-sending it with every turn. Off by default: it needs a pinned model version
+# (GEMINI_MODEL=gemini-1.5-flash-002) and, on 1.5 models, a 32k-token instruction.
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() == "true"
+# Lifetime of a cache entry; entries in use are extended when half of it is left.
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "3600"))
+# Instructions smaller than this (estimated tokens) aren't worth caching. Raised to the model's own
+# minimum (MODEL_MIN_CACHE_TOKENS) when that is higher.
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+# Seconds before retrying after a transient failure to create a cache (quota, overload).
+GEMINI_CACHE_RETRY = 600.0
+# Smallest instruction Gemini accepts as cached content, by model family.
+MODEL_MIN_CACHE_TOKENS = {"gemini-1.5": 32768}
+# Refusals that won't go away by retrying: the model or request can't be cached at all.
+_UNSUPPORTED = (api_exceptions.InvalidArgument, api_exceptions.NotFound, api_exceptions.FailedPrecondition,
+                api_exceptions.MethodNotImplemented, api_exceptions.PermissionDenied)
+# An entry this close to expiry is no longer handed out; a turn may take this long to reach Gemini.
+EXPIRY_MARGIN = 60.0
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def _model_id(model_name: str) -> str:
+    return model_name.rsplit("/", 1)[-1]
+
+
+def model_min_tokens(model_name: str) -> int:
+    """Gemini's minimum cached-content size for `model_name` (0 when not known)."""
+    model = _model_id(model_name)
+    return max((n for family, n in MODEL_MIN_CACHE_TOKENS.items() if model.startswith(family)), default=0)
+
+
+def model_supports_caching(model_name: str) -> bool:
+    """1.5 models only cache on a pinned version (`gemini-1.5-flash-002`), not the `-latest`/bare alias."""
+    model = _model_id(model_name)
+    return not model.startswith("gemini-1.5") or re.search(r"-\d{3}$", model) is not None
+
+
+class GeminiCacheBackend:
+    """`google.generativeai.caching` calls. Blocking; ContextCache runs them on its own thread."""
+
+    def create(self, model_name: str, system_instruction: str, ttl: float, display_name: str):
+        return caching.CachedContent.create(model=model_name, system_instruction=system_instruction,
+                                            display_name=display_name, ttl=datetime.timedelta(seconds=ttl))
+
+    def model(self, handle):
+        return genai.GenerativeModel.from_cached_content(handle)
+
+    def extend(self, handle, ttl: float):
+        handle.update(ttl=datetime.timedelta(seconds=ttl))
+
+    def delete(self, handle):
+        handle.delete()
+
+
+class _Entry:
+    __slots__ = ("handle", "model", "expires_at", "tokens", "refreshing")
+
+    def __init__(self, handle, model, expires_at: float, tokens: int):
+        self.handle = handle
+        self.model = model
+        self.expires_at = expires_at
+        self.tokens = tokens
+        self.refreshing = False
+
+
+class ContextCache:
+    """Gemini cached-content objects for knowledge snapshots, keyed by content hash.
+
+    `model_for` never blocks on the network: the first turn on a new snapshot
+    is sent the plain way while the cache is created in the background, and
+    later turns get a model bound to it. Entries in use are extended before
+    they expire; when the catalog changes, the previous entry is kept for
+    turns still in flight and older ones are deleted. Any failure falls back
+    to plain requests: transient ones retry later, while a model that can't
+    cache (unpinned, or refused by Gemini) turns the cache off for good.
+    """
+
+    def __init__(self, model_name: str, backend=None, ttl: float = GEMINI_CACHE_TTL,
+                 min_tokens: Optional[int] = None, clock=time.monotonic):
+        self.model_name = model_name
+        self.backend = backend or GeminiCacheBackend()
+        self.ttl = ttl
+        if min_tokens is None:
+            min_tokens = max(GEMINI_CACHE_MIN_TOKENS, model_min_tokens(model_name))
+        self.min_tokens = min_tokens
+        self.clock = clock
+        self.disabled = not model_supports_caching(model_name)
+        if self.disabled:
+            logger.warning("Context cache off: %s is not a pinned model version (e.g. %s-002)",
+                           model_name, _model_id(model_name))
+        self._entries: Dict[str, _Entry] = {}
+        self._creating: set = set()
+        self._retry_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gemini-cache")
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.extended = 0
+        self.failures = 0
+
+    def model_for(self, snapshot) -> Optional[Any]:
+        """A model bound to `snapshot`'s cached instruction, or None to send the instruction inline."""
+        if self.disabled:
+            return None
+        tokens = estimate_tokens(snapshot.system_instruction)
+        if tokens < self.min_tokens:
+            return None
+        key = snapshot.content_hash
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at - now > EXPIRY_MARGIN:
+                if entry.expires_at - now < self.ttl / 2 and not entry.refreshing:
+                    entry.refreshing = True
+                    self._worker.submit(self._extend, key, entry)
+                self.hits += 1
+                return entry.model
+            if entry is not None:  # about to expire on Gemini's side
+                del self._entries[key]
+            self.misses += 1
+            if key not in self._creating and now >= self._retry_at.get(key, 0.0):
+                self._creating.add(key)
+                self._worker.submit(self._create, key, snapshot.system_instruction, tokens)
+            return None
+
+    def _create(self, key: str, system_instruction: str, tokens: int):
+        try:
+            handle = self.backend.create(self.model_name, system_instruction, self.ttl, f"system-{key[:12]}")
+            entry = _Entry(handle, self.backend.model(handle), self.clock() + self.ttl, tokens)
+        except Exception as e:
+            self.failures += 1
+            ERRORS.inc("context_cache")
+            if isinstance(e, _UNSUPPORTED):
+                self.disabled = True
+                logger.warning("Context cache off: Gemini refused to cache for %s (%s); sending the system "
+                               "instruction inline", self.model_name, e)
+            else:
+                logger.warning("Context cache unavailable (%s); sending the system instruction inline", e)
+            with self._lock:
+                self._creating.discard(key)
+                self._retry_at[key] = self.clock() + GEMINI_CACHE_RETRY
+            return
+        with self._lock:
+            self._creating.discard(key)
+            self._entries[key] = entry
+            # the previous entry stays for turns in flight on the old snapshot
+            stale = [(k, self._entries.pop(k)) for k in list(self._entries)[:-2]]
+        self.created += 1
+        logger.info("Cached system instruction %s (~%s tokens) for %.0fs", key[:12], tokens, self.ttl)
+        for _, old in stale:
+            self._delete(old)
+
+    def _extend(self, key: str, entry: _Entry):
+        try:
+            self.backend.extend(entry.handle, self.ttl)
+            entry.expires_at = self.clock() + self.ttl
+            self.extended += 1
+        except Exception as e:
+            # gone (deleted or expired): the next turn recreates it
+            self.failures += 1
+            ERRORS.inc("context_cache")
+            logger.warning("Could not extend context cache %s: %s", key[:12], e)
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+        finally:
+            entry.refreshing = False
+
+    def _delete(self, entry: _Entry):
+        try:
+            self.backend.delete(entry.handle)
+        except Exception as e:
+            logger.debug("Could not delete context cache: %s", e)
+
+    def close(self):
+        """Delete every entry (they are billed per hour of storage); the deletes finish in the background."""
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            self._worker.submit(self._delete, entry)
+        self._worker.shutdown(wait=False, cancel_futures=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            cached_tokens = sum(e.tokens for e in self._entries.values())
+            entries = len(self._entries)
+        return {
+            "disabled": self.disabled,
+            "min_tokens": self.min_tokens,
+            "entries": entries,
+            "cached_tokens": cached_tokens,
+            "hits": self.hits,
+            "misses": self.misses,
+            "created": self.created,
+            "extended": self.extended,
+            "failures": self.failures,
+        }
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from .metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+# Seconds an update_id is remembered (Telegram keeps retrying an unacknowledged webhook for a while).
+UPDATE_DEDUP_WINDOW = float(os.getenv("UPDATE_DEDUP_WINDOW", "3600"))
+# Max update_ids remembered; the oldest are forgotten first.
+UPDATE_DEDUP_MAX = int(os.getenv("UPDATE_DEDUP_MAX", "100000"))
+# Optional file the seen-set is saved to (every few seconds and on shutdown) so it survives a restart.
+UPDATE_DEDUP_PATH = os.getenv("UPDATE_DEDUP_PATH", "").strip()
+UPDATE_DEDUP_FLUSH_INTERVAL = 5.0
+
+DUPLICATES = REGISTRY.register(Counter(
+    "bot_duplicate_updates_total", "Telegram updates dropped because their update_id was already seen."))
+
+
+class UpdateDedup:
+    """Bounded, time-windowed set of seen update_ids.
+
+    An insertion-ordered dict of update_id -> first-seen time: lookups and
+    inserts are O(1), and expiry pops from the front. With `path`, the set is
+    written atomically when it changed, at most every few seconds.
+    """
+
+    def __init__(self, window: float = UPDATE_DEDUP_WINDOW, max_size: int = UPDATE_DEDUP_MAX,
+                 path: str = UPDATE_DEDUP_PATH, clock=time.time):
+        self.window = window
+        self.max_size = max(1, max_size)
+        self.path = Path(path) if path else None
+        self.clock = clock
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self._dirty = False
+        self._task: Optional[asyncio.Task] = None
+        self.duplicates = 0
+        if self.path is not None:
+            self._load()
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        seen = self._seen
+        while seen and (len(seen) > self.max_size or next(iter(seen.values())) < cutoff):
+            seen.popitem(last=False)
+
+    def check_and_add(self, update_id: int) -> bool:
+        """True if `update_id` was already seen (a duplicate); otherwise records it and returns False."""
+        now = self.clock()
+        self._expire(now)
+        if update_id in self._seen:
+            self.duplicates += 1
+            DUPLICATES.inc()
+            return True
+        self._seen[update_id] = now
+        self._dirty = True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    # --- persistence ---
+
+    def _load(self):
+        try:
+            entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning("Ignoring unreadable dedup file %s: %s", self.path, e)
+            return
+        for update_id, seen_at in sorted(entries, key=lambda e: e[1]):
+            self._seen[int(update_id)] = float(seen_at)
+        self._expire(self.clock())
+        logger.info("Loaded %s recent update ids from %s", len(self._seen), self.path)
+
+    def _write(self, entries):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(entries), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def _snapshot(self):
+        self._dirty = False
+        return list(self._seen.items())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(UPDATE_DEDUP_FLUSH_INTERVAL)
+            if self._dirty:
+                try:
+                    await asyncio.to_thread(self._write, self._snapshot())
+                except Exception:
+                    logger.exception("Could not save dedup file %s", self.path)
+
+    def start(self):
+        if self.path is not None and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop(), name="update-dedup-flush")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.path is not None and self._dirty:
+            await asyncio.to_thread(self._write, self._snapshot())
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._seen), "duplicates": self.duplicates, "persisted": self.path is not None}
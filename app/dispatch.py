@@ -0,0 +1,110 @@
+import os
+import asyncio
+import logging
+from typing import List, Optional
+
+from telegram import Update
+
+from .metrics import ERRORS
+from .dedup import UpdateDedup
+
+logger = logging.getLogger(__name__)
+
+# Worker tasks draining the update queue; each owns one shard of chat ids.
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+# Total updates allowed to wait across all shards before the webhook pushes back.
+UPDATE_QUEUE_MAX = int(os.getenv("UPDATE_QUEUE_MAX", "1000"))
+
+
+def update_chat_key(update: Update) -> int:
+    """Shard key: the chat id, falling back to the user id and then the update id."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return update.update_id
+
+
+class UpdateDispatcher:
+    """Bounded queue of Telegram updates, sharded by chat id.
+
+    Updates for the same chat always land on the same shard and are processed
+    one at a time, in arrival order. Different chats run in parallel, up to the
+    number of workers. Redelivered updates (same update_id) are dropped before
+    they reach a worker.
+    """
+
+    def __init__(self, application, workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 dedup: Optional[UpdateDedup] = None):
+        self._application = application
+        self.dedup = dedup if dedup is not None else UpdateDedup()
+        self.num_workers = max(1, workers or UPDATE_WORKERS)
+        self.max_queue = max(1, max_queue or UPDATE_QUEUE_MAX)
+        self._shards: List[asyncio.Queue] = [asyncio.Queue() for _ in range(self.num_workers)]
+        self._tasks: List[asyncio.Task] = []
+        self.depth = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, update: Update) -> bool:
+        """Enqueue without waiting. Returns False when the queue is full (a duplicate counts as accepted)."""
+        if self.depth >= self.max_queue:
+            # not recorded as seen, so Telegram's retry of this update is still processed
+            self.rejected += 1
+            return False
+        if self.dedup.check_and_add(update.update_id):
+            logger.info("Dropping duplicate update %s", update.update_id)
+            return True
+        shard = self._shards[hash(update_chat_key(update)) % self.num_workers]
+        shard.put_nowait(update)
+        self.depth += 1
+        return True
+
+    async def _worker(self, shard: asyncio.Queue):
+        while True:
+            update = await shard.get()
+            self.depth -= 1
+            self.in_flight += 1
+            try:
+                await self._application.process_update(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                ERRORS.inc("process_update")
+                logger.exception("Failed processing update %s: %s", update.update_id, e)
+            finally:
+                self.in_flight -= 1
+                shard.task_done()
+
+    async def start(self):
+        if self._tasks:
+            return
+        self.dedup.start()
+        self._tasks = [asyncio.create_task(self._worker(q), name=f"update-worker-{i}") for i, q in enumerate(self._shards)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Give queued updates up to `timeout` seconds to finish, then cancel the workers."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._shards)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %s queued updates on shutdown", self.depth)
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.dedup.close()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.num_workers,
+            "queue_depth": self.depth,
+            "queue_max": self.max_queue,
+            "busiest_shard": max(q.qsize() for q in self._shards),
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "dedup": self.dedup.stats(),
+        }
@@ -1,143 +1,197 @@
 import io
 import os
-import shutil
-import subprocess
-import tempfile
+import time
+import asyncio
 import logging
-from pathlib import Path
-from typing import Optional, Tuple
+from typing import AsyncIterator, List, Optional, Tuple
 
 from telegram import Update, InputFile
 from telegram.constants import ChatAction
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters
 
-from gtts import gTTS
-import google.generativeai as genai
-
-from .bot import detect_language, GeminiChat
+from .bot import detect_language, GeminiChat, FALLBACK_REPLY, LANG_MAP
+from .admission import AdmissionController, busy_message
+from .coalesce import MessageCoalescer
+from .metrics import ERRORS, FALLBACKS, time_stage
+from .resilience import GeminiUnavailable, outage_message
+from .voice_cache import VoiceCache
+from .transcode import AsyncTranscoder
+from .voice import VoiceClip, VoiceRenderer
+from .transcribe import TranscriptionService
 
 logger = logging.getLogger(__name__)
 
+# Post the reply as Gemini streams it (edited in place) instead of waiting for the full text.
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+# Min seconds between edits of a streamed message; Telegram flood-limits faster edits to one chat.
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+TELEGRAM_MESSAGE_LIMIT = 4096
+
 # ----------------------------
-# Helpers: TTS and conversion
+# Helpers: streamed text replies
 # ----------------------------
 
-def _tts_to_mp3_bytes(text: str, lang_code: str) -> bytes:
-    """Use gTTS to synthesize MP3 into memory."""
-    buf = io.BytesIO()
-    lc = (lang_code or "en").split("-")[0]
-    gTTS(text=text, lang=lc).write_to_fp(buf)
-    return buf.getvalue()
+async def _edit_text(message, text: str) -> float:
+    """Edit `message`; returns the seconds Telegram asked us to back off (0 on success)."""
+    try:
+        await message.edit_text(text)
+    except RetryAfter as e:
+        return float(e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+    return 0.0
+
+async def _stream_reply_text(update: Update, chunks: AsyncIterator[str], edit_interval: float = STREAM_EDIT_INTERVAL) -> str:
+    """Send streamed text progressively: the first chunk is posted at once, later
+    chunks are coalesced into edits at most every `edit_interval` seconds.
+    Text beyond Telegram's message limit continues in a new message.
+    Returns the full text (empty if nothing was streamed).
+    """
+    full = ""
+    offset = 0        # where the message being edited starts within `full`
+    message = None    # Telegram message currently being edited
+    shown = ""        # what `message` currently displays
+    next_edit = 0.0
+
+    async def flush(final: bool):
+        nonlocal offset, message, shown, next_edit
+        while True:
+            pending = full[offset:]
+            if len(pending) > TELEGRAM_MESSAGE_LIMIT:
+                cut = pending.rfind(" ", 0, TELEGRAM_MESSAGE_LIMIT)
+                if cut <= 0:
+                    cut = TELEGRAM_MESSAGE_LIMIT
+                head = pending[:cut]
+                if message is None:
+                    await update.message.reply_text(head)
+                elif head != shown:
+                    backoff = await _edit_text(message, head)
+                    if backoff:
+                        await asyncio.sleep(backoff)
+                        await _edit_text(message, head)
+                offset += cut
+                while offset < len(full) and full[offset].isspace():
+                    offset += 1
+                message, shown = None, ""
+                continue
+            if not pending.strip():
+                return
+            now = time.monotonic()
+            if message is None:
+                message = await update.message.reply_text(pending)
+                shown = pending
+                next_edit = now + edit_interval
+            elif pending != shown and (final or now >= next_edit):
+                backoff = await _edit_text(message, pending)
+                if backoff and final:
+                    await asyncio.sleep(backoff)
+                    backoff = await _edit_text(message, pending)
+                if not backoff:
+                    shown = pending
+                next_edit = now + max(edit_interval, backoff)
+            return
 
-def _mp3_to_ogg_opus(mp3_bytes: bytes) -> Optional[bytes]:
-    """Convert MP3 bytes to Opus-in-Ogg using ffmpeg. Return None if conversion fails or ffmpeg missing."""
-    if not mp3_bytes:
-        return None
-    if shutil.which("ffmpeg") is None:
-        logger.warning("ffmpeg not found; cannot create Telegram voice bubble. Falling back to MP3/audio.")
-        return None
+    async for chunk in chunks:
+        full += chunk
+        await flush(final=False)
+    await flush(final=True)
+    return full
 
-    with tempfile.TemporaryDirectory() as td:
-        mp3_path = Path(td) / "reply.mp3"
-        ogg_path = Path(td) / "reply.ogg"
-        mp3_path.write_bytes(mp3_bytes)
-
-        cmd = [
-            "ffmpeg", "-y",
-            "-i", str(mp3_path),
-            "-vn",
-            "-ac", "1",
-            "-ar", "48000",
-            "-c:a", "libopus",
-            "-b:a", "64k",
-            str(ogg_path),
-        ]
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        if proc.returncode != 0 or not ogg_path.exists():
-            logger.error("ffmpeg conversion failed: rc=%s, stderr=%s", proc.returncode, proc.stderr.decode(errors="ignore"))
-            return None
-        return ogg_path.read_bytes()
-
-async def _send_voice_from_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, lang_code: str):
-    """Send a Telegram voice bubble; fall back to MP3 audio if needed."""
-    if not text:
-        return
-    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.RECORD_VOICE)
+# ----------------------------
+# Helpers: voice replies
+# ----------------------------
 
-    try:
-        mp3 = _tts_to_mp3_bytes(text, lang_code)
-    except Exception as e:
-        logger.exception("gTTS failed: %s", e)
-        await update.message.reply_text("Sorry, I couldn't generate the voice reply right now. 🛠️")
+async def _send_voice_clips(update: Update, context: ContextTypes.DEFAULT_TYPE, clips: List["asyncio.Task[VoiceClip]"]):
+    """Send rendered clips in order as voice bubbles (MP3 audio when transcoding failed)."""
+    if not clips:
         return
-
-    ogg = None
-    try:
-        ogg = _mp3_to_ogg_opus(mp3)
-    except Exception as e:
-        logger.exception("ffmpeg conversion error: %s", e)
-
-    try:
-        if ogg is not None:
-            await update.message.reply_voice(voice=InputFile(io.BytesIO(ogg), filename="reply.ogg"))
-        else:
-            await update.message.reply_audio(audio=InputFile(io.BytesIO(mp3), filename="reply.mp3"))
-    except Exception as e:
-        logger.exception("Failed sending voice/audio: %s", e)
-        await update.message.reply_text("Sorry, I couldn't send the voice reply. 🛠️")
+    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.RECORD_VOICE)
+    for i, task in enumerate(clips):
+        try:
+            clip = await task
+        except Exception as e:
+            logger.exception("gTTS failed: %s", e)
+            ERRORS.inc("tts")
+            for rest in clips[i + 1:]:
+                rest.cancel()
+            await update.message.reply_text("Sorry, I couldn't generate the voice reply right now. 🛠️")
+            return
+        try:
+            if clip.is_voice:
+                await update.message.reply_voice(voice=InputFile(io.BytesIO(clip.data), filename="reply.ogg"))
+            else:
+                FALLBACKS.inc("voice_mp3")
+                await update.message.reply_audio(audio=InputFile(io.BytesIO(clip.data), filename="reply.mp3"))
+        except Exception as e:
+            logger.exception("Failed sending voice/audio: %s", e)
+            ERRORS.inc("send_voice")
+            for rest in clips[i + 1:]:
+                rest.cancel()
+            await update.message.reply_text("Sorry, I couldn't send the voice reply. 🛠️")
+            return
 
 # ----------------------------
 # Helpers: Telegram voice -> bytes and transcription
 # ----------------------------
 
-async def _download_voice_bytes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[Tuple[bytes, str]]:
-    """Download Telegram voice message; returns (bytes, mime_type)."""
+class _BytesSink:
+    """Write target for `File.download_to_memory` that keeps the downloaded bytes object as-is (no copy)."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(data)
+        return len(data)
+
+    def getvalue(self) -> bytes:
+        return self._chunks[0] if len(self._chunks) == 1 else b"".join(self._chunks)
+
+async def _download_voice_bytes(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[Tuple[bytes, str, str]]:
+    """Download Telegram voice message; returns (bytes, mime_type, file_unique_id)."""
     voice = update.message.voice
     if not voice:
         return None
     try:
-        file = await context.bot.get_file(voice.file_id)
-        buf = io.BytesIO()
-        await file.download_to_memory(out=buf)
-        return buf.getvalue(), "audio/ogg"  # Telegram voice bubbles are Opus-in-Ogg
+        with time_stage("voice_download"):
+            file = await context.bot.get_file(voice.file_id)
+            sink = _BytesSink()
+            await file.download_to_memory(out=sink)
+        # Telegram voice bubbles are Opus-in-Ogg
+        return sink.getvalue(), voice.mime_type or "audio/ogg", voice.file_unique_id
     except Exception as e:
         logger.exception("Failed to download voice file: %s", e)
+        ERRORS.inc("voice_download")
         return None
 
-def _transcribe_with_gemini(audio_bytes: bytes, mime_type: str) -> Optional[str]:
-    """Transcribe audio using Gemini 1.5 Flash via file upload."""
-    try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".oga") as f:
-            f.write(audio_bytes)
-            tmp_path = f.name
-        gfile = genai.upload_file(tmp_path, mime_type=mime_type)
-        try:
-            prompt = "Transcribe the audio exactly as spoken. Respond with only the transcript text."
-            resp = model.generate_content([prompt, gfile])
-            txt = (resp.text or "").strip()
-            return txt or None
-        finally:
-            try:
-                genai.delete_file(gfile.name)
-            except Exception:
-                pass
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
-    except Exception as e:
-        logger.exception("Gemini transcription failed: %s", e)
-        return None
+def _user_lang(update: Update) -> str:
+    """Telegram's client language for the user, when we support it (used before any text is known)."""
+    code = (getattr(update.effective_user, "language_code", None) or "en").split("-")[0]
+    return code if code in LANG_MAP else "en"
+
+def _burst_key(update: Update) -> Tuple[int, int]:
+    """Messages are coalesced per user within a chat (a group's members are never merged)."""
+    return update.effective_chat.id, update.effective_user.id
 
 # ----------------------------
 # Bot Handlers
 # ----------------------------
 
 class BotHandlers:
-    def __init__(self, chat_engine: GeminiChat):
+    def __init__(self, chat_engine: GeminiChat, voice_cache: Optional[VoiceCache] = None,
+                 transcoder: Optional[AsyncTranscoder] = None, transcriber: Optional[TranscriptionService] = None,
+                 admission: Optional[AdmissionController] = None, coalescer: Optional[MessageCoalescer] = None):
         # genai.configure(api_key=...) is already done by GeminiChat initializer
         self.chat_engine = chat_engine
+        self.voice_cache = voice_cache if voice_cache is not None else VoiceCache()
+        self.transcoder = transcoder or AsyncTranscoder()
+        self.transcriber = transcriber or TranscriptionService()
+        self.voice = VoiceRenderer(self.transcoder, self.voice_cache)
+        self.admission = admission or AdmissionController()
+        # rapid text fragments from one user ("hi" / "any thriller?" / "under 500?") get one reply
+        self.coalescer = coalescer or MessageCoalescer(self._answer_burst)
 
     def register(self, application):
         # Commands
@@ -170,33 +224,82 @@ class BotHandlers:
         await update.message.reply_text("Your chat history is cleared. 🧹")
 
     async def handle_text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if self.coalescer.window > 0:
+            self.coalescer.add(_burst_key(update), (update, context))
+            return
+        await self._answer_text(update, context, update.message.text or "")
+
+    async def _answer_burst(self, items: List[Tuple[Update, ContextTypes.DEFAULT_TYPE]]):
+        """One reply to a burst of text messages, sent in reply to the last of them."""
+        update, context = items[-1]
+        text = "\n".join(u.message.text for u, _ in items if u.message.text)
+        await self._answer_text(update, context, text)
+
+    async def _answer_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_message: str):
         user_id = update.effective_user.id
-        user_message = update.message.text or ""
         lang_code = detect_language(user_message)
 
+        rejected = await self.admission.admit(user_id)
+        if rejected:
+            FALLBACKS.inc(f"admission_{rejected}")
+            await update.message.reply_text(busy_message(rejected, lang_code))
+            return
+
         try:
             await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
-            reply = self.chat_engine.reply(user_id, user_message, lang_code)
-            await update.message.reply_text(reply)
+            if STREAM_REPLIES:
+                # includes the progressive edits, which overlap the generation
+                with time_stage("llm_reply"):
+                    reply = await _stream_reply_text(update, self.chat_engine.reply_stream(user_id, user_message, lang_code))
+                if not reply:
+                    FALLBACKS.inc("llm_empty")
+                    await update.message.reply_text(FALLBACK_REPLY)
+            else:
+                with time_stage("llm_reply"):
+                    reply = await self.chat_engine.reply_async(user_id, user_message, lang_code)
+                if reply == FALLBACK_REPLY:
+                    FALLBACKS.inc("llm_empty")
+                await update.message.reply_text(reply)
+        except GeminiUnavailable:
+            FALLBACKS.inc("gemini_unavailable")
+            await update.message.reply_text(outage_message(lang_code))
         except Exception as e:
             logger.error("Error in handle_text_message: %s", e, exc_info=True)
+            ERRORS.inc("text_reply")
             await update.message.reply_text("I'm sorry, I'm having a technical issue. Please try again in a moment. 🛠️")
 
     async def handle_voice_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Reply with voice when customer sends a voice message."""
         user_id = update.effective_user.id
+        # text typed just before the voice note is answered first, without waiting out the window
+        self.coalescer.flush_now(_burst_key(update))
+
+        # a voice note costs two Gemini calls: transcription and the reply
+        rejected = await self.admission.admit(user_id, cost=2)
+        if rejected:
+            FALLBACKS.inc(f"admission_{rejected}")
+            await update.message.reply_text(busy_message(rejected, _user_lang(update)))
+            return
 
         dl = await _download_voice_bytes(update, context)
         if not dl:
+            FALLBACKS.inc("voice_download_failed")
             await update.message.reply_text("I couldn't fetch your voice message. Please try again. 🎤")
             return
 
-        audio_bytes, mime_type = dl
+        audio_bytes, mime_type, file_unique_id = dl
 
         # Transcribe
         await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
-        transcript = _transcribe_with_gemini(audio_bytes, mime_type)
+        try:
+            with time_stage("transcription"):
+                transcript = await self.transcriber.transcribe(audio_bytes, mime_type, file_unique_id)
+        except GeminiUnavailable:
+            FALLBACKS.inc("gemini_unavailable")
+            await update.message.reply_text(outage_message(_user_lang(update)))
+            return
         if not transcript:
+            FALLBACKS.inc("transcription_empty")
             await update.message.reply_text("Sorry, I couldn't understand that voice message. Could you try again?")
             return
 
@@ -204,16 +307,23 @@ class BotHandlers:
 
         # Generate reply with existing core logic
         try:
-            reply = self.chat_engine.reply(user_id, transcript, lang_code)
+            with time_stage("llm_reply"):
+                reply = await self.chat_engine.reply_async(user_id, transcript, lang_code)
+        except GeminiUnavailable:
+            FALLBACKS.inc("gemini_unavailable")
+            await update.message.reply_text(outage_message(lang_code))
+            return
         except Exception as e:
             logger.exception("Chat engine failed on transcript: %s", e)
+            ERRORS.inc("voice_reply")
             await update.message.reply_text("I'm having trouble forming a reply right now. Please try again. 🛠️")
             return
 
-        # Send both text and voice
+        # Send both text and voice; TTS for the reply's sentences starts before the text goes out
+        clips = self.voice.start(reply, lang_code)
         try:
             await update.message.reply_text(reply)
         except Exception:
             pass
 
-        await _send_voice_from_text(update, context, reply, lang_code)
+        await _send_voice_clips(update, context, clips)
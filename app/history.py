@@ -0,0 +1,204 @@
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .sessions import SESSION_MAX_TURNS
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 'sqlite' persists turns across restarts; 'memory' keeps the old in-process-only behaviour.
+HISTORY_BACKEND = os.getenv("HISTORY_BACKEND", "sqlite").strip().lower()
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", str(ROOT / "data" / "history.sqlite3"))
+# Seconds the writer waits to gather a batch before committing.
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "0.5"))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "500"))
+# Turns (messages) kept per user; older ones are deleted as new ones are written. The default is
+# what a rebuilt session loads (SESSION_MAX_TURNS exchanges). 0 keeps everything.
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", str(2 * SESSION_MAX_TURNS)))
+
+Turn = Tuple[str, str]  # (role, text) with role 'user' or 'model'
+
+
+class HistoryBackend:
+    """Where chat turns are persisted. `append`/`clear` must never block on I/O."""
+
+    def append(self, user_id: int, role: str, text: str):
+        raise NotImplementedError
+
+    def load(self, user_id: int, limit: int) -> List[Turn]:
+        """Most recent `limit` turns for `user_id`, oldest first."""
+        raise NotImplementedError
+
+    def clear(self, user_id: int):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class NullHistory(HistoryBackend):
+    def append(self, user_id: int, role: str, text: str):
+        pass
+
+    def load(self, user_id: int, limit: int) -> List[Turn]:
+        return []
+
+    def clear(self, user_id: int):
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_user_id ON turns (user_id, id);
+"""
+
+
+class SQLiteHistory(HistoryBackend):
+    """SQLite (WAL) history with batched write-behind.
+
+    `append` and `clear` only enqueue; a single writer thread commits them in
+    batches and trims each user it wrote for to the newest `keep_turns` rows. `load` waits for that user's queued writes to land first, so a
+    session rebuilt right after eviction still sees its latest turns.
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH, flush_interval: float = HISTORY_FLUSH_INTERVAL,
+                 batch_size: int = HISTORY_BATCH_SIZE, keep_turns: int = HISTORY_KEEP_TURNS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = max(1, batch_size)
+        self.keep_turns = max(0, keep_turns)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.close()
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._committed_seq = 0
+        self._pending_by_user: Dict[int, int] = {}
+        self._local = threading.local()
+        self.written = 0
+        self.batches = 0
+        self.pruned = 0
+        self._writer = threading.Thread(target=self._run_writer, name="history-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def _enqueue(self, user_id: int, op: tuple):
+        with self._cond:
+            self._seq += 1
+            self._pending_by_user[user_id] = self._seq
+            self._queue.put((self._seq, user_id) + op)
+
+    def append(self, user_id: int, role: str, text: str):
+        self._enqueue(user_id, ("append", role, text, time.time()))
+
+    def clear(self, user_id: int):
+        self._enqueue(user_id, ("clear",))
+
+    def load(self, user_id: int, limit: int) -> List[Turn]:
+        with self._cond:
+            target = self._pending_by_user.get(user_id, 0)
+            self._cond.wait_for(lambda: self._committed_seq >= target or not self._writer.is_alive(), timeout=5)
+        rows = self._reader().execute(
+            "SELECT role, text FROM turns WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [(role, text) for role, text in reversed(rows)]
+
+    def _run_writer(self):
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stopping = True
+                    break
+                batch.append(nxt)
+            try:
+                self._write_batch(conn, batch)
+            except Exception as e:
+                logger.exception("Failed writing %s history ops: %s", len(batch), e)
+            with self._cond:
+                self._committed_seq = batch[-1][0]
+                for seq, user_id, *_ in batch:
+                    if self._pending_by_user.get(user_id) == seq:
+                        del self._pending_by_user[user_id]
+                self._cond.notify_all()
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list):
+        appended = set()
+        with conn:
+            for seq, user_id, op, *args in batch:
+                if op == "append":
+                    role, text, created_at = args
+                    conn.execute(
+                        "INSERT INTO turns (user_id, role, text, created_at) VALUES (?, ?, ?, ?)",
+                        (user_id, role, text, created_at),
+                    )
+                    appended.add(user_id)
+                elif op == "clear":
+                    conn.execute("DELETE FROM turns WHERE user_id = ?", (user_id,))
+            if self.keep_turns:
+                for user_id in appended:
+                    # everything at or below the id of the first row past the newest keep_turns
+                    self.pruned += conn.execute(
+                        "DELETE FROM turns WHERE user_id = ? AND id <= (SELECT id FROM turns WHERE user_id = ?"
+                        " ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (user_id, user_id, self.keep_turns),
+                    ).rowcount
+        self.written += len(batch)
+        self.batches += 1
+
+    def close(self, timeout: float = 5.0):
+        """Flush queued writes and stop the writer thread."""
+        self._queue.put(None)
+        self._writer.join(timeout)
+
+
+def open_history_backend() -> HistoryBackend:
+    if HISTORY_BACKEND == "sqlite":
+        try:
+            return SQLiteHistory()
+        except Exception as e:
+            logger.error("Could not open history DB at %s (%s); history will not persist.", HISTORY_DB_PATH, e)
+    return NullHistory()
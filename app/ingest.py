@@ -0,0 +1,205 @@
+import os
+import time
+import uuid
+import asyncio
+import shutil
+import hashlib
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Worker processes for PDF text extraction (pypdf is pure Python and CPU bound).
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages handed to a worker per task; also the granularity of progress updates.
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+# Extracted page text, per document (keyed by the file's sha256), so re-uploading a PDF or retrying a job is cheap.
+PAGE_CACHE_DIR = Path(os.getenv("INGEST_PAGE_CACHE_DIR", str(ROOT / "data" / "page_cache")))
+# Disk budget for the page cache; the least recently ingested documents are deleted first.
+INGEST_PAGE_CACHE_MAX_MB = float(os.getenv("INGEST_PAGE_CACHE_MAX_MB", "100"))
+# Finished jobs kept for the status endpoint.
+INGEST_JOBS_KEPT = 50
+
+
+# --- Worker-process side (module-level so they can be pickled) ---
+
+def _inspect_pdf(pdf_path: str) -> Tuple[int, str]:
+    """Page count and sha256 of the file, which keys its page cache."""
+    from pypdf import PdfReader
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return len(PdfReader(pdf_path).pages), h.hexdigest()
+
+
+def _extract_pages(pdf_path: str, page_numbers: List[int], cache_dir: str) -> Tuple[List[Tuple[int, str]], int]:
+    """Text of the given pages, reusing cached text for pages already seen. Returns (pages, cache hits).
+
+    `cache_dir` is the document's own directory (named by its hash), with one file per page number.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    cache = Path(cache_dir)
+    cache.mkdir(parents=True, exist_ok=True)
+    out, hits = [], 0
+    for n in page_numbers:
+        cached = cache / f"{n}.txt"
+        if cached.exists():
+            text = cached.read_text(encoding="utf-8")
+            hits += 1
+        else:
+            text = reader.pages[n].extract_text() or ""
+            tmp = cached.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, cached)
+        out.append((n, text))
+    return out, hits
+
+
+def _prune_page_cache(cache_dir: Path, max_bytes: int, keep: str):
+    """Delete the least recently ingested documents' pages until the cache fits in `max_bytes`."""
+    docs = []
+    for d in cache_dir.iterdir():
+        if d.is_dir():
+            try:
+                docs.append((d.stat().st_mtime, sum(f.stat().st_size for f in d.iterdir()), d))
+            except OSError:
+                continue
+    total = sum(size for _, size, _ in docs)
+    for _, size, d in sorted(docs, key=lambda item: item[0]):
+        if total <= max_bytes:
+            break
+        if d.name == keep:
+            continue
+        shutil.rmtree(d, ignore_errors=True)
+        total -= size
+
+
+# --- Event-loop side ---
+
+@dataclass
+class IngestJob:
+    id: str
+    filename: str
+    source: str
+    status: str = "queued"  # queued | running | done | failed
+    pages_total: int = 0
+    pages_done: int = 0
+    pages_cached: int = 0
+    catalog_file: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_done": self.pages_done,
+            "pages_cached": self.pages_cached,
+            "progress": round(self.pages_done / self.pages_total, 3) if self.pages_total else 0.0,
+            "catalog_file": self.catalog_file,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestManager:
+    """Runs PDF -> Markdown conversions as background jobs on a process pool.
+
+    Pages are extracted in parallel batches; `activate(catalog_file)` is
+    awaited only once the whole document converted, so a half-done job never
+    becomes the live catalog.
+    """
+
+    def __init__(self, activate: Callable[[str], Awaitable[None]], workers: Optional[int] = None):
+        self._activate = activate
+        self.workers = max(1, workers or INGEST_WORKERS)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        PAGE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: never fork a process that has running threads and an event loop
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self._jobs.get(job_id)
+
+    def recent(self, n: int = 5) -> List[IngestJob]:
+        return list(self._jobs.values())[-n:][::-1]
+
+    def submit_pdf(self, pdf_path: Path, filename: str) -> IngestJob:
+        job = IngestJob(id=uuid.uuid4().hex[:12], filename=filename, source=str(pdf_path))
+        self._jobs[job.id] = job
+        while len(self._jobs) > INGEST_JOBS_KEPT:
+            oldest = next(iter(self._jobs.values()))
+            if oldest.status in ("queued", "running"):
+                break
+            self._jobs.popitem(last=False)
+        task = asyncio.create_task(self._run(job, pdf_path), name=f"ingest-{job.id}")
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        return job
+
+    async def _run(self, job: IngestJob, pdf_path: Path):
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        job.status = "running"
+        start = time.perf_counter()
+        try:
+            job.pages_total, digest = await loop.run_in_executor(pool, _inspect_pdf, str(pdf_path))
+            doc_cache = PAGE_CACHE_DIR / digest
+            batches = [list(range(i, min(i + INGEST_PAGES_PER_TASK, job.pages_total)))
+                       for i in range(0, job.pages_total, INGEST_PAGES_PER_TASK)]
+            futures = [loop.run_in_executor(pool, _extract_pages, str(pdf_path), b, str(doc_cache)) for b in batches]
+            texts: Dict[int, str] = {}
+            for fut in asyncio.as_completed(futures):
+                pages, hits = await fut
+                texts.update(pages)
+                job.pages_done += len(pages)
+                job.pages_cached += hits
+            md_text = "\n\n".join(texts[i] for i in range(job.pages_total)).strip()
+            md_path = pdf_path.with_suffix(".md")
+            await asyncio.to_thread(md_path.write_text, md_text, encoding="utf-8")
+            await asyncio.to_thread(os.utime, doc_cache)  # most recently used, for pruning
+            await asyncio.to_thread(_prune_page_cache, PAGE_CACHE_DIR, int(INGEST_PAGE_CACHE_MAX_MB * 1024 * 1024),
+                                    digest)
+            job.catalog_file = str(md_path.relative_to(ROOT))
+            await self._activate(job.catalog_file)
+            job.status = "done"
+            logger.info("Ingested %s: %s pages (%s cached) in %.1fs", job.filename, job.pages_total,
+                        job.pages_cached, time.perf_counter() - start)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and self._pool is pool:
+                # a worker died (e.g. OOM on a huge PDF); start a fresh pool for the next job
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            job.status = "failed"
+            job.error = str(e) or e.__class__.__name__
+            logger.exception("Ingest job %s (%s) failed: %s", job.id, job.filename, e)
+        finally:
+            job.finished_at = time.time()
+
+    async def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -1,98 +1,149 @@
+import os
+import time
+import signal
 import asyncio
 import logging
+import importlib
 from aiohttp import web
-from telegram import Update
 
 from .config import load_settings
-from .bot import GeminiChat
-from .handlers import BotHandlers
 from .admin import mount_admin_routes
-
-from telegram.ext import Application
+from .metrics import REGISTRY, ERRORS, observe_stage
+from .profiling import LOOP_LAG_MONITOR, LoopLagMonitor
+from .supervisor import WEB_WORKERS, run_supervisor
 
 logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    format="%(asctime)s - " + (f"worker {os.environ['WORKER_INDEX']} - " if os.getenv("WORKER_INDEX") else "")
+           + "%(name)s - %(levelname)s - %(message)s",
     level=logging.INFO,
 )
 logger = logging.getLogger(__name__)
 
+PROCESS_STARTED = time.monotonic()
+
 
 async def async_main():
     cfg = load_settings()
-
-    # Build PTB application
-    application = Application.builder().token(cfg.telegram_token).build()
-
-    # Chat engine (pass API key!)
-    bot_engine = GeminiChat(api_key=cfg.gemini_api_key)
-
-    # Register bot handlers
-    handlers = BotHandlers(chat_engine=bot_engine)
-    handlers.register(application)
+    if WEB_WORKERS > 1 and cfg.worker_index is None:
+        if cfg.mode == "polling":
+            logger.warning("WEB_WORKERS=%s ignored: polling needs a single process", WEB_WORKERS)
+        else:
+            return await run_supervisor(cfg)
+
+    # The HTTP port is bound first so health checks pass within milliseconds of a cold
+    # start; the bot itself (SDK imports, PTB initialize, set_webhook) comes up afterwards.
+    # `/` is liveness (always 200 while the process is up); `/ready` is 503 until the bot runs.
+    runtime = None
+    startup = {"stage": "importing", "ready_after_s": None}
 
     # --- Create aiohttp app (health + admin + Telegram webhook) ---
     web_app = web.Application()
+    monitor = LoopLagMonitor() if LOOP_LAG_MONITOR else None
+    web_app["loop_monitor"] = monitor
 
     async def health(_req):
-        return web.json_response({"status": "ok"})
+        body = {"status": "ok" if runtime is not None else "starting", "stage": startup["stage"],
+                "uptime_s": round(time.monotonic() - PROCESS_STARTED, 1)}
+        if monitor is not None:
+            body["loop"] = monitor.stats()
+        if runtime is not None:
+            body["ready_after_s"] = startup["ready_after_s"]
+            body.update(runtime.stats())
+        return web.json_response(body)
+
+    async def ready(_req):
+        status = 200 if startup["stage"] == "ready" else 503
+        return web.json_response({"ready": status == 200, "stage": startup["stage"]}, status=status)
 
     web_app.router.add_get("/", health)
+    web_app.router.add_get("/ready", ready)
+
+    async def metrics(_req):
+        return web.Response(text=REGISTRY.exposition(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    web_app.router.add_get("/metrics", metrics)
 
     # Mount admin panel routes
     mount_admin_routes(web_app)
 
     # Telegram webhook endpoint: POST /<token>
     async def telegram_webhook(request: web.Request):
+        if startup["stage"] != "ready":
+            # Telegram retries; by then the bot is up
+            return web.Response(status=503, text="starting", headers={"Retry-After": "5"})
+        start = time.perf_counter()
         try:
             data = await request.json()
         except Exception:
+            ERRORS.inc("webhook_parse")
             return web.Response(status=400, text="Invalid JSON")
+        if not isinstance(data, dict) or "update_id" not in data:
+            ERRORS.inc("webhook_parse")
+            return web.Response(status=400, text="Not a Telegram update")
 
-        update = Update.de_json(data, application.bot)
-        await application.process_update(update)
+        try:
+            update = runtime.parse_update(data)
+        except Exception:
+            logger.exception("Failed to parse Telegram update")
+            ERRORS.inc("webhook_parse")
+            return web.Response(status=400, text="Invalid update")
+        observe_stage("webhook_parse", time.perf_counter() - start)
+
+        # Ack immediately; the LLM/TTS pipeline runs in the dispatcher workers.
+        dispatcher = runtime.dispatcher
+        if not dispatcher.submit(update):
+            logger.warning("Update queue full (%s); asking Telegram to retry", dispatcher.max_queue)
+            return web.Response(status=503, text="busy", headers={"Retry-After": "5"})
         return web.Response(text="ok")
 
-    web_app.router.add_post(f"/{cfg.telegram_token}", telegram_webhook)
-
-    # Initialize + start PTB (without its own HTTP server)
-    await application.initialize()
-    await application.start()
-
-    # Set webhook at Telegram so they call our aiohttp route
-    webhook_url = None
-    if cfg.public_base_url:
-        webhook_url = f"{cfg.public_base_url.rstrip('/')}/{cfg.telegram_token}"
-
-    if webhook_url:
-        # drop_pending_updates=True ensures we don't get stale backlog on the first boot
-        await application.bot.set_webhook(url=webhook_url, drop_pending_updates=True)
-        logger.info("Webhook set to %s", webhook_url)
-    else:
-        logger.warning(
-            "PUBLIC_BASE_URL/RENDER_EXTERNAL_URL not set. Telegram will not deliver updates. "
-            "Set it and redeploy (or use MODE=polling locally)."
-        )
+    if cfg.mode != "polling":
+        web_app.router.add_post(f"/{cfg.telegram_token}", telegram_webhook)
 
     # Run aiohttp server (Render expects a single listening process on PORT)
     runner = web.AppRunner(web_app)
     await runner.setup()
-    site = web.TCPSite(runner, host="0.0.0.0", port=cfg.port)
-    logger.info("Starting aiohttp server on 0.0.0.0:%s", cfg.port)
+    # A supervisor's worker is only reached through the supervisor
+    host = "0.0.0.0" if cfg.worker_index is None else "127.0.0.1"
+    site = web.TCPSite(runner, host=host, port=cfg.port)
     await site.start()
+    logger.info("Listening on %s:%s after %.0f ms", host, cfg.port, 1000 * (time.monotonic() - PROCESS_STARTED))
+    if monitor is not None:
+        monitor.start()
+    # SIGTERM (Render, the supervisor) shuts down as gracefully as Ctrl-C: history is flushed, workers stop
+    main_task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, lambda: startup["stage"] != "stopping" and main_task.cancel())
 
-    # Keep running forever
     try:
+        # Heavy imports run off the loop so health checks keep answering meanwhile
+        runtime_module = await asyncio.to_thread(importlib.import_module, f"{__package__}.runtime")
+        startup["stage"] = "initializing"
+        bot_runtime = runtime_module.BotRuntime(cfg)
+        runtime = bot_runtime
+        await bot_runtime.start()
+        startup["stage"] = "ready"
+        startup["ready_after_s"] = round(time.monotonic() - PROCESS_STARTED, 2)
+        logger.info("Bot ready after %.2fs", startup["ready_after_s"])
+
+        # Keep running forever
         while True:
             await asyncio.sleep(3600)
     finally:
         # Graceful shutdown
-        await application.stop()
-        await application.shutdown()
+        startup["stage"] = "stopping"
+        if runtime is not None:
+            await runtime.stop()
+        if monitor is not None:
+            await monitor.stop()
         await runner.cleanup()
 
 
 def main():
-    asyncio.run(async_main())
+    try:
+        asyncio.run(async_main())
+    except asyncio.CancelledError:  # SIGTERM
+        pass
 
 
 if __name__ == "__main__":
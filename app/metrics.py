@@ -0,0 +1,151 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Prometheus text exposition, kept in-process: a few counters and fixed-bucket
+# histograms updated with one bisect and a lock each, and gauges read only at
+# scrape time. Cheap enough to leave on in production.
+
+# Seconds; covers a fast cache hit up to a slow Gemini reply or a hung ffmpeg.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, labels)} {_fmt_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time (nothing to update on the hot path)."""
+
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._fn: Callable[[], float] = lambda: 0
+
+    def set_function(self, fn: Callable[[], float]):
+        self._fn = fn
+
+    def collect(self) -> List[str]:
+        try:
+            value = self._fn()
+        except Exception:
+            value = float("nan")
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last)], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][i] += 1
+            series[1][0] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, (list(counts), total[0])) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _fmt_value(bound)
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labels, le)} {cumulative}")
+            lab = _fmt_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{lab} {total}")
+            lines.append(f"{self.name}_count{lab} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def exposition(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Pipeline stages: webhook_parse, voice_download, transcription, llm_reply, tts, ffmpeg
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "bot_stage_seconds", "Time spent in each stage of handling an update.", ["stage"]))
+# Every Bot API call (sendMessage, sendVoice, editMessageText, getFile, ...), labelled by method
+TELEGRAM_SECONDS = REGISTRY.register(Histogram(
+    "bot_telegram_api_seconds", "Telegram Bot API request latency.", ["method"]))
+ERRORS = REGISTRY.register(Counter(
+    "bot_errors_total", "Errors by where they were caught.", ["where"]))
+FALLBACKS = REGISTRY.register(Counter(
+    "bot_fallbacks_total", "Degraded replies (e.g. MP3 audio instead of a voice note).", ["kind"]))
+ACTIVE_SESSIONS = REGISTRY.register(Gauge(
+    "bot_active_sessions", "Conversations held in memory."))
+UPDATES_IN_FLIGHT = REGISTRY.register(Gauge(
+    "bot_updates_in_flight", "Updates currently being handled by dispatcher workers."))
+UPDATES_QUEUED = REGISTRY.register(Gauge(
+    "bot_updates_queued", "Updates waiting in the dispatcher queue."))
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+
+
+def time_stage(stage: str):
+    """`with time_stage("tts"): ...` records the block's duration under that stage."""
+    return STAGE_SECONDS.time(stage)
@@ -0,0 +1,256 @@
+import os
+import time
+import bisect
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from telegram.request import HTTPXRequest
+
+from .admission import TokenBucket
+from .metrics import ERRORS, TELEGRAM_SECONDS, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Outgoing Bot API calls per second across all chats (Telegram allows about 30).
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "25"))
+# Per-chat pacing: sustained messages per second to one chat, and the burst allowed above it.
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+# Times a call is retried after a 429 (waiting the retry_after Telegram sends back).
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Typing/recording indicators still queued after this many seconds are dropped; they'd be stale.
+CHAT_ACTION_MAX_WAIT = float(os.getenv("CHAT_ACTION_MAX_WAIT", "2"))
+
+# HTTP pool for Bot API calls. Sends are paced by the scheduler, so the pool only
+# has to cover those plus file downloads/uploads; waiting for a free connection
+# is allowed longer than PTB's 1s default so bursts queue instead of failing.
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "32"))
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "10"))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10"))
+TELEGRAM_MEDIA_WRITE_TIMEOUT = float(os.getenv("TELEGRAM_MEDIA_WRITE_TIMEOUT", "30"))
+
+# Lower runs first: new replies, then edits of streamed replies, then chat actions.
+PRIORITY_REPLY = 0
+PRIORITY_EDIT = 1
+PRIORITY_ACTION = 2
+# Chats with a pacing bucket; the least recently used chat's is dropped beyond this.
+OUTBOUND_TRACKED_CHATS = int(os.getenv("OUTBOUND_TRACKED_CHATS", "10000"))
+
+
+def endpoint_priority(endpoint: str) -> Optional[int]:
+    """Scheduling class for a Bot API method; None for calls that aren't paced (getFile, setWebhook, ...)."""
+    if endpoint == "sendChatAction":
+        return PRIORITY_ACTION
+    if endpoint.startswith("edit"):
+        return PRIORITY_EDIT
+    if endpoint.startswith(("send", "copy", "forward")):
+        return PRIORITY_REPLY
+    return None
+
+
+class TimedRequest(HTTPXRequest):
+    """PTB request backend that records the latency of every Bot API call."""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = "file_download" if "/file/bot" in url else url.rsplit("/", 1)[-1]
+        start = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            ERRORS.inc("telegram_api")
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - start, api_method)
+
+
+def build_request(pool_size: int = TELEGRAM_POOL_SIZE) -> TimedRequest:
+    """The pooled, instrumented HTTP client for Bot API calls."""
+    return TimedRequest(
+        connection_pool_size=pool_size,
+        pool_timeout=TELEGRAM_POOL_TIMEOUT,
+        read_timeout=TELEGRAM_READ_TIMEOUT,
+        write_timeout=TELEGRAM_READ_TIMEOUT,
+        connect_timeout=5.0,
+        media_write_timeout=TELEGRAM_MEDIA_WRITE_TIMEOUT,
+    )
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "chat_id", "future", "queued_at")
+
+    def __init__(self, priority: int, seq: int, chat_id, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.future = future
+        self.queued_at = time.perf_counter()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """Paces every outgoing send/edit/chat action through one queue.
+
+    Installed as PTB's rate limiter, so all Bot API calls made by the handlers
+    pass through `process_request`. Waiting calls are released in priority
+    order (replies before edits before chat actions, FIFO within a class),
+    skipping chats that are over their per-chat pace, under a global
+    calls-per-second budget. A 429 pauses the whole queue for the
+    `retry_after` Telegram asks for and the call is retried, so bursts slow
+    down instead of failing. Stale chat actions are dropped.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: float = OUTBOUND_CHAT_BURST, max_retries: int = OUTBOUND_MAX_RETRIES,
+                 action_max_wait: float = CHAT_ACTION_MAX_WAIT):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.action_max_wait = action_max_wait
+        self._global: Optional[TokenBucket] = None
+        self._chats: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+        self.sent = 0
+        self.retried = 0
+        self.dropped_actions = 0
+        self.max_wait = 0.0
+
+    async def initialize(self):
+        if self._task is None:
+            self._global = TokenBucket(self.global_rate, self.global_rate) if self.global_rate > 0 else None
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._release_loop(), name="outbound-scheduler")
+
+    async def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for waiter in self._queue:
+            if not waiter.future.done():
+                waiter.future.set_result(None)  # let the remaining calls through unpaced
+        self._queue.clear()
+
+    # --- scheduling ---
+
+    def _chat_bucket(self, chat_id) -> Optional[TokenBucket]:
+        if chat_id is None or self.chat_rate <= 0:
+            return None
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+            return bucket
+        bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        if len(self._chats) > OUTBOUND_TRACKED_CHATS:
+            self._chats.popitem(last=False)  # least recently used chat; long since refilled
+        return bucket
+
+    def _next_ready(self):
+        """(index of the first waiter whose chat may send now, or None; seconds until one may)."""
+        soonest = float("inf")
+        i = 0
+        while i < len(self._queue):
+            waiter = self._queue[i]
+            if waiter.future.done():  # cancelled or timed out while queued
+                del self._queue[i]
+                continue
+            bucket = self._chat_bucket(waiter.chat_id)
+            wait = bucket.wait_time() if bucket is not None else 0.0
+            if wait <= 0:
+                return i, 0.0
+            soonest = min(soonest, wait)
+            i += 1
+        return None, soonest
+
+    async def _release_loop(self):
+        while True:
+            now = time.monotonic()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            index, soonest = self._next_ready()
+            if index is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), None if soonest == float("inf") else soonest)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if self._global is not None:
+                delay = self._global.wait_time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue  # re-pick: a higher-priority call may have arrived meanwhile
+                self._global.try_take()
+            waiter = self._queue.pop(index)
+            bucket = self._chat_bucket(waiter.chat_id)
+            if bucket is not None:
+                bucket.try_take()
+            waited = time.perf_counter() - waiter.queued_at
+            self.max_wait = max(self.max_wait, waited)
+            observe_stage("outbound_wait", waited)
+            waiter.future.set_result(None)
+
+    async def _turn(self, priority: int, chat_id, timeout: Optional[float] = None) -> bool:
+        """Wait until this call may go out; False if `timeout` passed first (the call is skipped)."""
+        future = asyncio.get_running_loop().create_future()
+        bisect.insort(self._queue, _Waiter(priority, next(self._seq), chat_id, future))
+        self._wake.set()
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def process_request(self, callback: Callable[..., Coroutine[Any, Any, Union[bool, dict, None]]],
+                              args: Any, kwargs: Dict[str, Any], endpoint: str, data: Dict[str, Any],
+                              rate_limit_args: Optional[dict]):
+        priority = endpoint_priority(endpoint)
+        if isinstance(rate_limit_args, dict) and "priority" in rate_limit_args:
+            priority = rate_limit_args["priority"]
+        if priority is None or self._task is None:
+            return await callback(*args, **kwargs)
+
+        chat_id = data.get("chat_id")
+        for attempt in range(self.max_retries + 1):
+            if priority == PRIORITY_ACTION:
+                if not await self._turn(priority, chat_id, self.action_max_wait):
+                    self.dropped_actions += 1
+                    return True  # what sendChatAction returns
+            else:
+                await self._turn(priority, chat_id)
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as e:
+                delay = float(e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after)
+                ERRORS.inc("telegram_429")
+                if attempt >= self.max_retries or priority == PRIORITY_ACTION:
+                    raise
+                self.retried += 1
+                # flood control may be global or per chat; Telegram doesn't say, so hold everything
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning("Telegram flood limit on %s (chat %s); pausing sends for %.1fs", endpoint, chat_id, delay)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "retried_429": self.retried,
+            "dropped_chat_actions": self.dropped_actions,
+            "paused_for_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            "max_wait_ms": round(1000 * self.max_wait, 1),
+            "tracked_chats": len(self._chats),
+        }
@@ -0,0 +1,117 @@
+import os
+import random
+import asyncio
+import logging
+from typing import Optional
+
+from telegram import Bot
+from telegram.error import Conflict, InvalidToken, RetryAfter, TimedOut
+
+from .dispatch import UpdateDispatcher
+from .metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Seconds Telegram holds a getUpdates call open when there is nothing to deliver (long polling).
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", "30"))
+# Max updates fetched per getUpdates call (Telegram caps this at 100).
+POLL_LIMIT = min(100, int(os.getenv("POLL_LIMIT", "100")))
+# Upper bound, in seconds, for the exponential backoff after failed polls.
+POLL_BACKOFF_MAX = float(os.getenv("POLL_BACKOFF_MAX", "30"))
+
+
+def _retry_after_seconds(e: RetryAfter) -> float:
+    value = e.retry_after
+    return float(value.total_seconds() if hasattr(value, "total_seconds") else value)
+
+
+class PollingRunner:
+    """Long-polls getUpdates and feeds each batch to the UpdateDispatcher.
+
+    A batch is handed to the same sharded dispatcher as webhook deliveries, so
+    chats run concurrently while each chat's updates stay in order. The next
+    poll acknowledges the batch (offset = last update_id + 1). When the
+    dispatcher queue is full the runner waits for room instead of dropping
+    updates; Telegram keeps them until we ask again. Failed polls back off
+    exponentially with jitter.
+    """
+
+    def __init__(self, bot: Bot, dispatcher: UpdateDispatcher, timeout: int = POLL_TIMEOUT,
+                 limit: int = POLL_LIMIT, backoff_max: float = POLL_BACKOFF_MAX):
+        self.bot = bot
+        self.dispatcher = dispatcher
+        self.timeout = timeout
+        self.limit = limit
+        self.backoff_max = backoff_max
+        self.offset: Optional[int] = None
+        self.polls = 0
+        self.updates = 0
+        self.errors = 0
+        self.last_batch = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _submit(self, update):
+        while not self.dispatcher.submit(update):
+            await asyncio.sleep(0.05)
+
+    async def _poll_once(self):
+        updates = await self.bot.get_updates(offset=self.offset, limit=self.limit, timeout=self.timeout)
+        self.polls += 1
+        self.last_batch = len(updates)
+        for update in updates:
+            await self._submit(update)
+        if updates:
+            self.updates += len(updates)
+            self.offset = updates[-1].update_id + 1
+
+    async def _run(self):
+        backoff = 0.0
+        while True:
+            try:
+                await self._poll_once()
+                backoff = 0.0
+                continue
+            except asyncio.CancelledError:
+                raise
+            except TimedOut:
+                # the long poll outlived the read timeout; nothing was lost, just ask again
+                continue
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                logger.warning("getUpdates flood-limited; retrying in %.0fs", delay)
+                await asyncio.sleep(delay)
+                continue
+            except InvalidToken:
+                logger.error("Telegram rejected the bot token; polling stopped")
+                raise
+            except Conflict as e:
+                # another instance is polling, or a webhook is still set
+                logger.error("getUpdates conflict: %s", e)
+            except Exception as e:
+                logger.warning("getUpdates failed: %s", e)
+            self.errors += 1
+            ERRORS.inc("get_updates")
+            backoff = min(self.backoff_max, backoff * 2 if backoff else 1.0)
+            await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+
+    async def start(self):
+        if self._task is None:
+            # getUpdates is refused while a webhook is set; pending updates are kept
+            await self.bot.delete_webhook(drop_pending_updates=False)
+            self._task = asyncio.create_task(self._run(), name="telegram-polling")
+            logger.info("Polling for updates (timeout=%ss, limit=%s)", self.timeout, self.limit)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "polls": self.polls,
+            "updates": self.updates,
+            "errors": self.errors,
+            "last_batch": self.last_batch,
+            "offset": self.offset,
+        }
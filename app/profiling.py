@@ -0,0 +1,174 @@
+import io
+import os
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Optional
+
+from .metrics import REGISTRY, Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Watch the event loop for callbacks that block it, and log where it was stuck.
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "true").lower() == "true"
+# Seconds between heartbeats on the loop; each one measures how late it ran.
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+# A heartbeat this late (seconds) counts as a stall; the watchdog thread captures the loop's stack
+# once the loop has been stuck this long.
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+# Stall reports kept for /admin/profile.
+STALL_REPORTS = 20
+# Longest CPU profile /admin/profile/cpu will take, in seconds.
+PROFILE_MAX_SECONDS = 60.0
+# Orderings profile_report accepts: pstats.SortKey values and the older spellings ("cumtime", "ncalls" ...).
+PROFILE_SORT_KEYS = frozenset(k.value for k in pstats.SortKey) | frozenset(pstats.Stats.sort_arg_dict_default)
+
+LOOP_LAG = REGISTRY.register(Histogram(
+    "bot_loop_lag_seconds", "How late event-loop heartbeats ran (time the loop was blocked).",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)))
+LOOP_STALLS = REGISTRY.register(Counter(
+    "bot_loop_stalls_total", "Heartbeats later than LOOP_LAG_THRESHOLD."))
+
+
+def _callback_stack(frame) -> str:
+    """The stack below the event loop's own frames: just the callback that is running."""
+    entries = traceback.extract_stack(frame)
+    for i in range(len(entries) - 1, -1, -1):
+        if entries[i].name == "_run" and entries[i].filename.endswith(os.path.join("asyncio", "events.py")):
+            entries = entries[i + 1:]
+            break
+    return "".join(traceback.format_list(entries))
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag with a heartbeat task, and names the blocking code.
+
+    A watchdog thread checks the time of the last heartbeat; when the loop
+    has been stuck for longer than `threshold`, it reads the loop thread's
+    current frame and logs the stack, so the report shows the callback that
+    is blocking (the SDK call, gTTS, a file read ...) while it is still running.
+    Idle cost is one timer on the loop per `interval` and one thread wake-up
+    per `threshold`.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id = 0
+        self._last_beat = 0.0
+        self._captured_for = 0.0  # heartbeat whose overdue stall already has a stack
+        self.reports: deque = deque(maxlen=STALL_REPORTS)
+        self.samples = 0
+        self.stalls = 0
+        self.max_lag = 0.0
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._beat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            stuck_since = self._last_beat
+            self._last_beat = now
+            self.samples += 1
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG.observe(lag)
+            if lag < self.threshold:
+                continue
+            self.stalls += 1
+            LOOP_STALLS.inc()
+            report = self.reports[-1] if self.reports and self._captured_for == stuck_since else None
+            if report is not None:
+                report["blocked_ms"] = round(1000 * lag)
+            else:  # shorter than the watchdog's granularity: no stack
+                self.reports.append({"at": time.time(), "blocked_ms": round(1000 * lag), "stack": None})
+                logger.warning("Event loop blocked for %.0f ms", 1000 * lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold):
+            beat = self._last_beat
+            if beat == self._captured_for or time.monotonic() - beat < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = _callback_stack(frame)
+            del frame
+            self._captured_for = beat
+            self.reports.append({"at": time.time(), "blocked_ms": None, "stack": stack})
+            logger.warning("Event loop blocked for over %.0f ms, in:\n%s", 1000 * self.threshold, stack)
+
+    def stats(self) -> dict:
+        return {
+            "samples": self.samples,
+            "stalls": self.stalls,
+            "max_lag_ms": round(1000 * self.max_lag, 1),
+            "threshold_ms": round(1000 * self.threshold),
+        }
+
+
+_profiling = threading.Lock()
+
+
+async def cpu_profile(seconds: float) -> Optional[cProfile.Profile]:
+    """Profile the event-loop thread for `seconds`; None if a profile is already running."""
+    if not _profiling.acquire(blocking=False):
+        return None
+    try:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(min(max(seconds, 0.1), PROFILE_MAX_SECONDS))
+        finally:
+            profile.disable()
+        return profile
+    finally:
+        _profiling.release()
+
+
+def profile_report(profile: cProfile.Profile, sort: str = "cumulative", limit: int = 60) -> str:
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def task_dump() -> str:
+    """Every asyncio task with the stack it is suspended in, then every thread's current stack."""
+    out = io.StringIO()
+    tasks = sorted(asyncio.all_tasks(), key=lambda t: t.get_name())
+    out.write(f"# {len(tasks)} asyncio tasks\n\n")
+    for task in tasks:
+        state = "done" if task.done() else "pending"
+        out.write(f"## {task.get_name()} ({state}): {task.get_coro()!r}\n")
+        task.print_stack(limit=20, file=out)
+        out.write("\n")
+    names = {t.ident: t.name for t in threading.enumerate()}
+    frames = sys._current_frames()
+    out.write(f"# {len(frames)} threads\n\n")
+    for ident, frame in sorted(frames.items(), key=lambda item: names.get(item[0], "")):
+        out.write(f"## {names.get(ident, ident)}\n")
+        out.write("".join(traceback.format_stack(frame)))
+        out.write("\n")
+    return out.getvalue()
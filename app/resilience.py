@@ -0,0 +1,309 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+from .metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Seconds one Gemini attempt may take (for a streamed reply: until the first chunk, and between chunks).
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+# Extra attempts after a transient failure (timeout, 429, 5xx, connection error), with jittered backoff.
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", "2"))
+GEMINI_RETRY_BACKOFF = float(os.getenv("GEMINI_RETRY_BACKOFF", "0.5"))
+# Send a duplicate request when one is slower than the recent p95 (non-streamed calls only).
+GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "false").lower() == "true"
+# Consecutive transient failures that open the circuit, and seconds it stays open before a trial call.
+GEMINI_BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+# Successful call latencies kept per call type for the hedging threshold, and the minimum before hedging.
+LATENCY_SAMPLES = 200
+HEDGE_MIN_SAMPLES = 20
+
+TRANSIENT_ERRORS = (
+    OSError,  # includes TimeoutError / ConnectionError and requests' exceptions
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    api_exceptions.DeadlineExceeded,
+)
+
+RETRIES = REGISTRY.register(Counter(
+    "bot_gemini_retries_total", "Gemini attempts retried after a transient failure.", ["call"]))
+HEDGES = REGISTRY.register(Counter(
+    "bot_gemini_hedges_total", "Duplicate Gemini requests sent because the first was slower than p95.", ["call"]))
+SHED = REGISTRY.register(Counter(
+    "bot_gemini_short_circuited_total", "Gemini calls refused without trying because the circuit was open.", ["call"]))
+BREAKER_STATE = REGISTRY.register(Gauge(
+    "bot_gemini_breaker_state", "Gemini circuit breaker: 0 closed, 1 half-open, 2 open."))
+
+OUTAGE_MESSAGES = {
+    "en": "I'm having trouble reaching my brain right now. Please try again in a minute. 🙏",
+    "bn": "এই মুহূর্তে আমি উত্তর দিতে পারছি না। অনুগ্রহ করে এক মিনিট পরে আবার চেষ্টা করুন। 🙏",
+    "hi": "अभी मैं जवाब नहीं दे पा रहा हूँ। कृपया एक मिनट बाद फिर से कोशिश करें। 🙏",
+    "ar": "لا أستطيع الرد الآن. يرجى المحاولة مرة أخرى بعد دقيقة. 🙏",
+}
+
+
+def outage_message(lang_code: str) -> str:
+    return OUTAGE_MESSAGES.get(lang_code, OUTAGE_MESSAGES["en"])
+
+
+class GeminiUnavailable(Exception):
+    """Raised instead of calling Gemini while the circuit breaker is open."""
+
+
+def is_transient(exc: BaseException) -> bool:
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+def _abandonable(fut: asyncio.Future) -> asyncio.Future:
+    """Mark the error of an attempt that may be given up on (timed out, lost a hedge) as handled."""
+    fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return fut
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive transient failures; after `cooldown`
+    seconds one trial call is let through (half-open), and its outcome closes
+    or re-opens the circuit."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failures: int = GEMINI_BREAKER_FAILURES, cooldown: float = GEMINI_BREAKER_COOLDOWN,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = max(1, failures)
+        self.cooldown = cooldown
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._open = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if not self._open:
+            return self.CLOSED
+        return self.HALF_OPEN if self.clock() - self.opened_at >= self.cooldown else self.OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            if not self._open:
+                return True
+            if self.clock() - self.opened_at < self.cooldown or self._trial:
+                return False
+            self._trial = True  # this caller is the half-open probe
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive = 0
+            if self._open:
+                logger.info("Gemini circuit closed")
+            self._open = self._trial = False
+
+    def abandon_trial(self):
+        """The half-open trial ended without an answer (cancelled): stay open for another cooldown."""
+        with self._lock:
+            if self._trial:
+                self._trial = False
+                self.opened_at = self.clock()
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self._trial or (not self._open and self.consecutive >= self.threshold):
+                if not self._trial:
+                    self.times_opened += 1
+                    logger.warning("Gemini circuit open after %s consecutive failures; failing fast for %.0fs",
+                                   self.consecutive, self.cooldown)
+                self._open, self._trial = True, False
+                self.opened_at = self.clock()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self.consecutive, "times_opened": self.times_opened}
+
+
+# One breaker for every call to the Gemini API (chat and transcription share the backend).
+GEMINI_BREAKER = CircuitBreaker()
+BREAKER_STATE.set_function(lambda: {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1}.get(GEMINI_BREAKER.state, 2))
+
+
+class _StreamedCall:
+    """`async for chunk in guard.stream(...)`; the attempt's return value is in `.result` afterwards."""
+
+    def __init__(self, guard: "GeminiGuard", attempt: Callable[[Callable[[str], None]], Any], executor):
+        self._guard = guard
+        self._attempt = attempt
+        self._executor = executor
+        self.result: Any = None
+
+    async def __aiter__(self):
+        guard, loop = self._guard, asyncio.get_running_loop()
+        for n in guard._attempts():
+            chunks: asyncio.Queue = asyncio.Queue()
+            emit = lambda text, q=chunks: loop.call_soon_threadsafe(q.put_nowait, text)
+            fut = _abandonable(loop.run_in_executor(self._executor, self._attempt, emit))
+            # runs after every emit() callback already queued by the worker thread
+            fut.add_done_callback(lambda _, q=chunks: q.put_nowait(None))
+            streamed = False
+            try:
+                while True:
+                    text = await asyncio.wait_for(chunks.get(), guard.timeout)
+                    if text is None:
+                        break
+                    streamed = True
+                    yield text
+                self.result = await fut
+            except Exception as e:
+                # text already shown can't be taken back, so only a failure before the first chunk is retried
+                await guard._failed(e, n, retry=not streamed)
+                continue
+            except BaseException:  # cancelled, or the consumer stopped iterating
+                if streamed:
+                    guard.breaker.record_success()
+                else:
+                    guard.breaker.abandon_trial()
+                raise
+            guard.breaker.record_success()
+            return
+
+
+class GeminiGuard:
+    """Deadlines, retries, hedging and the circuit breaker for one kind of Gemini call.
+
+    Attempts are blocking callables run on the caller's executor, and must be
+    safe to run more than once (each builds its own request state): a timed-out
+    attempt is abandoned, not killed, and its result is ignored.
+    """
+
+    def __init__(self, name: str, timeout: float = GEMINI_TIMEOUT, retries: int = GEMINI_RETRIES,
+                 backoff: float = GEMINI_RETRY_BACKOFF, hedge: bool = GEMINI_HEDGE,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.timeout = timeout
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.hedge = hedge
+        self.breaker = breaker or GEMINI_BREAKER
+        self._latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.short_circuited = 0
+
+    @property
+    def request_options(self) -> Dict[str, Any]:
+        """For the SDK call: the same deadline, and no retries of its own (it retries 503s for up to 10 min)."""
+        return {"timeout": self.timeout, "retry": None}
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def _attempts(self):
+        """Attempt numbers; raises GeminiUnavailable up front while the circuit is open."""
+        self.calls += 1
+        for n in range(self.retries + 1):
+            if not self.breaker.allow():
+                self.short_circuited += 1
+                SHED.inc(self.name)
+                raise GeminiUnavailable(f"Gemini circuit is {self.breaker.state}")
+            yield n
+
+    async def _failed(self, exc: BaseException, attempt: int, retry: bool = True):
+        """Account for a failed attempt; re-raises unless another attempt should follow."""
+        if isinstance(exc, asyncio.TimeoutError):
+            self.timeouts += 1
+        if not is_transient(exc):
+            # Gemini answered (bad request, blocked or empty reply): it is up, and a half-open trial is over
+            self.breaker.record_success()
+            self.failed += 1
+            raise exc
+        self.breaker.record_failure()
+        if not retry or attempt >= self.retries:
+            self.failed += 1
+            raise exc
+        self.retried += 1
+        RETRIES.inc(self.name)
+        delay = random.uniform(0, self.backoff * 2 ** attempt)  # full jitter
+        logger.warning("Gemini %s attempt %s failed (%s); retrying in %.2fs",
+                       self.name, attempt + 1, exc.__class__.__name__, delay)
+        await asyncio.sleep(delay)
+
+    async def _run_once(self, attempt: Callable[[], Any], executor, hedge: bool) -> Any:
+        loop = asyncio.get_running_loop()
+        first = _abandonable(loop.run_in_executor(executor, attempt))
+        delay = self.hedge_delay() if hedge else None
+        if delay is None or delay >= self.timeout:
+            return await asyncio.wait_for(first, self.timeout)
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+        self.hedged += 1
+        HEDGES.inc(self.name)
+        second = _abandonable(loop.run_in_executor(executor, attempt))
+        pending = {first, second}
+        deadline = loop.time() + self.timeout - delay
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise asyncio.TimeoutError()
+            for fut in done:
+                if fut.exception() is None:
+                    if fut is second:
+                        self.hedge_wins += 1
+                    return fut.result()
+                error = fut.exception()
+        raise error
+
+    async def call(self, attempt: Callable[[], Any], executor, hedge: bool = True) -> Any:
+        """Run `attempt()` on `executor` under the deadline, retry policy and breaker; returns its result."""
+        for n in self._attempts():
+            start = time.perf_counter()
+            try:
+                result = await self._run_once(attempt, executor, hedge)
+            except Exception as e:
+                await self._failed(e, n)
+                continue
+            except BaseException:
+                self.breaker.abandon_trial()
+                raise
+            self._latencies.append(time.perf_counter() - start)
+            self.breaker.record_success()
+            return result
+
+    def stream(self, attempt: Callable[[Callable[[str], None]], Any], executor) -> _StreamedCall:
+        """Like `call` for `attempt(emit)`, which passes text chunks to `emit` as they arrive."""
+        return _StreamedCall(self, attempt, executor)
+
+    def stats(self) -> dict:
+        delay = self.hedge_delay()
+        return {
+            "calls": self.calls,
+            "retried": self.retried,
+            "timeouts": self.timeouts,
+            "failed": self.failed,
+            "short_circuited": self.short_circuited,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_after_ms": round(1000 * delay) if delay is not None else None,
+        }
@@ -0,0 +1,124 @@
+"""The bot itself: PTB application, Gemini chat engine, handlers and update intake.
+
+Importing this module pulls in PTB, google-generativeai and gTTS, which takes
+about a second, so `app.main` loads it in a worker thread after the HTTP port
+is already answering health checks.
+"""
+import os
+import logging
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from .config import Settings
+from .bot import GeminiChat
+from .handlers import BotHandlers
+from .dispatch import UpdateDispatcher
+from .snapshot import SnapshotManager
+from .polling import PollingRunner
+from .outbound import OutboundScheduler, TimedRequest, build_request
+from .metrics import ACTIVE_SESSIONS, UPDATES_IN_FLIGHT, UPDATES_QUEUED
+
+logger = logging.getLogger(__name__)
+
+# Bot API server to talk to instead of api.telegram.org (a self-hosted telegram-bot-api, or the load-test fake).
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "").rstrip("/")
+
+
+class BotRuntime:
+    def __init__(self, cfg: Settings):
+        self.cfg = cfg
+
+        # Build PTB application
+        # Outgoing sends are paced by the scheduler over a pooled, instrumented HTTP client
+        self.outbound = OutboundScheduler()
+        builder = (Application.builder().token(cfg.telegram_token)
+                   .request(build_request())
+                   .get_updates_request(TimedRequest())
+                   .rate_limiter(self.outbound))
+        if TELEGRAM_API_BASE_URL:
+            builder = builder.base_url(f"{TELEGRAM_API_BASE_URL}/bot").base_file_url(f"{TELEGRAM_API_BASE_URL}/file/bot")
+        self.application = builder.build()
+
+        # Persona + catalog, rebuilt in the background when the admin store changes
+        self.knowledge = SnapshotManager()
+
+        # Chat engine (pass API key!)
+        self.bot_engine = GeminiChat(api_key=cfg.gemini_api_key, knowledge=self.knowledge)
+
+        # Register bot handlers
+        self.handlers = BotHandlers(chat_engine=self.bot_engine)
+        self.handlers.register(self.application)
+
+        # Webhook deliveries (or polled batches) are queued here and processed in the background
+        self.dispatcher = UpdateDispatcher(self.application)
+        self.polling: Optional[PollingRunner] = (
+            PollingRunner(self.application.bot, self.dispatcher) if cfg.mode == "polling" else None)
+
+        ACTIVE_SESSIONS.set_function(lambda: len(self.bot_engine.sessions))
+        UPDATES_IN_FLIGHT.set_function(lambda: self.dispatcher.in_flight)
+        UPDATES_QUEUED.set_function(lambda: self.dispatcher.depth)
+
+    def parse_update(self, data: dict) -> Update:
+        return Update.de_json(data, self.application.bot)
+
+    async def start(self):
+        # Initialize + start PTB (without its own HTTP server)
+        await self.application.initialize()
+        await self.application.start()
+        await self.dispatcher.start()
+        self.knowledge.start()
+
+        # Set webhook at Telegram so they call our aiohttp route (or poll for updates ourselves)
+        cfg = self.cfg
+        webhook_url = None
+        if cfg.public_base_url:
+            webhook_url = f"{cfg.public_base_url.rstrip('/')}/{cfg.telegram_token}"
+
+        if self.polling is not None:
+            await self.polling.start()
+        elif not cfg.set_webhook:
+            logger.info("Webhook registration left to worker 0")
+        elif webhook_url:
+            # drop_pending_updates=True ensures we don't get stale backlog on the first boot
+            await self.application.bot.set_webhook(url=webhook_url, drop_pending_updates=True)
+            logger.info("Webhook set to %s", webhook_url)
+        else:
+            logger.warning(
+                "PUBLIC_BASE_URL/RENDER_EXTERNAL_URL not set. Telegram will not deliver updates. "
+                "Set it and redeploy (or use MODE=polling locally)."
+            )
+
+    async def stop(self):
+        if self.polling is not None:
+            await self.polling.stop()
+        await self.knowledge.stop()
+        await self.dispatcher.stop()
+        await self.handlers.coalescer.close()
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
+        self.handlers.transcriber.close()
+        self.bot_engine.close()
+
+    def stats(self) -> dict:
+        snapshot = self.knowledge.current()
+        handlers = self.handlers
+        return {
+            "knowledge": {"version": snapshot.version, "catalog_file": snapshot.catalog_file,
+                          "hash": snapshot.content_hash[:12]},
+            "updates": self.dispatcher.stats(),
+            "sessions": self.bot_engine.sessions.stats(),
+            **({"context_cache": self.bot_engine.context_cache.stats()} if self.bot_engine.context_cache else {}),
+            "voice_cache": handlers.voice_cache.stats(),
+            "ffmpeg": handlers.transcoder.stats(),
+            "transcription": handlers.transcriber.stats(),
+            "gemini": {"breaker": self.bot_engine.guard.breaker.stats(), "chat": self.bot_engine.guard.stats(),
+                       "transcribe": handlers.transcriber.guard.stats()},
+            "admission": handlers.admission.stats(),
+            "coalesce": handlers.coalescer.stats(),
+            "outbound": self.outbound.stats(),
+            "mode": self.cfg.mode,
+            **({"polling": self.polling.stats()} if self.polling is not None else {}),
+        }
@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+# Max live chat sessions; the least recently used one is evicted beyond this.
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "5000"))
+# Seconds a session may sit idle before it is dropped.
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+# User+model exchanges kept per session; older ones are trimmed from the history.
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "20"))
+
+
+def history_size_bytes(history) -> int:
+    """Approximate memory held by a chat history: UTF-8 size of its text parts."""
+    total = 0
+    for content in history or []:
+        parts = content.get("parts", []) if isinstance(content, dict) else getattr(content, "parts", [])
+        for part in parts:
+            if isinstance(part, str):
+                text = part
+            elif isinstance(part, dict):
+                text = part.get("text", "")
+            else:
+                text = getattr(part, "text", "")
+            total += len((text or "").encode("utf-8"))
+    return total
+
+
+@dataclass
+class _Entry:
+    chat: Any
+    last_used: float
+    size_bytes: int = 0
+
+
+class SessionStore:
+    """LRU + idle-TTL store for per-user chat sessions.
+
+    Thread-safe: Gemini turns run on executor threads. Entries are kept in
+    last-used order, so both LRU and TTL eviction only ever look at the front.
+    """
+
+    def __init__(
+        self,
+        max_sessions: Optional[int] = None,
+        idle_ttl: Optional[float] = None,
+        max_turns: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_sessions = max(1, max_sessions or SESSION_MAX_COUNT)
+        self.idle_ttl = idle_ttl if idle_ttl is not None else SESSION_IDLE_TTL
+        self.max_turns = max(1, max_turns or SESSION_MAX_TURNS)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions_lru = 0
+        self.evictions_idle = 0
+        self.trimmed_turns = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size_bytes
+
+    def _expire_idle(self, now: float):
+        if self.idle_ttl <= 0:
+            return
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_ttl:
+                break
+            self._drop(key)
+            self.evictions_idle += 1
+
+    def get(self, key: int):
+        """Return the live session for `key` (refreshing its LRU position) or None."""
+        with self._lock:
+            now = self._clock()
+            self._expire_idle(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.last_used = now
+            self._entries.move_to_end(key)
+            return entry.chat
+
+    def put(self, key: int, chat):
+        with self._lock:
+            now = self._clock()
+            if key in self._entries:
+                self._drop(key)
+            self._expire_idle(now)
+            size = history_size_bytes(getattr(chat, "history", None))
+            self._entries[key] = _Entry(chat=chat, last_used=now, size_bytes=size)
+            self.total_bytes += size
+            while len(self._entries) > self.max_sessions:
+                self._drop(next(iter(self._entries)))
+                self.evictions_lru += 1
+
+    def record_turn(self, key: int):
+        """Apply the turn cap and refresh size accounting after a reply."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            history = getattr(entry.chat, "history", None)
+            if history is not None:
+                limit = 2 * self.max_turns
+                if len(history) > limit:
+                    self.trimmed_turns += (len(history) - limit) // 2
+                    history = history[-limit:]
+                    entry.chat.history = history
+            size = history_size_bytes(history)
+            self.total_bytes += size - entry.size_bytes
+            entry.size_bytes = size
+            entry.last_used = self._clock()
+
+    def pop(self, key: int):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._entries),
+            "max_sessions": self.max_sessions,
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions_lru": self.evictions_lru,
+            "evictions_idle": self.evictions_idle,
+            "trimmed_turns": self.trimmed_turns,
+        }
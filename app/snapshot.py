@@ -0,0 +1,118 @@
+import os
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from .bot import KnowledgeSnapshot, build_snapshot, ROOT
+from .store import STORE, AdminStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for edits made outside this process (the catalog file itself,
+# or the store file written by another worker). Saves through the admin UI apply at once.
+SNAPSHOT_POLL_INTERVAL = float(os.getenv("SNAPSHOT_POLL_INTERVAL", "5"))
+
+
+def _stat_key(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+class SnapshotManager:
+    """Holds the current KnowledgeSnapshot and swaps in a new one when inputs change.
+
+    Readers call `current()` and keep the returned object for the whole turn;
+    rebuilding happens on a worker thread and the swap is a single reference
+    assignment, so turns never see a half-built state.
+    """
+
+    def __init__(self, store: AdminStore = STORE, poll_interval: float = SNAPSHOT_POLL_INTERVAL,
+                 initial: Optional[KnowledgeSnapshot] = None):
+        self.store = store
+        self.poll_interval = poll_interval
+        self._listeners: List[Callable[[KnowledgeSnapshot], None]] = []
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Optional[asyncio.Task] = None
+        self._dirty = False
+        if initial is None:
+            initial, self._fingerprint = self._build(store.saved(), version=1)
+        else:
+            self._fingerprint = None
+        self._current = initial
+        store.subscribe(self._on_store_change)
+
+    def current(self) -> KnowledgeSnapshot:
+        return self._current
+
+    def subscribe(self, callback: Callable[[KnowledgeSnapshot], None]):
+        self._listeners.append(callback)
+
+    def _on_store_change(self, _doc: dict):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # changed before startup; the first refresh picks it up
+        self._dirty = True
+        if self._pending is None or self._pending.done():
+            self._pending = loop.create_task(self._rebuild_while_dirty())
+
+    async def _rebuild_while_dirty(self):
+        # a burst of saves collapses into one rebuild; a save landing mid-rebuild triggers one more
+        while self._dirty:
+            self._dirty = False
+            try:
+                await self.refresh(force=True)
+            except Exception:
+                logger.exception("Snapshot refresh failed")
+
+    def _build(self, doc: dict, version: int):
+        snapshot = build_snapshot(doc, version=version)
+        return snapshot, _stat_key(ROOT / snapshot.catalog_file)
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Rebuild if the catalog changed on disk (or always, with `force`). Returns True when a new snapshot was swapped in."""
+        async with self._lock:
+            current = self._current
+            if not force:
+                fingerprint = await asyncio.to_thread(_stat_key, ROOT / current.catalog_file)
+                if fingerprint == self._fingerprint:
+                    return False
+            # read the store here, on the loop: it isn't thread-safe, and its change listeners expect the loop
+            doc = self.store.saved()
+            snapshot, self._fingerprint = await asyncio.to_thread(self._build, doc, current.version + 1)
+            if snapshot.content_hash == current.content_hash and snapshot.bot_name == current.bot_name:
+                return False
+            self._current = snapshot
+        logger.info("Knowledge snapshot v%s active (catalog=%s, hash=%s)",
+                    snapshot.version, snapshot.catalog_file, snapshot.content_hash[:12])
+        for cb in self._listeners:
+            try:
+                cb(snapshot)
+            except Exception:
+                logger.exception("Snapshot listener failed")
+        return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                # a changed store file notifies _on_store_change, which forces a rebuild
+                if not self.store.revalidate():
+                    await self.refresh()
+            except Exception:
+                logger.exception("Snapshot refresh failed")
+
+    def start(self):
+        if self._task is None and self.poll_interval > 0:
+            self._task = asyncio.create_task(self._watch(), name="snapshot-watch")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,122 @@
+import os
+import json
+import asyncio
+import logging
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+# Override to keep a separate store (e.g. for the offline load test).
+STORE_PATH = Path(os.getenv("ADMIN_STORE_PATH", str(ROOT / "data" / "admin_store.json")))
+
+DEFAULT_STORE = {
+    "bot_name": "Jatri Bookseller Bot",
+    "ai_persona": "You are a helpful, friendly sales assistant for our bookstore campaign. Speak concisely and persuasively.",
+    "catalog_file": "product_data/jatri_books_info.md",
+    "TELEGRAM_TOKEN": "",
+    "GEMINI_API_KEY": "",
+    "PUBLIC_BASE_URL": "",
+    "MODE": "webhook",  # or "polling"
+}
+
+
+class AdminStore:
+    """Single owner of `data/admin_store.json`.
+
+    Reads return a copy of the cached document, re-parsed only when the file's
+    mtime/size changed (one `stat` per read). Writes go to a temp file that is
+    fsynced and `os.replace`d over the original under an asyncio lock, so a
+    crash never leaves a torn file and concurrent saves don't interleave.
+    Subscribers are called with the new document whenever it changes, whether
+    through `save`/`update` or by another process editing the file. Not
+    thread-safe: use it from the event loop (or before it starts), and hand
+    worker threads a copy of the document instead.
+    """
+
+    def __init__(self, path: Path = STORE_PATH, defaults: Optional[dict] = None):
+        self.path = Path(path)
+        self.defaults = dict(DEFAULT_STORE if defaults is None else defaults)
+        self._doc: Optional[dict] = None  # None while the file doesn't exist
+        self._stat_key: Optional[Tuple[int, int]] = None
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        self._listeners: List[Callable[[dict], None]] = []
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.path.stat()
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def _parse(self) -> Optional[dict]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("Could not parse %s (%s); ignoring it", self.path, e)
+            return None
+
+    def revalidate(self) -> bool:
+        """Reload if the file changed on disk; returns True (and notifies) when it did."""
+        key = self._stat()
+        if self._loaded and key == self._stat_key:
+            return False
+        first = not self._loaded
+        self._doc, self._stat_key, self._loaded = self._parse(), key, True
+        if not first:
+            self._notify()
+        return not first
+
+    def get(self) -> dict:
+        """The saved document, or the defaults when nothing has been saved yet."""
+        self.revalidate()
+        return dict(self.defaults if self._doc is None else self._doc)
+
+    def saved(self) -> dict:
+        """Only what is actually on disk ({} when there is no store file), for overlaying env settings."""
+        self.revalidate()
+        return dict(self._doc or {})
+
+    def subscribe(self, callback: Callable[[dict], None]):
+        self._listeners.append(callback)
+
+    def _notify(self):
+        doc = dict(self._doc or {})
+        for cb in self._listeners:
+            try:
+                cb(doc)
+            except Exception:
+                logger.exception("Store listener failed")
+
+    def _write(self, doc: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    async def _save_locked(self, doc: dict):
+        await asyncio.to_thread(self._write, doc)
+        self._doc, self._stat_key, self._loaded = dict(doc), self._stat(), True
+        self._notify()
+
+    async def save(self, doc: dict):
+        async with self._lock:
+            await self._save_locked(doc)
+
+    async def update(self, mutate: Callable[[dict], None]) -> dict:
+        """Read-modify-write under the lock, so concurrent updates don't lose each other's changes."""
+        async with self._lock:
+            doc = self.get()
+            mutate(doc)
+            await self._save_locked(doc)
+            return doc
+
+
+STORE = AdminStore()
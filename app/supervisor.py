@@ -0,0 +1,313 @@
+"""Multi-process mode: a supervisor on PORT in front of WEB_WORKERS bot processes.
+
+Each worker is a full bot (`app.main` with WORKER_INDEX set) listening on a
+private loopback port. The supervisor parses just enough of each webhook
+update to find its chat and forwards the raw body to worker
+`chat_id % WEB_WORKERS`. A chat's updates therefore always reach the same
+process, in order, and the per-user session state in `GeminiChat` stays
+local to it. The admin panel and every other route go to worker 0. Workers
+that exit are restarted with backoff. Until a worker is back, its chats get
+503 and Telegram retries them.
+
+The supervisor itself never imports PTB or the Gemini SDK.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+from .config import Settings
+from .metrics import REGISTRY, Counter
+from .admission import ADMIT_GLOBAL_BURST, ADMIT_GLOBAL_RATE, ADMIT_QUEUE_MAX
+from .voice_cache import VOICE_CACHE_DIR, VOICE_CACHE_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+# Bot processes behind PORT. 1 runs the bot in this process, with no supervisor.
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+# Longest wait, in seconds, between restarts of a worker that keeps exiting. It doubles from 1s
+# and resets once a worker has stayed up for WORKER_STABLE_AFTER.
+WORKER_RESTART_BACKOFF_MAX = float(os.getenv("WORKER_RESTART_BACKOFF_MAX", "30"))
+WORKER_STABLE_AFTER = 60.0
+# Seconds a worker gets to shut down gracefully (flush history etc.) before it is killed.
+WORKER_STOP_TIMEOUT = 20.0
+# Limits meant for the whole bot, not per process: each worker gets 1/WEB_WORKERS of them.
+# OUTBOUND_GLOBAL_RATE's default is repeated here because app.outbound imports PTB.
+SPLIT_LIMITS = {
+    "ADMIT_GLOBAL_RATE": ADMIT_GLOBAL_RATE,
+    "ADMIT_GLOBAL_BURST": ADMIT_GLOBAL_BURST,
+    "ADMIT_QUEUE_MAX": ADMIT_QUEUE_MAX,
+    "OUTBOUND_GLOBAL_RATE": float(os.getenv("OUTBOUND_GLOBAL_RATE", "25")),
+    "VOICE_CACHE_MAX_MB": VOICE_CACHE_MAX_MB,
+}
+# Hop-by-hop and body-framing headers not copied when proxying.
+_SKIP_HEADERS = {"host", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+FORWARDED = REGISTRY.register(Counter(
+    "bot_worker_forwarded_updates_total", "Webhook updates forwarded to each worker.", ["worker"]))
+RESTARTS = REGISTRY.register(Counter(
+    "bot_worker_restarts_total", "Worker processes restarted after exiting.", ["worker"]))
+
+
+def affinity_key(update: dict) -> int:
+    """The chat an update belongs to (the sender's id for chat-less updates such as inline queries)."""
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+        sender = value.get("from") or value.get("user")
+        if isinstance(sender, dict) and "id" in sender:
+            return int(sender["id"])
+    return int(update.get("update_id", 0))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _labelled(line: str, label: str) -> str:
+    name, brace, rest = line.partition("{")
+    if brace:
+        return f"{name}{{{label},{rest}" if not rest.startswith("}") else f"{name}{{{label}{rest}"
+    name, _, value = line.partition(" ")
+    return f"{name}{{{label}}} {value}"
+
+
+def merge_expositions(sources: List[Tuple[Optional[str], str]]) -> str:
+    """One Prometheus exposition from several; samples from worker `i` get a `worker="i"` label."""
+    families: Dict[str, dict] = {}
+    for worker, text in sources:
+        family = None
+        for line in text.splitlines():
+            if not line:
+                continue
+            if line.startswith("# "):
+                parts = line.split(" ", 3)
+                family = families.setdefault(parts[2], {"meta": {}, "samples": []})
+                family["meta"].setdefault(parts[1], line)
+                continue
+            if family is not None:
+                family["samples"].append(_labelled(line, f'worker="{worker}"') if worker is not None else line)
+    lines: List[str] = []
+    for family in families.values():
+        lines.extend(family["meta"].values())
+        lines.extend(family["samples"])
+    return "\n".join(lines) + "\n"
+
+
+class Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.port = 0
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.ready = False
+        self.started_at = 0.0
+        self.starts = 0
+        self.forwarded = 0
+
+    @property
+    def base(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def stats(self) -> dict:
+        return {
+            "pid": self.proc.pid if self.proc is not None else None,
+            "ready": self.ready,
+            "restarts": max(0, self.starts - 1),
+            "forwarded": self.forwarded,
+            "uptime_s": round(time.monotonic() - self.started_at, 1) if self.proc is not None else None,
+        }
+
+
+class Supervisor:
+    def __init__(self, cfg: Settings, workers: int = WEB_WORKERS, command: Optional[List[str]] = None):
+        self.cfg = cfg
+        self.workers = [Worker(i) for i in range(max(1, workers))]
+        # Workers run the same entry point as this process (app.main, or a wrapper such as the load test's)
+        main_spec = getattr(sys.modules["__main__"], "__spec__", None)
+        self.command = command or [sys.executable, "-m", main_spec.name if main_spec else "app.main"]
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    def _env(self, worker: Worker) -> dict:
+        n = len(self.workers)
+        env = dict(os.environ, WORKER_INDEX=str(worker.index), PORT=str(worker.port), WEB_WORKERS="1",
+                   # only worker 0's first start registers the webhook (set_webhook drops pending updates)
+                   SET_WEBHOOK="true" if worker.index == 0 and worker.starts == 1 else "false")
+        for key, value in SPLIT_LIMITS.items():
+            env[key] = str(value / n if isinstance(value, float) else max(1, value // n))
+        dedup_path = os.getenv("UPDATE_DEDUP_PATH", "").strip()
+        if dedup_path:
+            env["UPDATE_DEDUP_PATH"] = f"{dedup_path}.{worker.index}"
+        # each worker's voice cache indexes and evicts only its own files, within its share of the budget
+        env["VOICE_CACHE_DIR"] = os.path.join(VOICE_CACHE_DIR, f"w{worker.index}")
+        return env
+
+    async def _wait_ready(self, worker: Worker, proc):
+        while proc.returncode is None:
+            try:
+                async with self._session.get(worker.base + "/ready") as r:
+                    if r.status == 200:
+                        worker.ready = True
+                        logger.info("Worker %s ready (pid %s, port %s)", worker.index, proc.pid, worker.port)
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+
+    async def _run(self, worker: Worker):
+        backoff = 1.0
+        while not self._stopping:
+            worker.port = _free_port()
+            worker.starts += 1
+            worker.started_at = time.monotonic()
+            proc = worker.proc = await asyncio.create_subprocess_exec(*self.command, env=self._env(worker))
+            ready = asyncio.create_task(self._wait_ready(worker, proc))
+            rc = await proc.wait()
+            worker.ready = False
+            ready.cancel()
+            if self._stopping:
+                return
+            if time.monotonic() - worker.started_at >= WORKER_STABLE_AFTER:
+                backoff = 1.0
+            logger.error("Worker %s (pid %s) exited with %s; restarting in %.0fs", worker.index, proc.pid, rc, backoff)
+            RESTARTS.inc(str(worker.index))
+            await asyncio.sleep(backoff)
+            backoff = min(2 * backoff, WORKER_RESTART_BACKOFF_MAX)
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=5),
+                                              connector=aiohttp.TCPConnector(limit=0), auto_decompress=False)
+        self._tasks = [asyncio.create_task(self._run(w)) for w in self.workers]
+
+    async def stop(self):
+        self._stopping = True
+        procs = [w.proc for w in self.workers if w.proc is not None and w.proc.returncode is None]
+        for proc in procs:
+            proc.send_signal(signal.SIGTERM)
+        try:
+            await asyncio.wait_for(asyncio.gather(*(p.wait() for p in procs)), WORKER_STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            for proc in procs:
+                if proc.returncode is None:
+                    logger.warning("Worker pid %s did not stop in %.0fs; killing it", proc.pid, WORKER_STOP_TIMEOUT)
+                    proc.kill()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+
+    @property
+    def ready(self) -> bool:
+        return all(w.ready for w in self.workers)
+
+    def worker_for(self, update: dict) -> Worker:
+        return self.workers[affinity_key(update) % len(self.workers)]
+
+    async def forward_update(self, request: web.Request) -> web.Response:
+        body = await request.read()
+        try:
+            update = json.loads(body)
+            worker = self.worker_for(update)
+        except (ValueError, TypeError, AttributeError):
+            return web.Response(status=400, text="Invalid JSON")
+        if not worker.ready:
+            return web.Response(status=503, text="worker restarting", headers={"Retry-After": "5"})
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in _SKIP_HEADERS}
+        try:
+            async with self._session.post(worker.base + request.path, data=body, headers=headers) as r:
+                text = await r.text()
+                status, retry_after = r.status, r.headers.get("Retry-After")
+        except aiohttp.ClientError:
+            return web.Response(status=503, text="worker unavailable", headers={"Retry-After": "5"})
+        worker.forwarded += 1
+        FORWARDED.inc(str(worker.index))
+        return web.Response(status=status, text=text, headers={"Retry-After": retry_after} if retry_after else None)
+
+    async def proxy(self, request: web.Request) -> web.StreamResponse:
+        """Everything else (admin panel, uploads, profiling) is served by worker 0."""
+        worker = self.workers[0]
+        if not worker.ready:
+            return web.Response(status=503, text="worker 0 starting", headers={"Retry-After": "5"})
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in _SKIP_HEADERS}
+        data = request.content if request.body_exists else None  # uploads are streamed through
+        try:
+            async with self._session.request(request.method, worker.base + request.path_qs, data=data,
+                                             headers=headers, allow_redirects=False) as r:
+                body = await r.read()
+                out = {k: v for k, v in r.headers.items() if k.lower() not in _SKIP_HEADERS}
+                return web.Response(status=r.status, body=body, headers=out)
+        except aiohttp.ClientError:
+            return web.Response(status=502, text="worker 0 unavailable")
+
+    async def _worker_get(self, worker: Worker, path: str) -> Any:
+        if not worker.ready:
+            return None
+        try:
+            async with self._session.get(worker.base + path, timeout=aiohttp.ClientTimeout(total=5)) as r:
+                return await (r.json() if path == "/" else r.text())
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+
+    async def health(self, _request: web.Request) -> web.Response:
+        bodies = await asyncio.gather(*(self._worker_get(w, "/") for w in self.workers))
+        return web.json_response({
+            "status": "ok" if self.ready else "starting",
+            "workers": [{"index": w.index, **w.stats(), "stats": body} for w, body in zip(self.workers, bodies)],
+        })
+
+    async def ready_check(self, _request: web.Request) -> web.Response:
+        status = 200 if self.ready else 503
+        return web.json_response({"ready": status == 200, "workers_ready": sum(w.ready for w in self.workers),
+                                  "workers": len(self.workers)}, status=status)
+
+    async def metrics(self, _request: web.Request) -> web.Response:
+        texts = await asyncio.gather(*(self._worker_get(w, "/metrics") for w in self.workers))
+        # this process's own series only (the bot's metric objects exist here too, but stay empty)
+        sources = [(None, "\n".join(FORWARDED.collect() + RESTARTS.collect()))]
+        sources += [(str(w.index), text) for w, text in zip(self.workers, texts) if text]
+        return web.Response(text=merge_expositions(sources), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    def routes(self, app: web.Application):
+        app.router.add_get("/", self.health)
+        app.router.add_get("/ready", self.ready_check)
+        app.router.add_get("/metrics", self.metrics)
+        app.router.add_post(f"/{self.cfg.telegram_token}", self.forward_update)
+        app.router.add_route("*", "/{tail:.*}", self.proxy)
+
+
+async def run_supervisor(cfg: Settings):
+    supervisor = Supervisor(cfg)
+    web_app = web.Application()
+    supervisor.routes(web_app)
+    runner = web.AppRunner(web_app)
+    await runner.setup()
+    await web.TCPSite(runner, host="0.0.0.0", port=cfg.port).start()
+    logger.info("Supervisor listening on 0.0.0.0:%s; starting %s workers", cfg.port, len(supervisor.workers))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await supervisor.start()
+        await stop.wait()
+    finally:
+        logger.info("Stopping workers")
+        await supervisor.stop()
+        await runner.cleanup()
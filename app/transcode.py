@@ -0,0 +1,129 @@
+import os
+import time
+import shutil
+import asyncio
+import logging
+from typing import Optional
+
+from .metrics import ERRORS, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Telegram voice bubble encoding; part of the voice cache key so changing it invalidates old entries.
+OPUS_CHANNELS = 1
+OPUS_SAMPLE_RATE = 48000
+OPUS_BITRATE = "64k"
+VOICE_CODEC = f"opus-{OPUS_BITRATE}-{OPUS_SAMPLE_RATE}-{OPUS_CHANNELS}ch"
+
+# Concurrent ffmpeg processes; further conversions wait for a free slot.
+FFMPEG_MAX_PROCS = int(os.getenv("FFMPEG_MAX_PROCS", str(os.cpu_count() or 1)))
+# Seconds before a conversion is considered hung and its ffmpeg process is killed.
+FFMPEG_TIMEOUT = float(os.getenv("FFMPEG_TIMEOUT", "30"))
+
+
+class AsyncTranscoder:
+    """MP3 -> Ogg/Opus through ffmpeg pipes (stdin/stdout), no temp files.
+
+    Conversions run as asyncio subprocesses, at most `max_procs` at once, so
+    the event loop never waits on ffmpeg.
+    """
+
+    def __init__(self, max_procs: Optional[int] = None, timeout: Optional[float] = None):
+        self.max_procs = max(1, max_procs or FFMPEG_MAX_PROCS)
+        self.timeout = timeout or FFMPEG_TIMEOUT
+        self._sem = asyncio.Semaphore(self.max_procs)
+        self._ffmpeg = shutil.which("ffmpeg")
+        self.waiting = 0
+        self.running = 0
+        self.conversions = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self._ffmpeg is not None
+
+    def _command(self):
+        return [
+            self._ffmpeg, "-hide_banner", "-loglevel", "error",
+            "-f", "mp3", "-i", "pipe:0",
+            "-vn",
+            "-ac", str(OPUS_CHANNELS),
+            "-ar", str(OPUS_SAMPLE_RATE),
+            "-c:a", "libopus",
+            "-b:a", OPUS_BITRATE,
+            "-f", "ogg", "pipe:1",
+        ]
+
+    async def mp3_to_ogg_opus(self, mp3_bytes: bytes) -> Optional[bytes]:
+        """Convert MP3 bytes to Opus-in-Ogg. Return None if conversion fails or ffmpeg is missing."""
+        if not mp3_bytes:
+            return None
+        if not self.available:
+            logger.warning("ffmpeg not found; cannot create Telegram voice bubble. Falling back to MP3/audio.")
+            return None
+
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        start = time.perf_counter()
+        proc = None
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *self._command(),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                out, err = await asyncio.wait_for(proc.communicate(mp3_bytes), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self.failures += 1
+                ERRORS.inc("ffmpeg")
+                logger.error("ffmpeg timed out after %.1fs; killed", self.timeout)
+                return None
+            elapsed = time.perf_counter() - start
+            if proc.returncode != 0 or not out:
+                self.failures += 1
+                ERRORS.inc("ffmpeg")
+                logger.error("ffmpeg conversion failed: rc=%s, stderr=%s", proc.returncode, err.decode(errors="ignore"))
+                return None
+            self.conversions += 1
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+            observe_stage("ffmpeg", elapsed)
+            logger.info("ffmpeg: %s bytes mp3 -> %s bytes ogg in %.0f ms", len(mp3_bytes), len(out), elapsed * 1000)
+            return out
+        except OSError as e:
+            self.failures += 1
+            ERRORS.inc("ffmpeg")
+            logger.error("Could not start ffmpeg: %s", e)
+            return None
+        finally:
+            if proc is not None and proc.returncode is None:
+                # timed out or cancelled: don't leave a hung ffmpeg behind
+                try:
+                    proc.kill()
+                except ProcessLookupError:
+                    pass
+                await proc.wait()
+            self.running -= 1
+            self._sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_procs": self.max_procs,
+            "running": self.running,
+            "waiting": self.waiting,
+            "conversions": self.conversions,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "avg_ms": round(1000 * self.total_seconds / self.conversions, 1) if self.conversions else None,
+            "max_ms": round(1000 * self.max_seconds, 1),
+        }
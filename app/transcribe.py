@@ -0,0 +1,140 @@
+import io
+import os
+import asyncio
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import google.generativeai as genai
+
+from .bot import GEMINI_MODEL_NAME
+from .resilience import GeminiGuard, GeminiUnavailable
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_PROMPT = "Transcribe the audio exactly as spoken. Respond with only the transcript text."
+# Clips up to this size are sent inline with the request; larger ones go through the Files API.
+# Gemini caps a whole inline request at 20 MB.
+TRANSCRIBE_INLINE_MAX_BYTES = int(os.getenv("TRANSCRIBE_INLINE_MAX_KB", "15360")) * 1024
+TRANSCRIBE_MAX_CONCURRENCY = int(os.getenv("TRANSCRIBE_MAX_CONCURRENCY", "4"))
+# Transcripts remembered by Telegram file_unique_id.
+TRANSCRIBE_CACHE_SIZE = int(os.getenv("TRANSCRIBE_CACHE_SIZE", "2000"))
+
+
+class TranscriptionService:
+    """Async, deduplicating voice-note transcription via Gemini.
+
+    Short clips go inline (one request, no upload/delete round trips, no temp
+    files); the blocking SDK call runs on a small thread pool. Results are
+    cached by Telegram's `file_unique_id`, and concurrent requests for the
+    same file share one Gemini call, so a redelivered or forwarded voice note
+    is transcribed once.
+    """
+
+    def __init__(self, model=None, max_concurrency: Optional[int] = None,
+                 inline_max_bytes: int = TRANSCRIBE_INLINE_MAX_BYTES, cache_size: int = TRANSCRIBE_CACHE_SIZE,
+                 guard: Optional[GeminiGuard] = None):
+        self._model = model
+        self.guard = guard or GeminiGuard("transcribe")
+        self._model_lock = threading.Lock()
+        self.inline_max_bytes = inline_max_bytes
+        self.cache_size = max(1, cache_size)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency or TRANSCRIBE_MAX_CONCURRENCY),
+                                            thread_name_prefix="transcribe")
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.inline = 0
+        self.uploads = 0
+        self.failures = 0
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+            return self._model
+
+    def _transcribe_once(self, audio: bytes, mime_type: str) -> Optional[str]:
+        model = self._get_model()
+        options = self.guard.request_options
+        if len(audio) <= self.inline_max_bytes:
+            self.inline += 1
+            resp = model.generate_content([TRANSCRIBE_PROMPT, {"mime_type": mime_type, "data": audio}],
+                                          request_options=options)
+        else:
+            self.uploads += 1
+            gfile = genai.upload_file(io.BytesIO(audio), mime_type=mime_type)
+            try:
+                resp = model.generate_content([TRANSCRIBE_PROMPT, gfile], request_options=options)
+            finally:
+                try:
+                    genai.delete_file(gfile.name)
+                except Exception:
+                    pass
+        txt = (resp.text or "").strip()
+        return txt or None
+
+    async def _transcribe(self, audio: bytes, mime_type: str) -> Optional[str]:
+        """None when Gemini fails; GeminiUnavailable propagates so the user gets the outage message."""
+        attempt = functools.partial(self._transcribe_once, audio, mime_type)
+        try:
+            # a hedge would upload a large clip twice, so only inline clips are hedged
+            return await self.guard.call(attempt, self._executor, hedge=len(audio) <= self.inline_max_bytes)
+        except GeminiUnavailable:
+            raise
+        except Exception as e:
+            self.failures += 1
+            logger.exception("Gemini transcription failed: %s", e)
+            return None
+
+    def _remember(self, key: str, text: str):
+        self._cache[key] = text
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def transcribe(self, audio: bytes, mime_type: str, file_unique_id: Optional[str] = None) -> Optional[str]:
+        """Transcript of `audio`, or None if Gemini couldn't produce one (GeminiUnavailable while the circuit is open)."""
+        if not file_unique_id:
+            self.misses += 1
+            return await self._transcribe(audio, mime_type)
+
+        cached = self._cache.get(file_unique_id)
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(file_unique_id)
+            return cached
+        pending = self._in_flight.get(file_unique_id)
+        if pending is not None:
+            self.joined += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        fut = asyncio.ensure_future(self._transcribe(audio, mime_type))
+        self._in_flight[file_unique_id] = fut
+        try:
+            text = await asyncio.shield(fut)
+        finally:
+            self._in_flight.pop(file_unique_id, None)
+        if text:
+            self._remember(file_unique_id, text)
+        return text
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "cached": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "joined_in_flight": self.joined,
+            "inline": self.inline,
+            "uploads": self.uploads,
+            "failures": self.failures,
+        }
@@ -0,0 +1,136 @@
+import io
+import os
+import re
+import time
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from .transcode import AsyncTranscoder, VOICE_CODEC
+from .voice_cache import VoiceCache, voice_cache_key
+from .metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# 'single': one voice note per reply; 'sequence': one note per chunk, each sent as soon as it is ready.
+VOICE_REPLY_MODE = os.getenv("VOICE_REPLY_MODE", "single").strip().lower()
+# gTTS requests in flight at once across all replies.
+TTS_MAX_CONCURRENCY = int(os.getenv("TTS_MAX_CONCURRENCY", "4"))
+# Sentences are packed into chunks of up to this many characters, synthesized in parallel.
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "250"))
+
+# sentence ends in the four supported scripts: . ! ? | Devanagari/Bengali danda | Arabic question mark, full stop
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?।॥؟۔])\s+|\n+")
+
+
+def tts_to_mp3_bytes(text: str, lang_code: str) -> bytes:
+    """Use gTTS to synthesize MP3 into memory."""
+    from gtts import gTTS  # imported on first use; it is not needed to start serving
+
+    buf = io.BytesIO()
+    lc = (lang_code or "en").split("-")[0]
+    gTTS(text=text, lang=lc).write_to_fp(buf)
+    return buf.getvalue()
+
+
+def split_sentences(text: str, max_chars: int = TTS_CHUNK_CHARS) -> List[str]:
+    """Split `text` at sentence ends and pack the sentences into chunks of at most `max_chars`."""
+    chunks: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_SPLIT_RE.split(text or ""):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@dataclass(frozen=True)
+class VoiceClip:
+    data: bytes
+    is_voice: bool  # Ogg/Opus voice note; False means the MP3 audio fallback
+
+
+class VoiceRenderer:
+    """Turns reply text into voice clips with chunked, parallel TTS.
+
+    The reply is split into sentence chunks that are synthesized concurrently
+    (bounded by `max_concurrency` across all replies). In 'single' mode the
+    MP3 chunks are joined (MP3 frames concatenate cleanly) and transcoded
+    once into one voice note; in 'sequence' mode every chunk is transcoded on
+    its own and becomes its own note. Final Ogg/Opus is read from and stored
+    in the voice cache.
+    """
+
+    def __init__(self, transcoder: AsyncTranscoder, cache: Optional[VoiceCache] = None,
+                 tts: Optional[Callable[[str, str], bytes]] = None, mode: str = VOICE_REPLY_MODE,
+                 max_concurrency: Optional[int] = None, chunk_chars: int = TTS_CHUNK_CHARS):
+        self.transcoder = transcoder
+        self.cache = cache
+        self.mode = mode if mode in ("single", "sequence") else "single"
+        self.chunk_chars = chunk_chars
+        self._tts = tts or tts_to_mp3_bytes
+        self._sem = asyncio.Semaphore(max(1, max_concurrency or TTS_MAX_CONCURRENCY))
+
+    async def _synthesize(self, text: str, lang_code: str) -> bytes:
+        async with self._sem:
+            start = time.perf_counter()
+            mp3 = await asyncio.to_thread(self._tts, text, lang_code)
+            observe_stage("tts", time.perf_counter() - start)
+            return mp3
+
+    async def _cached(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.cache.get, key) if self.cache is not None else None
+
+    async def _encode(self, key: str, mp3: bytes) -> VoiceClip:
+        try:
+            ogg = await self.transcoder.mp3_to_ogg_opus(mp3)
+        except Exception as e:
+            logger.exception("ffmpeg conversion error: %s", e)
+            ogg = None
+        if ogg is None:
+            return VoiceClip(mp3, is_voice=False)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, key, ogg)
+        return VoiceClip(ogg, is_voice=True)
+
+    async def _render_whole(self, text: str, lang_code: str) -> VoiceClip:
+        key = voice_cache_key(text, lang_code, VOICE_CODEC)
+        ogg = await self._cached(key)
+        if ogg is not None:
+            return VoiceClip(ogg, is_voice=True)
+        chunks = split_sentences(text, self.chunk_chars)
+        mp3_parts = await asyncio.gather(*(self._synthesize(c, lang_code) for c in chunks))
+        return await self._encode(key, b"".join(mp3_parts))
+
+    async def _render_chunk(self, text: str, lang_code: str) -> VoiceClip:
+        key = voice_cache_key(text, lang_code, VOICE_CODEC)
+        ogg = await self._cached(key)
+        if ogg is not None:
+            return VoiceClip(ogg, is_voice=True)
+        return await self._encode(key, await self._synthesize(text, lang_code))
+
+    def start(self, text: str, lang_code: str) -> List["asyncio.Task[VoiceClip]"]:
+        """Begin rendering in the background; returns the clips' tasks in playback order."""
+        if not text:
+            return []
+        if self.mode == "sequence":
+            return [asyncio.create_task(self._render_chunk(c, lang_code))
+                    for c in split_sentences(text, self.chunk_chars)]
+        return [asyncio.create_task(self._render_whole(text, lang_code))]
@@ -0,0 +1,123 @@
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+VOICE_CACHE_DIR = os.getenv("VOICE_CACHE_DIR", str(ROOT / "data" / "voice_cache"))
+# Disk budget for cached voice notes; least recently used files are deleted beyond it.
+VOICE_CACHE_MAX_MB = float(os.getenv("VOICE_CACHE_MAX_MB", "200"))
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def voice_cache_key(text: str, lang_code: str, codec: str) -> str:
+    """Content address of a rendered reply: normalized text + language + encoder settings."""
+    raw = f"{codec}\0{lang_code}\0{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class VoiceCache:
+    """Size-capped LRU of rendered Ogg/Opus replies on local disk.
+
+    The index (key -> size, in LRU order) lives in memory and is rebuilt from
+    file mtimes on startup; hits bump the file mtime so the order survives a
+    restart. Methods do blocking file I/O: call them via `asyncio.to_thread`.
+    """
+
+    def __init__(self, directory: str = VOICE_CACHE_DIR, max_bytes: Optional[int] = None):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_bytes if max_bytes is not None else VOICE_CACHE_MAX_MB * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.directory.glob("*.ogg"), key=lambda p: p.stat().st_mtime)
+        for p in files:
+            size = p.stat().st_size
+            self._index[p.stem] = size
+            self.total_bytes += size
+        self._evict()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.ogg"
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self.total_bytes -= size
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        if not data or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = None
+        try:
+            # a unique temp file per call: renders run on executor threads and two may finish the same reply
+            with tempfile.NamedTemporaryFile(dir=self.directory, prefix=f"{key}.", suffix=".tmp", delete=False) as f:
+                tmp = f.name
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Could not write voice cache entry %s: %s", key[:12], e)
+            if tmp is not None:
+                Path(tmp).unlink(missing_ok=True)
+            return
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old
+            self._index[key] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,87 @@
+"""Prompt size and reply latency: full catalog dump vs. retrieved sections.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_catalog_prompt --books 300 --per-1k 0.05
+
+The real catalog is replicated into `--books` entries to mimic a large
+uploaded PDF. The fake model charges `--per-1k` seconds per 1000 input
+tokens on top of a fixed base latency, which is roughly how prefill cost
+shows up in Gemini's time-to-first-token.
+"""
+import argparse
+import asyncio
+import re
+import statistics
+import time
+
+from app.bot import AGENT_PERSONA_PROMPT, GeminiChat, load_product_info, make_snapshot
+from app.history import NullHistory
+from app.snapshot import SnapshotManager
+
+from .fakes import FakeModel
+
+QUERIES = [
+    "Hi! Do you have any thriller set in Dhaka?",
+    "Something with a historical twist please",
+    "What about a book on money and budgeting?",
+    "Which one helps with focus and distractions?",
+    "How much for two books?",
+]
+
+
+def synthetic_catalog(books: int) -> str:
+    """Replicate the real entries (renumbered, retitled) until there are `books` of them."""
+    product_info = load_product_info()
+    entries = re.findall(r"(\*\*\d+\. .+?\*\*\n(?:\*.*\n?)+)", product_info)
+    head = product_info.split("## Book List")[0]
+    out = [head, "## Book List\n"]
+    for i in range(books):
+        entry = entries[i % len(entries)]
+        entry = re.sub(r"^\*\*\d+\. (.+?)\*\*", lambda m: f"**{i + 1}. {m.group(1)} Vol. {i // len(entries) + 1}**", entry)
+        out.append(entry)
+    return "\n".join(out)
+
+
+async def _run(catalog: str, retrieval: bool, users: int, base: float, per_1k: float):
+    snapshot = make_snapshot(AGENT_PERSONA_PROMPT, catalog, retrieval=retrieval)
+    system = snapshot.system_instruction
+    model = FakeModel(latency=base, system_instruction=system, latency_per_1k_tokens=per_1k)
+    engine = GeminiChat(api_key="", knowledge=SnapshotManager(initial=snapshot), model=model, history=NullHistory())
+    latencies = []
+
+    async def conversation(uid: int):
+        for q in QUERIES:
+            start = time.perf_counter()
+            await engine.reply_async(uid, q, "en")
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(conversation(u) for u in range(users)))
+    finally:
+        engine.close()
+    return len(system), model.input_tokens / model.calls, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=300)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--base", type=float, default=0.05, help="fixed fake latency per call (s)")
+    parser.add_argument("--per-1k", type=float, default=0.05, help="fake latency per 1000 input tokens (s)")
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.books)
+    print(f"catalog: {args.books} entries, {len(catalog)} chars")
+    print(f"{'mode':>10} {'system chars':>13} {'avg input tok':>14} {'p50 ms':>8} {'p95 ms':>8}")
+    for retrieval in (False, True):
+        system_chars, avg_tokens, lat = asyncio.run(_run(catalog, retrieval, args.users, args.base, args.per_1k))
+        lat.sort()
+        p50 = statistics.median(lat) * 1000
+        p95 = lat[int(0.95 * (len(lat) - 1))] * 1000
+        mode = "retrieval" if retrieval else "full"
+        print(f"{mode:>10} {system_chars:>13} {avg_tokens:>14.0f} {p50:>8.0f} {p95:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""LLM calls and reply delay with and without the per-chat debounce window.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_coalesce --users 20 --turns 3 --windows 0,1,2
+
+Each simulated customer types `--turns` questions, each as a burst of 1-4
+fragments a fraction of a second to `--max-gap` seconds apart, then waits for
+the answer(s) and pauses before the next question. Fragments go through
+`MessageCoalescer` into `GeminiChat` (fake model, no network) exactly as the
+text handler sends them. Reported per window: LLM calls made, calls saved,
+and the delay from a question's last fragment to its final reply.
+"""
+import random
+import asyncio
+import argparse
+import statistics
+import time
+
+from app.bot import AGENT_PERSONA_PROMPT, GeminiChat, load_product_info, make_snapshot
+from app.coalesce import MessageCoalescer
+from app.history import NullHistory
+from app.snapshot import SnapshotManager
+
+from .fakes import FakeModel
+
+FRAGMENTS = ["hi", "any thriller?", "set in Dhaka maybe", "under 500 taka?", "and delivery to Chittagong?"]
+
+
+async def _run(window: float, first_window: float, users: int, turns: int, max_gap: float, latency: float, seed: int):
+    snapshot = make_snapshot(AGENT_PERSONA_PROMPT, load_product_info())
+    model = FakeModel(latency=latency)
+    engine = GeminiChat(api_key="", knowledge=SnapshotManager(initial=snapshot), model=model, history=NullHistory())
+    sent = {u: 0 for u in range(users)}      # fragments each customer has typed
+    answered = {u: 0 for u in range(users)}  # ... and how many of them have been replied to
+    replied = {u: asyncio.Event() for u in range(users)}
+    delays = []
+
+    async def flush(items):
+        uid = items[-1][0]
+        await engine.reply_async(uid, "\n".join(text for _, text in items), "en")
+        answered[uid] += len(items)
+        replied[uid].set()
+
+    coalescer = MessageCoalescer(flush, window=window, first_window=first_window)
+
+    async def customer(uid: int):
+        rng = random.Random(seed * 100003 + uid)  # same typing pattern for every window
+        for _ in range(turns):
+            for i in range(rng.randint(1, 4)):
+                if i:
+                    await asyncio.sleep(rng.uniform(0.1, max_gap))
+                item = (uid, rng.choice(FRAGMENTS))
+                sent[uid] += 1
+                if window > 0:
+                    coalescer.add(uid, item)
+                else:
+                    asyncio.ensure_future(flush([item]))  # no debounce: every message is its own turn
+            sent_last = time.perf_counter()
+            while answered[uid] < sent[uid]:
+                replied[uid].clear()
+                await replied[uid].wait()
+            delays.append(time.perf_counter() - sent_last)
+            await asyncio.sleep(rng.uniform(1.0, 2.0))
+
+    try:
+        await asyncio.gather(*(customer(u) for u in range(users)))
+        await coalescer.close()
+    finally:
+        engine.close()
+    return sum(sent.values()), model.calls, delays
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--windows", default="0,1,2", help="comma-separated COALESCE_WINDOW values (s)")
+    parser.add_argument("--max-gap", type=float, default=1.2, help="longest pause between fragments (s)")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM latency per call (s)")
+    parser.add_argument("--first-window", type=float, help="COALESCE_FIRST_WINDOW (s); defaults to each window")
+    args = parser.parse_args()
+
+    print(f"{'window s':>8} {'messages':>9} {'LLM calls':>10} {'saved':>7} {'delay p50 s':>12} {'delay p95 s':>12}")
+    for window in (float(w) for w in args.windows.split(",")):
+        first_window = window if args.first_window is None else args.first_window
+        messages, calls, delays = asyncio.run(_run(window, first_window, args.users, args.turns, args.max_gap,
+                                                   args.latency, seed=7))
+        delays.sort()
+        p95 = delays[int(0.95 * (len(delays) - 1))]
+        print(f"{window:>8.1f} {messages:>9} {calls:>10} {messages - calls:>7} "
+              f"{statistics.median(delays):>12.2f} {p95:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Reply latency and input tokens with the system instruction sent inline vs. from Gemini's context cache.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_context_cache --books 300 --per-1k 0.05
+
+Uses the full-catalog prompt (CATALOG_RETRIEVAL off), where the system
+instruction is largest, and the real google-generativeai client against the
+fake Gemini REST server from the load test. The fake charges `--per-1k`
+seconds per 1000 input tokens before the first token; tokens read from
+cached content cost a quarter of that (`--cached-share`), which is roughly
+how a cached prefix shows up in Gemini's time-to-first-token.
+"""
+import time
+import asyncio
+import argparse
+import statistics
+
+import app.bot as bot
+from app.bot import AGENT_PERSONA_PROMPT, GeminiChat, make_snapshot
+from app.context_cache import ContextCache
+from app.history import NullHistory
+from app.snapshot import SnapshotManager
+
+from .bench_catalog_prompt import QUERIES, synthetic_catalog
+from .fake_servers import FakeGemini
+from .loadtest import _free_port
+
+
+async def _run(catalog: str, cached: bool, users: int, args):
+    gemini = FakeGemini(latency=args.base, tokens=20, tokens_per_sec=2000, per_1k=args.per_1k,
+                        cached_share=args.cached_share)
+    port = _free_port()
+    await gemini.start(port)
+    bot.GEMINI_API_ENDPOINT = f"http://127.0.0.1:{port}"
+    bot.GEMINI_CONTEXT_CACHE = False  # only the explicit cache below
+    snapshot = make_snapshot(AGENT_PERSONA_PROMPT, catalog, retrieval=False)
+    cache = ContextCache("gemini-1.5-flash-002", min_tokens=0) if cached else None  # caching needs a pinned version
+    engine = GeminiChat(api_key="fake-key", knowledge=SnapshotManager(initial=snapshot), history=NullHistory(),
+                        context_cache=cache)
+    latencies = []
+
+    async def conversation(uid: int):
+        for q in QUERIES:
+            start = time.perf_counter()
+            await engine.reply_async(uid, q, "en")
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        await asyncio.gather(*(conversation(u) for u in range(users)))
+    finally:
+        stats = cache.stats() if cache else {}
+        engine.close()
+        await asyncio.sleep(0.2)  # let the cache delete go out
+        await gemini.stop()
+    turns = len(latencies)
+    return latencies, gemini.input_tokens / turns, gemini.cached_input_tokens / turns, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--books", type=int, default=300)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--base", type=float, default=0.05, help="fixed fake latency per call (s)")
+    parser.add_argument("--per-1k", type=float, default=0.05, help="fake prefill latency per 1000 input tokens (s)")
+    parser.add_argument("--cached-share", type=float, default=0.25, help="cost of a cached token relative to a sent one")
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.books)
+    print(f"catalog: {args.books} entries, {len(catalog)} chars")
+    print(f"{'mode':>7} {'sent tok/turn':>14} {'cached tok/turn':>16} {'p50 ms':>8} {'p95 ms':>8}  cache")
+    for cached in (False, True):
+        lat, sent, from_cache, stats = asyncio.run(_run(catalog, cached, args.users, args))
+        lat.sort()
+        p95 = lat[int(0.95 * (len(lat) - 1))] * 1000
+        mode = "cached" if cached else "inline"
+        extra = f"hits {stats['hits']}, misses {stats['misses']}" if stats else "-"
+        print(f"{mode:>7} {sent:>14.0f} {from_cache:>16.0f} {statistics.median(lat) * 1000:>8.0f} {p95:>8.0f}  {extra}")
+
+
+if __name__ == "__main__":
+    main()
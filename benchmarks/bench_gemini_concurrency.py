@@ -0,0 +1,48 @@
+"""Throughput of GeminiChat.reply_async against a fake model with fixed latency.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_gemini_concurrency --latency 0.2 --requests 64
+
+Each request comes from a different user, so only the executor bound limits
+parallelism. With a blocking `reply` the loop would serialize every call and
+throughput would stay at ~1/latency regardless of the limit.
+"""
+import argparse
+import asyncio
+import time
+
+from app.bot import GeminiChat, build_snapshot
+from app.history import NullHistory
+from app.snapshot import SnapshotManager
+
+from .fakes import FakeModel
+
+
+async def _run(limit: int, requests: int, latency: float) -> float:
+    knowledge = SnapshotManager(initial=build_snapshot({}))
+    engine = GeminiChat(api_key="", knowledge=knowledge, model=FakeModel(latency=latency),
+                        max_concurrency=limit, history=NullHistory())
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(engine.reply_async(uid, "any thriller?", "en") for uid in range(requests)))
+        return time.perf_counter() - start
+    finally:
+        engine.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model latency in seconds")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--limits", default="1,2,4,8,16,32", help="comma separated concurrency limits")
+    args = parser.parse_args()
+
+    print(f"{'limit':>6} {'elapsed s':>10} {'replies/s':>10}")
+    for limit in (int(x) for x in args.limits.split(",")):
+        elapsed = asyncio.run(_run(limit, args.requests, args.latency))
+        print(f"{limit:>6} {elapsed:>10.2f} {args.requests / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
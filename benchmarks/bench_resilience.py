@@ -0,0 +1,104 @@
+"""Gemini deadlines, retries, hedging and the circuit breaker against a misbehaving fake backend.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_resilience --requests 200
+
+Uses the real google-generativeai client against the fake Gemini REST server
+from the load test, with `--users` concurrent conversations. Scenarios:
+
+- stalls: a share of requests hangs for 30s. Without a deadline those turns
+  wait it out; with one they are retried.
+- slow tail: a share of requests takes `--tail` seconds. Hedging sends a
+  duplicate once a call is slower than the recent p95 (after a short,
+  unmeasured warm-up to collect latencies).
+- brown-out: every request fails with 503. Retries alone keep each turn
+  waiting through its backoff; the breaker opens and answers the rest at once.
+"""
+import time
+import asyncio
+import logging
+import argparse
+
+import app.bot as bot
+from app.bot import AGENT_PERSONA_PROMPT, GeminiChat, load_product_info, make_snapshot
+from app.history import NullHistory
+from app.resilience import HEDGE_MIN_SAMPLES, CircuitBreaker, GeminiGuard
+from app.snapshot import SnapshotManager
+
+from .fake_servers import FakeGemini
+from .loadtest import _free_port, percentile
+
+NEVER = 10 ** 9
+
+
+async def _run(fake: dict, guard: dict, requests: int, users: int) -> dict:
+    gemini = FakeGemini(latency=0.1, tokens=10, tokens_per_sec=1000, **fake)
+    port = _free_port()
+    await gemini.start(port)
+    bot.GEMINI_API_ENDPOINT = f"http://127.0.0.1:{port}"
+    bot.GEMINI_CONTEXT_CACHE = False
+    breaker = CircuitBreaker(failures=guard.pop("breaker", NEVER), cooldown=NEVER)
+    chat_guard = GeminiGuard("bench", breaker=breaker, **guard)
+    engine = GeminiChat(api_key="fake-key", knowledge=SnapshotManager(initial=make_snapshot(AGENT_PERSONA_PROMPT, load_product_info())),
+                        history=NullHistory(), max_concurrency=2 * users, guard=chat_guard)
+    latencies, errors = [], 0
+    turns = iter(range(requests))
+
+    async def conversation(uid: int):
+        nonlocal errors
+        for _ in turns:
+            start = time.perf_counter()
+            try:
+                await engine.reply_async(uid, "any thriller?", "en")
+            except Exception:
+                errors += 1  # the handler would send the outage message
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        if chat_guard.hedge:  # warm-up, not measured: hedging starts once it has this many latency samples
+            await asyncio.gather(*(engine.reply_async(u, "hi", "en") for u in range(HEDGE_MIN_SAMPLES)))
+        warm_requests, warm_stalls = gemini.requests, gemini.stalls
+        await asyncio.gather(*(conversation(u) for u in range(users)))
+    finally:
+        engine.close()
+        await gemini.stop()
+    latencies.sort()
+    return {"p50": percentile(latencies, 0.50), "p99": percentile(latencies, 0.99), "max": latencies[-1],
+            "errors": errors, "gemini_requests": gemini.requests - warm_requests, "stalls": gemini.stalls - warm_stalls,
+            **chat_guard.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--tail", type=float, default=1.5, help="latency of the slow share in the tail scenario (s)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)  # one retry warning per attempt otherwise
+
+    scenarios = [
+        ("stalls 3%", {"stall_rate": 0.03, "stall": 30}, [
+            ("no deadline", {"timeout": 600, "retries": 0}),
+            ("deadline 2s + retries", {"timeout": 2, "retries": 2}),
+        ]),
+        ("slow tail 3%", {"stall_rate": 0.03, "stall": args.tail}, [
+            ("no hedging", {"timeout": 10}),
+            ("hedging", {"timeout": 10, "hedge": True}),
+        ]),
+        ("brown-out", {"error_rate": 1.0}, [
+            ("retries only", {"timeout": 2, "retries": 2, "backoff": 0.5}),
+            ("retries + breaker", {"timeout": 2, "retries": 2, "backoff": 0.5, "breaker": 5}),
+        ]),
+    ]
+    print(f"{'scenario':<13} {'policy':<22} {'p50 s':>6} {'p99 s':>6} {'max s':>6} {'errors':>7} {'calls':>6} "
+          f"{'retried':>8} {'hedged':>7} {'short-circ':>10}")
+    for name, fake, policies in scenarios:
+        for label, guard in policies:
+            r = asyncio.run(_run(dict(fake), dict(guard), args.requests, args.users))
+            print(f"{name:<13} {label:<22} {r['p50']:>6.2f} {r['p99']:>6.2f} {r['max']:>6.2f} {r['errors']:>7} "
+                  f"{r['gemini_requests']:>6} {r['retried']:>8} {r['hedged']:>7} {r['short_circuited']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Cold-start timing: how soon the bot answers health checks, and how soon it is ready.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_startup --runs 5
+
+Each run starts `python -m app.main` against the fake Telegram and Gemini
+servers from the load test (with a fresh store, history and voice cache) and
+polls `/` (liveness: the port is bound) and `/ready` (the bot is initialized
+and the webhook is set) until each answers 200. Import times are measured in
+separate fresh interpreters: `app.main` is what runs before the port is bound;
+`app.runtime` (PTB, google-generativeai, gTTS, the handlers) is loaded after.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+import tempfile
+import subprocess
+from pathlib import Path
+
+import aiohttp
+
+from .fake_servers import FakeGemini, FakeTelegram
+from .loadtest import ROOT, TOKEN, VOICE_NOTE, _free_port, _fmt
+
+
+def import_seconds(module: str, runs: int) -> float:
+    """Median wall time of `import <module>` in a fresh interpreter."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], cwd=ROOT, check=True,
+                             capture_output=True, text=True).stdout
+        samples.append(float(out.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+async def _first_200(session: aiohttp.ClientSession, url: str, started: float, proc: subprocess.Popen,
+                     timeout: float) -> float:
+    while time.perf_counter() - started < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"bot exited during startup (rc={proc.returncode})")
+        try:
+            async with session.get(url) as r:
+                if r.status == 200:
+                    return time.perf_counter() - started
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer 200 within {timeout}s")
+
+
+async def cold_start(tg_port: int, gemini_port: int, timeout: float) -> dict:
+    """Start the bot once; seconds until `/` and `/ready` first answer 200."""
+    app_port = _free_port()
+    workdir = Path(tempfile.mkdtemp(prefix="startup-"))
+    env = dict(os.environ,
+               TELEGRAM_TOKEN=TOKEN, GEMINI_API_KEY="fake-key", PORT=str(app_port),
+               PUBLIC_BASE_URL=f"http://127.0.0.1:{app_port}",
+               TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{tg_port}",
+               GEMINI_API_ENDPOINT=f"http://127.0.0.1:{gemini_port}",
+               ADMIN_STORE_PATH=str(workdir / "admin_store.json"),
+               HISTORY_DB_PATH=str(workdir / "history.sqlite3"),
+               VOICE_CACHE_DIR=str(workdir / "voice_cache"))
+    base = f"http://127.0.0.1:{app_port}"
+    with open(workdir / "bot.log", "wb") as log:
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, "-W", "ignore", "-m", "app.main"], cwd=ROOT, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=1)) as session:
+            live = await _first_200(session, base + "/", started, proc, timeout)
+            ready = await _first_200(session, base + "/ready", started, proc, timeout)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return {"live_s": live, "ready_s": ready}
+
+
+async def run(args) -> dict:
+    telegram = FakeTelegram(TOKEN, VOICE_NOTE)
+    gemini = FakeGemini()
+    tg_port, gemini_port = _free_port(), _free_port()
+    await telegram.start(tg_port)
+    await gemini.start(gemini_port)
+    try:
+        starts = [await cold_start(tg_port, gemini_port, args.timeout) for _ in range(args.runs)]
+    finally:
+        await telegram.stop()
+        await gemini.stop()
+    return {
+        "import_main_s": import_seconds("app.main", args.runs),
+        "import_runtime_s": import_seconds("app.runtime", args.runs),
+        "live_s": statistics.median(s["live_s"] for s in starts),
+        "ready_s": statistics.median(s["ready_s"] for s in starts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for each endpoint")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(f"medians over {args.runs} runs (seconds from process spawn / fresh interpreter)")
+    rows = [("import app.main (before the port is bound)", "import_main_s"),
+            ("import app.runtime (loaded in the background)", "import_runtime_s"),
+            ("GET /       first 200 (liveness)", "live_s"),
+            ("GET /ready  first 200 (bot initialized)", "ready_s")]
+    for label, key in rows:
+        print(f"  {label:<48} {_fmt(report[key], 3):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Webhook vs polling throughput, using the load-test harness.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_update_modes --users 50 --duration 15
+
+Both runs use the same fake Telegram/Gemini settings and text-only load with a
+short fake LLM latency and loose concurrency/edit limits, so the numbers reflect how updates get into the
+pipeline rather than how long Gemini takes. Extra arguments are passed to
+`benchmarks.loadtest` (e.g. `--llm-latency 0.5 --voice-share 0.2`).
+"""
+import sys
+import asyncio
+import argparse
+
+from .loadtest import build_parser, run, _fmt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15)
+    args, rest = parser.parse_known_args()
+    base = ["--users", str(args.users), "--duration", str(args.duration),
+            "--voice-share", "0", "--llm-latency", "0.05", "--llm-tps", "2000",
+            "--env", "GEMINI_MAX_CONCURRENCY=64", "--env", "STREAM_EDIT_INTERVAL=0.1"] + rest
+
+    print(f"{'mode':<8} {'replies':>8} {'replies/s':>10} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'peak RSS MB':>12}")
+    for mode in ("webhook", "polling"):
+        report = asyncio.run(run(build_parser().parse_args(base + ["--mode", mode])))
+        text = report["kinds"].get("text", {})
+        print(f"{mode:<8} {text.get('ok', 0):>8} {report['throughput_per_s']:>10.1f} {_fmt(text.get('p50_s'), 3):>7} "
+              f"{_fmt(text.get('p95_s'), 3):>7} {_fmt(text.get('p99_s'), 3):>7} {_fmt(report['rss_mb']['peak'], 1):>12}")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Voice reply latency: sequential gTTS/ffmpeg vs. the pipelined VoiceRenderer.
+
+Run from the repo root:
+
+    python -m benchmarks.bench_voice_pipeline --tts-latency 0.25
+
+The fixture is a set of long replies in the four supported languages. The
+baseline mirrors the old handler: send the text, gTTS the whole reply, run
+ffmpeg, send the voice note. The pipelined path starts chunked, parallel TTS
+before the text goes out. "first audio" is when the first voice note is sent.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.voice import VoiceRenderer
+
+from .fakes import FakeTranscoder, FakeTTS
+
+REPLIES = {
+    "en": (
+        "The Dhaka Cipher is a fantastic read if you love history and puzzles! A historian discovers a hidden "
+        "message in an ancient manuscript and is pulled into a city-wide chase. If you prefer something darker, "
+        "Shadow Over Sundarbans follows a wildlife biologist uncovering mysterious disappearances. And remember, "
+        "if you pick any other book from our campaign list, you can get both for just BDT 750! Would you like a "
+        "self-help pick to pair with it? Small Habits, Big Changes is a wonderful companion for the new year."
+    ),
+    "bn": (
+        "দ্য ঢাকা সাইফার একটি অসাধারণ বই! একজন ইতিহাসবিদ একটি প্রাচীন পাণ্ডুলিপিতে লুকানো বার্তা খুঁজে পান এবং পুরো শহর জুড়ে "
+        "এক রোমাঞ্চকর অভিযানে জড়িয়ে পড়েন। আপনি যদি আরও রহস্যময় কিছু চান, তাহলে শ্যাডো ওভার সুন্দরবনস পড়ে দেখতে পারেন। "
+        "মনে রাখবেন, আমাদের ক্যাম্পেইন তালিকা থেকে যেকোনো দুটি বই মাত্র ৭৫০ টাকায় পাবেন! আপনি কি একটি সেলফ-হেল্প বইও নিতে চান? "
+        "স্মল হ্যাবিটস, বিগ চেঞ্জেস নতুন বছরের জন্য দারুণ একটি সঙ্গী।"
+    ),
+    "hi": (
+        "द ढाका साइफर एक शानदार किताब है! एक इतिहासकार को एक प्राचीन पांडुलिपि में छिपा संदेश मिलता है और वह पूरे शहर में "
+        "एक रोमांचक पीछा में फंस जाता है। अगर आप कुछ और रहस्यमय चाहते हैं, तो शैडो ओवर सुंदरबन्स पढ़ें। याद रखें, हमारी "
+        "अभियान सूची से कोई भी दो किताबें सिर्फ 750 टका में मिलेंगी! क्या आप एक सेल्फ-हेल्प किताब भी लेना चाहेंगे? "
+        "स्मॉल हैबिट्स, बिग चेंजेस नए साल के लिए एक बेहतरीन साथी है।"
+    ),
+    "ar": (
+        "رواية شيفرة دكا قراءة رائعة حقًا! يكتشف مؤرخ رسالة مخفية في مخطوطة قديمة فيجد نفسه في مطاردة عبر المدينة كلها. "
+        "إذا كنت تفضل شيئًا أكثر غموضًا، فجرّب رواية ظلال فوق سونداربانس. وتذكّر أنك تستطيع الحصول على أي كتابين من قائمة "
+        "الحملة مقابل 750 تاكا فقط! هل ترغب أيضًا في كتاب لتطوير الذات؟ كتاب عادات صغيرة وتغييرات كبيرة رفيق رائع للعام الجديد."
+    ),
+}
+
+
+async def _send(delay: float):
+    await asyncio.sleep(delay)
+
+
+async def baseline(text: str, lang: str, tts: FakeTTS, transcoder: FakeTranscoder, send: float):
+    start = time.perf_counter()
+    await _send(send)  # reply_text
+    mp3 = await asyncio.to_thread(tts, text, lang)
+    await transcoder.mp3_to_ogg_opus(mp3)
+    await _send(send)  # reply_voice
+    done = time.perf_counter() - start
+    return done, done
+
+
+async def pipelined(text: str, lang: str, renderer: VoiceRenderer, send: float):
+    start = time.perf_counter()
+    clips = renderer.start(text, lang)
+    await _send(send)  # reply_text
+    first = None
+    for task in clips:
+        await task
+        await _send(send)  # reply_voice
+        first = first or time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def _run(args):
+    rows = []
+    for lang, text in REPLIES.items():
+        tts = FakeTTS(per_request=args.tts_latency)
+        transcoder = FakeTranscoder()
+        _, base = await baseline(text, lang, tts, transcoder, args.send_latency)
+        result = {"lang": lang, "chars": len(text), "baseline": base}
+        for mode in ("single", "sequence"):
+            renderer = VoiceRenderer(transcoder, cache=None, tts=tts, mode=mode, chunk_chars=args.chunk_chars)
+            result[mode] = await pipelined(text, lang, renderer, args.send_latency)
+        rows.append(result)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tts-latency", type=float, default=0.25, help="fake gTTS latency per 100-char request (s)")
+    parser.add_argument("--send-latency", type=float, default=0.08, help="fake Telegram send latency (s)")
+    parser.add_argument("--chunk-chars", type=int, default=250)
+    args = parser.parse_args()
+
+    rows = asyncio.run(_run(args))
+    print(f"{'lang':>4} {'chars':>6} {'baseline s':>11} {'single s':>9} {'seq first s':>12} {'seq done s':>11}")
+    for r in rows:
+        print(f"{r['lang']:>4} {r['chars']:>6} {r['baseline']:>11.2f} {r['single'][1]:>9.2f} "
+              f"{r['sequence'][0]:>12.2f} {r['sequence'][1]:>11.2f}")
+    base = statistics.mean(r["baseline"] for r in rows)
+    single = statistics.mean(r["single"][1] for r in rows)
+    first = statistics.mean(r["sequence"][0] for r in rows)
+    print(f"mean: baseline {base:.2f}s, single {single:.2f}s ({100 * (1 - single / base):.0f}% faster), "
+          f"sequence first note {first:.2f}s ({100 * (1 - first / base):.0f}% faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Updates per second against the number of worker processes (WEB_WORKERS).
+
+Run from the repo root:
+
+    python -m benchmarks.bench_workers --workers 1,2,4 --users 64 --duration 20
+
+Runs `benchmarks.loadtest` once per worker count: the real bot behind the
+supervisor, fed text updates by `--users` chats over the webhook, with fast
+fake Gemini and Telegram servers so the bot's own CPU work (update parsing,
+handlers, the Gemini SDK's request/response handling, outgoing calls) is the
+bottleneck. Pacing, admission limits and streaming edits are turned off.
+`--workers 1` is the plain single-process bot.
+
+The fakes and the load generator run in this process, so leave them a core:
+scaling stops at about `cpu count - 1` workers.
+"""
+import os
+import asyncio
+import argparse
+
+from .loadtest import build_parser, run
+
+UNTHROTTLED = [
+    "OUTBOUND_GLOBAL_RATE=100000", "OUTBOUND_CHAT_RATE=1000", "OUTBOUND_CHAT_BURST=1000",
+    "STREAM_REPLIES=false", "GEMINI_MAX_CONCURRENCY=64",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated WEB_WORKERS values")
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="fake Gemini seconds per reply")
+    args = parser.parse_args()
+
+    print(f"cpu count: {os.cpu_count()}")
+    print(f"{'workers':>7} {'updates/s':>10} {'p50 s':>7} {'p95 s':>7} {'errors':>7} {'rejected':>9}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        lt = build_parser().parse_args([
+            "--users", str(args.users), "--duration", str(args.duration), "--voice-share", "0",
+            "--llm-latency", str(args.llm_latency), "--llm-tokens", "20", "--llm-tps", "100000",
+            *(f"--env={e}" for e in UNTHROTTLED + [f"WEB_WORKERS={workers}"]),
+        ])
+        report = asyncio.run(run(lt))
+        text = report["kinds"].get("text", {})
+        print(f"{workers:>7} {report['throughput_per_s']:>10.1f} {text.get('p50_s') or 0:>7.3f} "
+              f"{text.get('p95_s') or 0:>7.3f} {text.get('errors', 0) + text.get('timeouts', 0):>7} "
+              f"{report['rejected_webhooks']:>9}")
+
+
+if __name__ == "__main__":
+    main()
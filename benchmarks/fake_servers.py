@@ -0,0 +1,277 @@
+"""Local HTTP stand-ins for the Telegram Bot API and the Gemini REST API, used by the load test.
+
+The bot talks to them through its real clients (PTB's HTTPX request and the
+google-generativeai REST transport), pointed here by TELEGRAM_API_BASE_URL and
+GEMINI_API_ENDPOINT.
+"""
+import json
+import time
+import random
+import asyncio
+import itertools
+from typing import Callable, List, Optional
+
+from aiohttp import web
+
+REPLY_PREFIX = "Fake reply"
+END_MARK = "[end]"
+TRANSCRIPT = "Do you have any new thriller books in stock?"
+
+_WORDS = ("books", "offer", "delivery", "thriller", "novel", "discount", "author", "price", "campaign", "reader")
+
+
+async def _start_site(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+class FakeGemini:
+    """`generateContent` / `streamGenerateContent` with configurable latency, errors and output length.
+
+    A reply takes `latency` seconds before the first token, then streams
+    `tokens` tokens at `tokens_per_sec`. Each reply is distinct (numbered) so
+    the bot's voice cache can't short-circuit the TTS path. Requests carrying
+    audio are answered with a fixed transcript.
+
+    `cachedContents` can be created, extended (PATCH ttl), read and deleted.
+    With `per_1k`, every 1000 input tokens add that much time to the first
+    token (prefill); tokens read from cached content cost `cached_share` of it.
+    A `stall_rate` share of requests hangs for `stall` seconds before answering.
+    """
+
+    def __init__(self, latency: float = 0.5, tokens: int = 60, tokens_per_sec: float = 80.0,
+                 error_rate: float = 0.0, seed: int = 1, per_1k: float = 0.0, cached_share: float = 0.25,
+                 stall_rate: float = 0.0, stall: float = 60.0):
+        self.latency = latency
+        self.tokens = tokens
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.per_1k = per_1k
+        self.cached_share = cached_share
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.stalls = 0
+        self.requests = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+        self.cache_calls = {}
+        self._caches = {}  # name -> {"tokens": ..., "expires": epoch seconds}
+        self._rng = random.Random(seed)
+        self._counter = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+
+    @staticmethod
+    def _chunk(text: str, prompt_tokens: int, out_tokens: int, cached_tokens: int = 0) -> dict:
+        usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": out_tokens,
+                 "totalTokenCount": prompt_tokens + out_tokens}
+        if cached_tokens:
+            usage["cachedContentTokenCount"] = cached_tokens
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": usage,
+        }
+
+    @staticmethod
+    def _timestamp(epoch: float) -> str:
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(epoch)) + f".{int(epoch % 1 * 1e6):06d}Z"
+
+    def _cache_json(self, name: str) -> dict:
+        cache = self._caches[name]
+        return {"name": name, "model": cache["model"], "displayName": cache["display_name"],
+                "createTime": self._timestamp(cache["created"]), "updateTime": self._timestamp(cache["updated"]),
+                "expireTime": self._timestamp(cache["expires"]), "usageMetadata": {"totalTokenCount": cache["tokens"]}}
+
+    async def _cached_contents(self, request: web.Request):
+        """create / get / patch (ttl) / delete of `cachedContents`."""
+        name = "cachedContents/" + request.match_info.get("id", "")
+        self.cache_calls[request.method] = self.cache_calls.get(request.method, 0) + 1
+        now = time.time()
+        if request.method == "POST":
+            raw = await request.read()
+            body = json.loads(raw or b"{}")
+            name = f"cachedContents/fake-{next(self._counter)}"
+            ttl = float(str(body.get("ttl", "3600s")).rstrip("s"))
+            self._caches[name] = {"model": body.get("model", ""), "display_name": body.get("displayName", ""),
+                                  "tokens": len(raw) // 4, "created": now, "updated": now, "expires": now + ttl}
+            return web.json_response(self._cache_json(name))
+        if name not in self._caches or self._caches[name]["expires"] < now:
+            self._caches.pop(name, None)
+            return web.json_response({"error": {"code": 404, "message": f"{name} not found", "status": "NOT_FOUND"}},
+                                     status=404)
+        if request.method == "DELETE":
+            del self._caches[name]
+            return web.json_response({})
+        if request.method == "PATCH":
+            body = await request.json()
+            ttl = float(str(body.get("ttl", "3600s")).rstrip("s"))
+            self._caches[name].update(updated=now, expires=now + ttl)
+        return web.json_response(self._cache_json(name))
+
+    def _reply_words(self):
+        n = next(self._counter)
+        words = [REPLY_PREFIX, f"#{n}:"] + [self._rng.choice(_WORDS) for _ in range(max(1, self.tokens - 3))]
+        return [w + " " for w in words] + [END_MARK]
+
+    async def _handle(self, request: web.Request):
+        self.requests += 1
+        raw = await request.read()
+        body = json.loads(raw or b"{}")
+        prompt_tokens = len(raw) // 4
+        cached_tokens = 0
+        if body.get("cachedContent"):
+            cache = self._caches.get(body["cachedContent"])
+            if cache is None or cache["expires"] < time.time():
+                return web.json_response({"error": {"code": 403, "message": "CachedContent not found (or expired)",
+                                                    "status": "PERMISSION_DENIED"}}, status=403)
+            cached_tokens = cache["tokens"]
+        self.input_tokens += prompt_tokens
+        self.cached_input_tokens += cached_tokens
+        prefill = self.per_1k * (prompt_tokens + self.cached_share * cached_tokens) / 1000
+        prompt_tokens += cached_tokens
+        if self._rng.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(self.latency / 2)
+            return web.json_response({"error": {"code": 503, "message": "overloaded (fake)", "status": "UNAVAILABLE"}},
+                                     status=503)
+
+        if self._rng.random() < self.stall_rate:
+            self.stalls += 1
+            await asyncio.sleep(self.stall)
+        has_audio = any("inlineData" in part or "inline_data" in part
+                        for content in body.get("contents", []) for part in content.get("parts", []))
+        await asyncio.sleep(self.latency + prefill)
+        if has_audio:
+            return web.json_response(self._chunk(TRANSCRIPT, prompt_tokens, 12))
+
+        words = self._reply_words()
+        if not request.match_info["call"].startswith("streamGenerateContent"):
+            await asyncio.sleep(len(words) / self.tokens_per_sec)
+            return web.json_response(self._chunk("".join(words), prompt_tokens, len(words), cached_tokens))
+
+        # the REST transport streams a JSON array, one element per chunk
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        await response.write(b"[")
+        step = 8
+        for i in range(0, len(words), step):
+            if i:
+                await asyncio.sleep(step / self.tokens_per_sec)
+            chunk = self._chunk("".join(words[i:i + step]), prompt_tokens, min(step, len(words) - i), cached_tokens)
+            await response.write(((b"," if i else b"") + json.dumps(chunk).encode()))
+        await response.write(b"]")
+        await response.write_eof()
+        return response
+
+    async def start(self, port: int):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post(r"/v1beta/models/{model}:{call}", self._handle)
+        app.router.add_post("/v1beta/cachedContents", self._cached_contents)
+        app.router.add_route("*", "/v1beta/cachedContents/{id}", self._cached_contents)
+        self._runner = await _start_site(app, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class FakeTelegram:
+    """The Bot API methods the bot uses, answering instantly (or after `latency`).
+
+    Every outgoing message is reported to `on_message(chat_id, method, text)`
+    so the load generator can tell when a reply has been delivered. Updates
+    queued with `push_update` are served by long-polling `getUpdates`. With
+    `flood_limit`, sends beyond that many per second (across all chats) get a
+    429 with retry_after, like Telegram's flood control.
+    """
+
+    def __init__(self, token: str, voice_bytes: bytes, latency: float = 0.0,
+                 on_message: Optional[Callable[[int, str, str], None]] = None, flood_limit: float = 0.0):
+        self.token = token
+        self.voice_bytes = voice_bytes
+        self.latency = latency
+        self.flood_limit = flood_limit
+        self.flood_errors = 0
+        self._window = (0, 0)  # (second, sends in it)
+        self.on_message = on_message or (lambda chat_id, method, text: None)
+        self.calls = {}
+        self._message_ids = itertools.count(1)
+        self._updates: List[dict] = []
+        self._arrived = asyncio.Event()
+        self._runner: Optional[web.AppRunner] = None
+
+    def push_update(self, update: dict):
+        self._updates.append(update)
+        self._arrived.set()
+
+    async def _get_updates(self, params) -> List[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def _message(self, chat_id: int, **extra) -> dict:
+        return {"message_id": next(self._message_ids), "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, **extra}
+
+    async def _api(self, request: web.Request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = dict(await request.post()) if request.body_exists else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.flood_limit and method.startswith(("send", "edit")) and method != "sendChatAction":
+            second = int(time.monotonic())
+            count = self._window[1] + 1 if self._window[0] == second else 1
+            self._window = (second, count)
+            if count > self.flood_limit:
+                self.flood_errors += 1
+                return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                          "parameters": {"retry_after": 1}}, status=429)
+
+        result = True
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "LoadTest", "username": "loadtest_bot"}
+        elif method == "getFile":
+            file_id = str(params.get("file_id", "voice"))
+            result = {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.voice_bytes),
+                      "file_path": f"voice/{file_id}.oga"}
+        elif method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            text = str(params.get("text", ""))
+            self.on_message(chat_id, method, text)
+            result = self._message(chat_id, text=text)
+        elif method in ("sendVoice", "sendAudio"):
+            chat_id = int(params.get("chat_id", 0))
+            self.on_message(chat_id, method, "")
+            kind = "voice" if method == "sendVoice" else "audio"
+            result = self._message(chat_id, **{kind: {"file_id": f"out{chat_id}", "file_unique_id": f"out{chat_id}",
+                                                       "duration": 1}})
+        return web.json_response({"ok": True, "result": result})
+
+    async def _file(self, _request: web.Request):
+        self.calls["file_download"] = self.calls.get("file_download", 0) + 1
+        return web.Response(body=self.voice_bytes, content_type="audio/ogg")
+
+    async def start(self, port: int):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post(f"/bot{self.token}/{{method}}", self._api)
+        app.router.add_get(f"/file/bot{self.token}/{{path:.*}}", self._file)
+        self._runner = await _start_site(app, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
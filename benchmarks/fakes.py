@@ -0,0 +1,98 @@
+"""Offline stand-ins for external services, shared by the benchmark scripts."""
+import time
+import asyncio
+from dataclasses import dataclass
+
+
+@dataclass
+class FakeResponse:
+    text: str
+
+
+class FakeChatSession:
+    """Mimics `google.generativeai.ChatSession` with a fixed, blocking latency."""
+
+    def __init__(self, model: "FakeModel", history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream: bool = False, **kwargs):
+        delay = self.model.latency_for(self.history, content)
+        text = self.model.reply_text
+        self.history.append({"role": "user", "parts": [str(content)]})
+        self.history.append({"role": "model", "parts": [text]})
+        self.model.calls += 1
+        if stream:
+            return self._stream(text, delay)
+        time.sleep(delay)
+        return FakeResponse(text=text)
+
+    def _stream(self, text: str, delay: float):
+        # Gemini streams roughly sentence-sized chunks; the first arrives after the prefill share of the latency
+        words = text.split(" ")
+        chunks = [" ".join(words[i:i + 8]) + (" " if i + 8 < len(words) else "") for i in range(0, len(words), 8)]
+        time.sleep(delay * self.model.first_chunk_share)
+        for chunk in chunks:
+            yield FakeResponse(text=chunk)
+            time.sleep(delay * (1 - self.model.first_chunk_share) / len(chunks))
+
+
+class FakeModel:
+    """Mimics `google.generativeai.GenerativeModel` for benchmarks (no network).
+
+    Latency is `latency` plus `latency_per_1k_tokens` for every 1000 input
+    tokens (system instruction + history + message, ~4 chars per token).
+    """
+
+    def __init__(self, latency: float = 0.5, reply_text: str = "The Dhaka Cipher is a fantastic read! 📚",
+                 system_instruction: str = "", latency_per_1k_tokens: float = 0.0, first_chunk_share: float = 0.2):
+        self.latency = latency
+        self.reply_text = reply_text
+        self.system_instruction = system_instruction
+        self.latency_per_1k_tokens = latency_per_1k_tokens
+        self.first_chunk_share = first_chunk_share
+        self.calls = 0
+        self.input_tokens = 0
+
+    def latency_for(self, history, content) -> float:
+        chars = len(self.system_instruction) + len(str(content))
+        chars += sum(len(str(part)) for turn in history for part in turn.get("parts", []))
+        tokens = chars // 4
+        self.input_tokens += tokens
+        return self.latency + self.latency_per_1k_tokens * tokens / 1000
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history=history)
+
+
+class FakeTTS:
+    """Blocking stand-in for gTTS: gTTS fetches ~100-character pieces one request at a time.
+
+    With `sample` (a short real MP3), output is that sample repeated once per
+    ~15 characters of text, so ffmpeg gets audio it can actually decode.
+    """
+
+    def __init__(self, per_request: float = 0.25, bytes_per_char: int = 120, sample: bytes = b""):
+        self.per_request = per_request
+        self.bytes_per_char = bytes_per_char
+        self.sample = sample
+        self.calls = 0
+
+    def __call__(self, text: str, lang_code: str) -> bytes:
+        self.calls += 1
+        time.sleep(self.per_request * (1 + len(text) // 100))
+        if self.sample:
+            return self.sample * (1 + len(text) // 15)
+        return b"\xff\xfb" * (len(text) * self.bytes_per_char // 2)
+
+
+class FakeTranscoder:
+    """Async stand-in for AsyncTranscoder with a fixed cost plus a per-MB cost."""
+
+    def __init__(self, base: float = 0.05, per_mb: float = 0.4):
+        self.base = base
+        self.per_mb = per_mb
+
+    async def mp3_to_ogg_opus(self, mp3_bytes: bytes):
+        await asyncio.sleep(self.base + self.per_mb * len(mp3_bytes) / 1e6)
+        return b"OggS" + mp3_bytes[: len(mp3_bytes) // 2]
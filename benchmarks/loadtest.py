@@ -0,0 +1,387 @@
+"""Offline load test: the real bot (`app.main`) against fake Telegram and Gemini servers.
+
+Run from the repo root:
+
+    python -m benchmarks.loadtest --users 50 --duration 30 --voice-share 0.2
+    python -m benchmarks.loadtest --replay updates.jsonl --json result.json
+    python -m benchmarks.loadtest --mode polling
+
+The bot runs as a subprocess with its own temporary store, history and voice
+cache. Simulated users each keep one message in flight: the update is POSTed
+to the webhook (or, with `--mode polling`, queued on the fake Telegram for the
+bot's getUpdates), and the request completes when the fake Telegram receives the
+full reply (the final streamed edit for text, the voice note for voice).
+Reports p50/p95/p99 latency, throughput, the bot's RSS and per-stage averages
+from its /metrics.
+
+`--replay` takes a JSONL file of Telegram updates (as delivered to a webhook)
+or of simple `{"text": "..."}` / `{"voice": true}` lines; each chat's messages
+are replayed in order, once.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from .fake_servers import FakeGemini, FakeTelegram, REPLY_PREFIX, END_MARK
+
+ROOT = Path(__file__).resolve().parent.parent
+TOKEN = "123456:LOADTEST"
+SAMPLE_TEXTS = [
+    "Hi! Which thriller books do you have?",
+    "What is the price of the Dhaka Cipher?",
+    "Is there any discount on the campaign bundle?",
+    "আপনাদের কাছে নতুন কোন বই আছে?",
+    "क्या आपके पास कोई नई किताब है?",
+    "هل لديكم كتب جديدة؟",
+]
+# Telegram voice notes are Opus-in-Ogg; the fake Gemini only checks that audio is attached.
+VOICE_NOTE = b"OggS" + bytes(16 * 1024)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    rank = max(1, int(-(-q * len(sorted_values) // 1)))  # nearest rank
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@dataclass
+class Pending:
+    kind: str
+    start: float
+    first: Optional[float] = None
+    result: Optional[str] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class Tracker:
+    """Matches the bot's outgoing messages to the request in flight for each chat."""
+
+    def __init__(self):
+        self.pending: Dict[int, Pending] = {}
+        self.results: List[Tuple[str, str, float, Optional[float]]] = []  # kind, result, total, first
+
+    def begin(self, chat_id: int, kind: str) -> Pending:
+        p = self.pending[chat_id] = Pending(kind, time.perf_counter())
+        return p
+
+    def on_message(self, chat_id: int, method: str, text: str):
+        p = self.pending.get(chat_id)
+        if p is None or p.done.is_set():
+            return
+        if p.first is None:
+            p.first = time.perf_counter()
+        if method in ("sendVoice", "sendAudio"):
+            if p.kind == "voice":
+                self._finish(p, "ok" if method == "sendVoice" else "mp3_fallback")
+        elif text and not text.startswith(REPLY_PREFIX):
+            self._finish(p, "error")  # fallback / busy / technical-issue message
+        elif p.kind == "text" and text.endswith(END_MARK):
+            self._finish(p, "ok")
+
+    def _finish(self, p: Pending, result: str):
+        p.result = result
+        p.done.set()
+
+    def record(self, p: Pending, result: Optional[str] = None):
+        end = time.perf_counter()
+        self.results.append((p.kind, result or p.result, end - p.start, (p.first - p.start) if p.first else None))
+
+
+def _make_update(update_id: int, chat_id: int, kind: str, text: str, template: Optional[dict] = None) -> dict:
+    if template is not None:
+        update = json.loads(json.dumps(template))
+        update["update_id"] = update_id
+        return update
+    message = {"message_id": update_id, "date": int(time.time()),
+               "chat": {"id": chat_id, "type": "private"},
+               "from": {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}", "language_code": "en"}}
+    if kind == "voice":
+        message["voice"] = {"file_id": f"v{update_id}", "file_unique_id": f"v{update_id}", "duration": 3,
+                            "mime_type": "audio/ogg", "file_size": len(VOICE_NOTE)}
+    else:
+        message["text"] = text
+    return {"update_id": update_id, "message": message}
+
+
+def load_replay(path: str, users: int) -> Dict[int, List[Tuple[str, str, Optional[dict]]]]:
+    """chat_id -> [(kind, text, update template)] in file order."""
+    scripts: Dict[int, List[Tuple[str, str, Optional[dict]]]] = {}
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(l for l in f if l.strip()):
+            item = json.loads(line)
+            message = item.get("message") if isinstance(item.get("message"), dict) else None
+            if message is not None:
+                chat_id = int(message["chat"]["id"])
+                kind = "voice" if "voice" in message else "text"
+                scripts.setdefault(chat_id, []).append((kind, message.get("text", ""), item))
+            else:
+                chat_id = 1000 + i % users
+                kind = "voice" if item.get("voice") else "text"
+                scripts.setdefault(chat_id, []).append((kind, str(item.get("text") or item.get("body") or ""), None))
+    return scripts
+
+
+class RssSampler:
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def read_mb(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+    async def _run(self):
+        while True:
+            mb = self.read_mb()
+            if mb is not None:
+                self.samples.append(mb)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+def _stage_averages(metrics_text: str) -> Dict[str, dict]:
+    """Per-stage averages from /metrics, summed over workers when the bot runs several."""
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        for suffix, target in (("_sum", sums), ("_count", counts)):
+            if line.startswith(f"bot_stage_seconds{suffix}{{"):
+                labels, value = line.split("{", 1)[1].rsplit("} ", 1)
+                stage = labels.split('stage="', 1)[1].split('"', 1)[0]
+                target[stage] = target.get(stage, 0.0) + float(value)
+    return {stage: {"count": int(counts.get(stage, 0)),
+                    "avg_ms": round(1000 * sums[stage] / counts[stage], 1) if counts.get(stage) else None}
+            for stage in sums}
+
+
+async def _wait_ready(session: aiohttp.ClientSession, url: str, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"bot exited during startup (rc={proc.returncode})")
+        try:
+            async with session.get(url) as r:
+                if r.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("bot did not become ready")
+
+
+async def run(args) -> dict:
+    tracker = Tracker()
+    telegram = FakeTelegram(TOKEN, VOICE_NOTE, latency=args.tg_latency, on_message=tracker.on_message,
+                            flood_limit=args.tg_flood_limit)
+    gemini = FakeGemini(latency=args.llm_latency, tokens=args.llm_tokens, tokens_per_sec=args.llm_tps,
+                        error_rate=args.llm_error_rate)
+    tg_port, gemini_port, app_port = _free_port(), _free_port(), _free_port()
+    await telegram.start(tg_port)
+    await gemini.start(gemini_port)
+
+    workdir = Path(tempfile.mkdtemp(prefix="loadtest-"))
+    env = dict(os.environ,
+               TELEGRAM_TOKEN=TOKEN, GEMINI_API_KEY="fake-key", MODE=args.mode, PORT=str(app_port),
+               PUBLIC_BASE_URL=f"http://127.0.0.1:{app_port}",
+               TELEGRAM_API_BASE_URL=f"http://127.0.0.1:{tg_port}",
+               GEMINI_API_ENDPOINT=f"http://127.0.0.1:{gemini_port}",
+               ADMIN_STORE_PATH=str(workdir / "admin_store.json"),
+               HISTORY_DB_PATH=str(workdir / "history.sqlite3"),
+               VOICE_CACHE_DIR=str(workdir / "voice_cache"),
+               # measure the pipeline, not the rate limits or the debounce window (override with --env)
+               ADMIT_USER_RATE="0", ADMIT_GLOBAL_RATE="0", COALESCE_WINDOW="0",
+               LOADTEST_TTS_LATENCY=str(args.tts_latency),
+               PYTHONUNBUFFERED="1")
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log_path = workdir / "bot.log"
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen([sys.executable, "-m", "benchmarks.loadtest_app"], cwd=ROOT, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+
+    base = f"http://127.0.0.1:{app_port}"
+    rss = RssSampler(proc.pid)
+    rejected = 0
+    update_ids = iter(range(1, 1 << 62))
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=args.timeout)) as session:
+            await _wait_ready(session, base + "/ready", proc)
+            rss_start = rss.read_mb()
+            rss.start()
+
+            if args.replay:
+                scripts = load_replay(args.replay, args.users)
+            else:
+                scripts = {}
+            rng = random.Random(7)
+            deadline = time.perf_counter() + args.duration
+
+            async def user(chat_id: int, script):
+                nonlocal rejected
+                i = 0
+                while True:
+                    if script is not None:
+                        if i >= len(script):
+                            return
+                        kind, text, template = script[i]
+                    else:
+                        if time.perf_counter() >= deadline:
+                            return
+                        kind = "voice" if rng.random() < args.voice_share else "text"
+                        text, template = rng.choice(SAMPLE_TEXTS), None
+                    i += 1
+                    p = tracker.begin(chat_id, kind)
+                    update = _make_update(next(update_ids), chat_id, kind, text, template)
+                    if args.mode == "polling":
+                        telegram.push_update(update)
+                    else:
+                        async with session.post(f"{base}/{TOKEN}", json=update) as r:
+                            status = r.status
+                        if status != 200:
+                            rejected += 1
+                            tracker.pending.pop(chat_id, None)
+                            await asyncio.sleep(1.0)
+                            continue
+                    try:
+                        await asyncio.wait_for(p.done.wait(), args.timeout)
+                        tracker.record(p)
+                    except asyncio.TimeoutError:
+                        tracker.record(p, "timeout")
+                    if args.think:
+                        await asyncio.sleep(rng.expovariate(1 / args.think))
+
+            start = time.perf_counter()
+            if scripts:
+                await asyncio.gather(*(user(chat_id, script) for chat_id, script in scripts.items()))
+            else:
+                await asyncio.gather(*(user(1000 + u, None) for u in range(args.users)))
+            elapsed = time.perf_counter() - start
+            await rss.stop()
+
+            async with session.get(base + "/metrics") as r:
+                stages = _stage_averages(await r.text())
+    finally:
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        await telegram.stop()
+        await gemini.stop()
+
+    report = {"mode": args.mode, "elapsed_s": round(elapsed, 2), "rejected_webhooks": rejected, "kinds": {},
+              "rss_mb": {"start": rss_start, "peak": max(rss.samples, default=None),
+                         "end": rss.samples[-1] if rss.samples else None},
+              "stages": stages, "gemini": {"requests": gemini.requests, "errors": gemini.errors},
+              "telegram_calls": telegram.calls, "telegram_429s": telegram.flood_errors, "log": str(log_path)}
+    completed = 0
+    for kind in ("text", "voice"):
+        rows = [r for r in tracker.results if r[0] == kind]
+        if not rows:
+            continue
+        ok = sorted(total for _, result, total, _ in rows if result in ("ok", "mp3_fallback"))
+        firsts = sorted(first for _, result, _, first in rows if first is not None)
+        completed += len(ok)
+        report["kinds"][kind] = {
+            "sent": len(rows), "ok": len(ok),
+            "mp3_fallback": sum(1 for r in rows if r[1] == "mp3_fallback"),
+            "errors": sum(1 for r in rows if r[1] == "error"),
+            "timeouts": sum(1 for r in rows if r[1] == "timeout"),
+            "p50_s": percentile(ok, 0.50), "p95_s": percentile(ok, 0.95), "p99_s": percentile(ok, 0.99),
+            "first_response_p50_s": percentile(firsts, 0.50),
+        }
+    report["throughput_per_s"] = round(completed / elapsed, 2) if elapsed else 0.0
+    return report
+
+
+def _fmt(v, digits=2):
+    return "-" if v is None else f"{v:.{digits}f}"
+
+
+def print_report(report: dict):
+    print(f"{'kind':<6} {'sent':>6} {'ok':>6} {'err':>5} {'t/o':>5} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'first p50':>10}")
+    for kind, k in report["kinds"].items():
+        print(f"{kind:<6} {k['sent']:>6} {k['ok']:>6} {k['errors']:>5} {k['timeouts']:>5} {_fmt(k['p50_s']):>7} "
+              f"{_fmt(k['p95_s']):>7} {_fmt(k['p99_s']):>7} {_fmt(k['first_response_p50_s']):>10}")
+        if k["mp3_fallback"]:
+            print(f"       ({k['mp3_fallback']} voice replies fell back to MP3)")
+    rss = report["rss_mb"]
+    print(f"throughput: {report['throughput_per_s']} replies/s over {report['elapsed_s']} s; "
+          f"webhook rejections: {report['rejected_webhooks']}")
+    print(f"bot RSS MB: start {_fmt(rss['start'], 1)}, peak {_fmt(rss['peak'], 1)}, end {_fmt(rss['end'], 1)}")
+    if report["stages"]:
+        print("stage averages: " + ", ".join(f"{s} {v['avg_ms']} ms (n={v['count']})"
+                                             for s, v in sorted(report["stages"].items())))
+    print(f"fake gemini: {report['gemini']['requests']} requests, {report['gemini']['errors']} injected errors; "
+          f"fake telegram 429s: {report['telegram_429s']}; bot log: {report['log']}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("webhook", "polling"), default="webhook", help="how the bot receives updates")
+    parser.add_argument("--users", type=int, default=20, help="concurrent simulated users (chats)")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of synthetic load")
+    parser.add_argument("--voice-share", type=float, default=0.2, help="fraction of synthetic messages that are voice")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds a user waits between messages")
+    parser.add_argument("--replay", help="JSONL of Telegram updates or {text|voice} lines to replay instead")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake Gemini seconds to first token")
+    parser.add_argument("--llm-tokens", type=int, default=60, help="fake Gemini output tokens per reply")
+    parser.add_argument("--llm-tps", type=float, default=80.0, help="fake Gemini output tokens per second")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of Gemini calls failing with 503")
+    parser.add_argument("--tg-latency", type=float, default=0.0, help="fake Telegram seconds per API call")
+    parser.add_argument("--tg-flood-limit", type=float, default=0.0,
+                        help="fake Telegram answers 429 above this many sends per second (0: no limit)")
+    parser.add_argument("--tts-latency", type=float, default=0.25, help="fake gTTS seconds per request")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds before a reply counts as timed out")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra env for the bot")
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
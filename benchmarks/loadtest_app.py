@@ -0,0 +1,34 @@
+"""Runs `app.main` for the load test, with gTTS replaced by FakeTTS.
+
+Started by `benchmarks.loadtest` as a subprocess; Telegram and Gemini are
+pointed at the local fakes through TELEGRAM_API_BASE_URL and
+GEMINI_API_ENDPOINT. gTTS has no configurable endpoint, so it is the one piece
+swapped in-process. When ffmpeg is available the fake TTS returns real (silent)
+MP3 so voice notes go through a real transcode.
+"""
+import os
+import shutil
+import subprocess
+
+import app.voice
+from app.main import main
+
+from .fakes import FakeTTS
+
+
+def _silent_mp3() -> bytes:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return b""
+    cmd = [ffmpeg, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "anullsrc=r=24000:cl=mono",
+           "-t", "1", "-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3", "pipe:1"]
+    try:
+        return subprocess.run(cmd, capture_output=True, check=True, timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        return b""
+
+
+if __name__ == "__main__":
+    app.voice.tts_to_mp3_bytes = FakeTTS(per_request=float(os.getenv("LOADTEST_TTS_LATENCY", "0.25")),
+                                         sample=_silent_mp3())
+    main()
@@ -0,0 +1,28 @@
+import asyncio
+
+import app.admission as admission
+from app.admission import REJECT_USER, AdmissionController
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_user_buckets_are_capped_and_evict_the_least_recent(monkeypatch):
+    monkeypatch.setattr(admission, "ADMIT_TRACKED_USERS", 3)
+    gate = AdmissionController(user_rate=0.1, user_burst=1, global_rate=0, clock=Clock())
+
+    async def main():
+        assert await gate.admit(1) is None
+        assert await gate.admit(2) is None
+        assert await gate.admit(3) is None
+        assert await gate.admit(1) == REJECT_USER  # touches user 1, so user 2 is now the oldest
+        assert await gate.admit(4) is None
+
+    asyncio.run(main())
+    assert list(gate._users) == [3, 1, 4]
+    assert gate.stats()["tracked_users"] == 3
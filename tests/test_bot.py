@@ -0,0 +1,23 @@
+import json
+from pathlib import Path
+
+from app.bot import AGENT_PERSONA_PROMPT, build_snapshot
+from app.store import DEFAULT_STORE
+
+SHIPPED_STORE = Path(__file__).resolve().parent.parent / "data" / "admin_store.json"
+
+
+def test_default_store_uses_the_built_in_persona():
+    assert build_snapshot(dict(DEFAULT_STORE), retrieval=False).persona == AGENT_PERSONA_PROMPT
+
+
+def test_shipped_store_uses_the_built_in_persona():
+    store = json.loads(SHIPPED_STORE.read_text(encoding="utf-8"))
+    assert build_snapshot(store, retrieval=False).persona == AGENT_PERSONA_PROMPT
+
+
+def test_admin_persona_replaces_the_built_in_one():
+    store = dict(DEFAULT_STORE, ai_persona="  You are Mira, a poetry shop assistant.  ")
+    snapshot = build_snapshot(store, retrieval=False)
+    assert snapshot.persona == "You are Mira, a poetry shop assistant."
+    assert snapshot.system_instruction.startswith("You are Mira")
@@ -0,0 +1,62 @@
+import asyncio
+
+from app.coalesce import MessageCoalescer
+
+
+def _collect(**kwargs):
+    flushed = []
+
+    async def flush(items):
+        flushed.append(items)
+
+    return flushed, MessageCoalescer(flush, **kwargs)
+
+
+def test_one_burst_is_answered_by_one_flush():
+    async def main():
+        flushed, coalescer = _collect(window=0.1, max_wait=1)
+        coalescer.add("chat", "any thriller?")
+        await asyncio.sleep(0.05)
+        coalescer.add("chat", "under 500?")
+        await asyncio.sleep(0.05)
+        assert flushed == []  # still inside the window
+        await asyncio.sleep(0.1)
+        assert flushed == [["any thriller?", "under 500?"]]
+        await coalescer.close()
+
+    asyncio.run(main())
+
+
+def test_first_window_answers_a_lone_message_sooner():
+    async def main():
+        flushed, coalescer = _collect(window=1, max_wait=4, first_window=0.05)
+        coalescer.add("chat", "hi")
+        await asyncio.sleep(0.1)
+        assert flushed == [["hi"]]
+        await coalescer.close()
+
+    asyncio.run(main())
+
+
+def test_messages_sent_during_a_reply_are_answered_together_next():
+    flushed = []
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def flush(items):
+            flushed.append(items)
+            await gate.wait()
+
+        coalescer = MessageCoalescer(flush, window=0.05, max_wait=1)
+        coalescer.add("chat", "hi")
+        await asyncio.sleep(0.1)
+        coalescer.add("chat", "any thriller?")
+        coalescer.add("chat", "under 500?")
+        await asyncio.sleep(0.1)
+        assert len(flushed) == 1  # the follow-ups wait for the running reply
+        gate.set()
+        await coalescer.close()
+
+    asyncio.run(main())
+    assert flushed == [["hi"], ["any thriller?", "under 500?"]]
@@ -0,0 +1,90 @@
+from google.api_core import exceptions as api_exceptions
+
+from app.context_cache import ContextCache, model_min_tokens, model_supports_caching
+from app.snapshot import KnowledgeSnapshot
+
+
+class Backend:
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.creates = 0
+
+    def create(self, model_name, system_instruction, ttl, display_name):
+        self.creates += 1
+        if self.error is not None:
+            raise self.error
+        return object()
+
+    def model(self, handle):
+        return ("cached-model", handle)
+
+    def extend(self, handle, ttl):
+        pass
+
+    def delete(self, handle):
+        pass
+
+
+def _snapshot(tokens: int) -> KnowledgeSnapshot:
+    text = "x" * (4 * tokens)
+    return KnowledgeSnapshot(version=1, bot_name="", persona="", catalog_file="", catalog_text="", index=None,
+                             retrieval=False, system_instruction=text, content_hash=str(tokens), built_at=0.0)
+
+
+def _settle(cache: ContextCache):
+    cache._worker.submit(lambda: None).result(timeout=5)
+
+
+def test_only_pinned_1_5_models_can_cache():
+    assert not model_supports_caching("gemini-1.5-flash")
+    assert not model_supports_caching("models/gemini-1.5-flash-latest")
+    assert model_supports_caching("gemini-1.5-flash-002")
+    assert model_supports_caching("models/gemini-1.5-pro-001")
+    assert model_min_tokens("gemini-1.5-flash-002") == 32768
+
+
+def test_unpinned_model_never_tries_to_create():
+    backend = Backend()
+    cache = ContextCache("gemini-1.5-flash", backend=backend, min_tokens=0)
+    assert cache.model_for(_snapshot(50000)) is None
+    _settle(cache)
+    assert backend.creates == 0 and cache.stats()["disabled"]
+    cache.close()
+
+
+def test_instruction_below_the_model_minimum_is_sent_inline():
+    backend = Backend()
+    cache = ContextCache("gemini-1.5-flash-002", backend=backend)
+    assert cache.min_tokens == 32768
+    assert cache.model_for(_snapshot(20000)) is None
+    _settle(cache)
+    assert backend.creates == 0
+    cache.close()
+
+
+def test_refused_model_stops_retrying():
+    now = [0.0]
+    backend = Backend(api_exceptions.InvalidArgument("model does not support caching"))
+    cache = ContextCache("gemini-1.5-flash-002", backend=backend, clock=lambda: now[0])
+    cache.model_for(_snapshot(40000))
+    _settle(cache)
+    now[0] = 10 ** 6
+    assert cache.model_for(_snapshot(40000)) is None
+    _settle(cache)
+    assert backend.creates == 1 and cache.disabled
+    cache.close()
+
+
+def test_transient_failure_is_retried_later():
+    now = [0.0]
+    backend = Backend(api_exceptions.ResourceExhausted("quota"))
+    cache = ContextCache("gemini-1.5-flash-002", backend=backend, clock=lambda: now[0])
+    cache.model_for(_snapshot(40000))
+    _settle(cache)
+    backend.error = None
+    now[0] = 10 ** 6
+    cache.model_for(_snapshot(40000))
+    _settle(cache)
+    assert backend.creates == 2 and not cache.disabled
+    assert cache.model_for(_snapshot(40000))[0] == "cached-model"
+    cache.close()
@@ -0,0 +1,25 @@
+from app.history import SQLiteHistory
+
+
+def _history(tmp_path, **kwargs) -> SQLiteHistory:
+    return SQLiteHistory(str(tmp_path / "history.sqlite3"), flush_interval=0.01, **kwargs)
+
+
+def test_writer_keeps_only_the_newest_turns_per_user(tmp_path):
+    history = _history(tmp_path, keep_turns=4)
+    for i in range(10):
+        history.append(1, "user", f"a{i}")
+    history.append(2, "user", "b0")
+    assert history.load(1, limit=100) == [("user", f"a{i}") for i in range(6, 10)]
+    assert history.load(2, limit=100) == [("user", "b0")]
+    history.close()
+    assert history.pruned == 6
+
+
+def test_keep_turns_zero_keeps_everything(tmp_path):
+    history = _history(tmp_path, keep_turns=0)
+    for i in range(10):
+        history.append(1, "model", f"a{i}")
+    assert len(history.load(1, limit=100)) == 10
+    history.close()
+    assert history.pruned == 0
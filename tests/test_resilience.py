@@ -0,0 +1,197 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+from app.resilience import CircuitBreaker, GeminiGuard, GeminiUnavailable
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _open_breaker(failures: int = 2, cooldown: float = 10) -> "tuple[CircuitBreaker, Clock]":
+    clock = Clock()
+    breaker = CircuitBreaker(failures=failures, cooldown=cooldown, clock=clock)
+    for _ in range(failures):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker, clock
+
+
+def _raise(exc: BaseException):
+    def attempt():
+        raise exc
+    return attempt
+
+
+def _guard(breaker: CircuitBreaker, **kwargs) -> GeminiGuard:
+    kwargs.setdefault("retries", 0)
+    return GeminiGuard("test", timeout=kwargs.pop("timeout", 5), backoff=0, breaker=breaker, **kwargs)
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def test_opens_after_consecutive_failures():
+    breaker, _ = _open_breaker(failures=3)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.times_opened == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failures=2, cooldown=10, clock=Clock())
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_trial_through_and_success_closes():
+    breaker, clock = _open_breaker()
+    clock.now = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_for_another_cooldown():
+    breaker, clock = _open_breaker()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now = 19
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.allow()
+
+
+def test_abandoned_trial_reopens_instead_of_sticking():
+    breaker, clock = _open_breaker()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.abandon_trial()
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now = 20
+    assert breaker.allow()
+
+
+def test_non_transient_error_on_trial_closes_the_circuit(executor):
+    breaker, clock = _open_breaker()
+    clock.now = 10
+    guard = _guard(breaker)
+
+    async def main():
+        with pytest.raises(api_exceptions.InvalidArgument):
+            await guard.call(_raise(api_exceptions.InvalidArgument("bad request")), executor)
+        clock.now = 1000
+        return await guard.call(lambda: "ok", executor)
+
+    assert asyncio.run(main()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_blocked_reply_value_error_on_trial_closes_the_circuit(executor):
+    breaker, clock = _open_breaker()
+    clock.now = 10
+    guard = _guard(breaker)
+
+    async def main():
+        with pytest.raises(ValueError):
+            await guard.call(_raise(ValueError("response blocked")), executor)
+
+    asyncio.run(main())
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_transient_error_on_trial_reopens(executor):
+    breaker, clock = _open_breaker()
+    clock.now = 10
+    guard = _guard(breaker)
+
+    async def main():
+        with pytest.raises(api_exceptions.ServiceUnavailable):
+            await guard.call(_raise(api_exceptions.ServiceUnavailable("overloaded")), executor)
+        with pytest.raises(GeminiUnavailable):
+            await guard.call(lambda: "ok", executor)
+
+    asyncio.run(main())
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_cancelled_trial_does_not_leave_the_circuit_stuck(executor):
+    breaker, clock = _open_breaker()
+    clock.now = 10
+    guard = _guard(breaker)
+
+    async def main():
+        task = asyncio.ensure_future(guard.call(lambda: time.sleep(0.3), executor))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(GeminiUnavailable):
+            await guard.call(lambda: "ok", executor)
+        clock.now = 20
+        return await guard.call(lambda: "ok", executor)
+
+    assert asyncio.run(main()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_streamed_trial_does_not_leave_the_circuit_stuck(executor):
+    breaker, clock = _open_breaker()
+    clock.now = 10
+    guard = _guard(breaker)
+
+    async def consume():
+        async for _ in guard.stream(lambda emit: time.sleep(0.3), executor):
+            pass
+
+    async def main():
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        clock.now = 20
+        chunks = []
+        call = guard.stream(lambda emit: (emit("a"), emit("b"), "done")[-1], executor)
+        async for text in call:
+            chunks.append(text)
+        return chunks, call.result
+
+    assert asyncio.run(main()) == (["a", "b"], "done")
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retries_transient_errors_then_succeeds(executor):
+    breaker = CircuitBreaker(failures=5, cooldown=10, clock=Clock())
+    guard = _guard(breaker, retries=2)
+    outcomes = iter([api_exceptions.ServiceUnavailable("x"), TimeoutError(), "ok"])
+
+    def attempt():
+        outcome = next(outcomes)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    assert asyncio.run(guard.call(attempt, executor)) == "ok"
+    assert guard.retried == 2
+    assert breaker.state == CircuitBreaker.CLOSED
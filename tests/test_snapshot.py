@@ -0,0 +1,29 @@
+import json
+import asyncio
+import threading
+
+from app.snapshot import SnapshotManager
+from app.store import AdminStore
+
+
+def _write(path, persona: str):
+    path.write_text(json.dumps({"catalog_file": "product_data/jatri_books_info.md", "ai_persona": persona}),
+                    encoding="utf-8")
+
+
+def test_rebuild_reads_the_store_on_the_loop(tmp_path):
+    path = tmp_path / "admin_store.json"
+    _write(path, "You are Mira.")
+    store = AdminStore(path)
+    manager = SnapshotManager(store, poll_interval=0)
+    notified = []
+    store.subscribe(lambda doc: notified.append((doc["ai_persona"], threading.get_ident())))
+
+    async def main():
+        _write(path, "You are Mira, briefly.")
+        assert await manager.refresh(force=True)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    assert manager.current().persona == "You are Mira, briefly."
+    assert notified == [("You are Mira, briefly.", loop_thread)]